@@ -29,6 +29,10 @@ from concurrent.futures import ThreadPoolExecutor
 import sys
 import datetime
 import time
+import stat
+import errno
+import ctypes
+import filecmp
 from contextlib import contextmanager
 
 try:
@@ -51,6 +55,7 @@ def debug_log(message: str):
 
 # Import shared utilities
 from .utils.index import log_message
+from .utils.module_registry import get_module_registry, import_module_if_changed
 
 # Re-export utilities for easy access by submodules
 __all__ = [
@@ -61,10 +66,13 @@ __all__ = [
     'compare_schema_versions',
     'sync_from_repo',
     'repo_sync_lock',
+    'get_mirror_path',
     'detect_module_updates',
+    'get_repo_module_trees',
     'update_modules',
     'get_branch_from_index',
-    'make_shell_scripts_executable'
+    'make_shell_scripts_executable',
+    'rollback_module_update'
 ]
 
 def load_module_index(module_path: str) -> Optional[Dict[str, Any]]:
@@ -146,7 +154,7 @@ def compare_schema_versions(version1: str, version2: str) -> int:
 @contextmanager
 def repo_sync_lock(local_path: str):
     """
-    Exclusive lock for the temp clone path until module copy completes.
+    Exclusive lock for the sync worktree (and its mirror) until module copy completes.
 
     sync_from_repo() alone used to release the lock immediately after git clone.
     A second concurrent updater could then rm -rf the same path before
@@ -161,7 +169,7 @@ def repo_sync_lock(local_path: str):
     try:
         fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o600)
         fcntl.flock(fd, fcntl.LOCK_EX)
-        log_message(f"[SYNC] Acquired exclusive lock {lock_path} (clone + module copy)")
+        log_message(f"[SYNC] Acquired exclusive lock {lock_path} (sync + module copy)")
         yield
     finally:
         if fd is not None:
@@ -172,10 +180,23 @@ def repo_sync_lock(local_path: str):
                 pass
 
 
+def get_mirror_path(local_path: str) -> str:
+    """Path of the persistent bare mirror backing the sync worktree at local_path."""
+    return f"{local_path}.mirror.git"
+
+
 def sync_from_repo(repo_url: str, local_path: str, branch: str = "main") -> bool:
     """
     Sync updates from a Git repository.
     
+    local_path is a git worktree of a persistent, blob-filtered bare mirror
+    (see get_mirror_path). Each sync does a shallow fetch of the branch into the
+    mirror and checks the fetched commit out in the worktree, so an unchanged
+    repository costs one small fetch and only changed blobs are transferred.
+    If the incremental path fails (corrupt mirror, broken worktree, rewritten
+    history) both are discarded and rebuilt from a fresh clone once.
+    Call under repo_sync_lock(local_path).
+    
     Args:
         repo_url: URL of the Git repository
         local_path: Local path to sync to
@@ -184,14 +205,47 @@ def sync_from_repo(repo_url: str, local_path: str, branch: str = "main") -> bool
     Returns:
         bool: True if sync successful, False otherwise
     """
-    def _unlink_stale_git_config_lock(path: str) -> None:
-        lock_file = os.path.join(path, ".git", "config.lock")
-        if os.path.isfile(lock_file):
-            try:
-                os.unlink(lock_file)
-                log_message(f"[SYNC] Removed stale git lock {lock_file}")
-            except OSError as e:
-                log_message(f"[SYNC] Could not remove stale lock {lock_file}: {e}", "WARNING")
+    mirror_path = get_mirror_path(local_path)
+    env = os.environ.copy()
+    env["GIT_TERMINAL_PROMPT"] = "0"
+
+    def _git(*args: str) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            ["git", *args],
+            capture_output=True,
+            text=True,
+            stdin=subprocess.DEVNULL,
+            env=env,
+            timeout=600,
+        )
+
+    def _check(result: subprocess.CompletedProcess, what: str) -> subprocess.CompletedProcess:
+        if result.returncode != 0:
+            err = ((result.stderr or "") + (result.stdout or "")).strip()
+            raise RuntimeError(f"{what} failed: {err}")
+        return result
+
+    def _unlink_stale_git_locks() -> None:
+        """
+        Remove *.lock files left behind by a killed git process. Safe because
+        repo_sync_lock serializes every updater touching this mirror.
+        """
+        lock_dirs = [mirror_path, os.path.join(local_path, ".git")]
+        worktrees_dir = os.path.join(mirror_path, "worktrees")
+        if os.path.isdir(worktrees_dir):
+            lock_dirs.extend(os.path.join(worktrees_dir, d) for d in os.listdir(worktrees_dir))
+        for lock_dir in lock_dirs:
+            if not os.path.isdir(lock_dir):
+                continue
+            for name in os.listdir(lock_dir):
+                if not name.endswith(".lock"):
+                    continue
+                lock_file = os.path.join(lock_dir, name)
+                try:
+                    os.unlink(lock_file)
+                    log_message(f"[SYNC] Removed stale git lock {lock_file}")
+                except OSError as e:
+                    log_message(f"[SYNC] Could not remove stale lock {lock_file}: {e}", "WARNING")
 
     def _safe_rmtree(path: str) -> None:
         """
@@ -213,7 +267,6 @@ def sync_from_repo(repo_url: str, local_path: str, branch: str = "main") -> bool
         """If Python rmtree leaves debris (permissions, races), use rm -rf once."""
         if not os.path.exists(path):
             return
-        _unlink_stale_git_config_lock(path)
         try:
             result = subprocess.run(
                 ["/bin/rm", "-rf", path],
@@ -232,52 +285,90 @@ def sync_from_repo(repo_url: str, local_path: str, branch: str = "main") -> bool
         except Exception as e:
             log_message(f"[SYNC] Force remove failed: {e}", "WARNING")
 
-    def _prepare_empty_clone_target() -> None:
-        """Ensure local_path does not exist before git clone (avoids config.lock races)."""
-        if not os.path.exists(local_path):
+    def _remove_path(path: str) -> None:
+        if not os.path.lexists(path):
             return
-        log_message(f"Removing existing repository at {local_path}")
-        _unlink_stale_git_config_lock(local_path)
+        log_message(f"Removing {path}")
         try:
-            _safe_rmtree(local_path)
+            if os.path.isdir(path) and not os.path.islink(path):
+                _safe_rmtree(path)
+            else:
+                os.unlink(path)
         except FileNotFoundError:
-            log_message(f"[SYNC] Repository path vanished during cleanup: {local_path}")
-        if os.path.exists(local_path):
-            log_message(
-                f"[SYNC] Path still present after rmtree; forcing removal: {local_path}",
-                "WARNING",
+            log_message(f"[SYNC] Path vanished during cleanup: {path}")
+        except OSError as e:
+            log_message(f"[SYNC] Cleanup of {path} failed: {e}", "WARNING")
+        if os.path.lexists(path):
+            log_message(f"[SYNC] Path still present after rmtree; forcing removal: {path}", "WARNING")
+            _force_remove_repo_path(path)
+
+    def _ensure_mirror() -> bool:
+        """Make sure a usable bare mirror exists. Returns True if it was freshly cloned."""
+        if os.path.isdir(mirror_path):
+            probe = _git("--git-dir", mirror_path, "rev-parse", "--is-bare-repository")
+            if probe.returncode == 0 and probe.stdout.strip() == "true":
+                _check(_git("--git-dir", mirror_path, "remote", "set-url", "origin", repo_url), "git remote set-url")
+                return False
+            log_message(f"[SYNC] Mirror at {mirror_path} is not a valid bare repository; recreating", "WARNING")
+            _remove_path(mirror_path)
+        log_message(f"[SYNC] Creating mirror of {repo_url} (branch: {branch}) at {mirror_path}")
+        _check(
+            _git("clone", "--bare", "--depth", "1", "--filter=blob:none", "-b", branch, repo_url, mirror_path),
+            "git clone --bare",
+        )
+        return True
+
+    def _fetch() -> None:
+        log_message(f"[SYNC] Fetching {repo_url} (branch: {branch}) into {mirror_path}")
+        _check(
+            _git(
+                "--git-dir", mirror_path, "fetch", "--depth", "1", "--filter=blob:none", "origin",
+                f"+refs/heads/{branch}:refs/heads/{branch}",
+            ),
+            "git fetch",
+        )
+
+    def _checkout(rebuild_worktree: bool) -> str:
+        """Point the worktree at the mirror's branch tip. Returns the checked-out commit."""
+        commit = _check(
+            _git("--git-dir", mirror_path, "rev-parse", "--verify", f"refs/heads/{branch}^{{commit}}"),
+            "git rev-parse",
+        ).stdout.strip()
+        if rebuild_worktree or not os.path.isfile(os.path.join(local_path, ".git")):
+            # New mirror, missing path, legacy full clone, or debris: rebuild as a worktree
+            _remove_path(local_path)
+            _git("--git-dir", mirror_path, "worktree", "prune")
+            _check(
+                _git("--git-dir", mirror_path, "worktree", "add", "--force", "--detach", local_path, commit),
+                "git worktree add",
             )
-            _force_remove_repo_path(local_path)
+        else:
+            # Detached so fetch may always update refs/heads/<branch>; only changed files are rewritten
+            _check(_git("-C", local_path, "checkout", "--force", "--detach", commit), "git checkout")
+            _check(_git("-C", local_path, "clean", "-ffdx"), "git clean")
+        head = _check(_git("-C", local_path, "rev-parse", "HEAD"), "git rev-parse HEAD").stdout.strip()
+        if head != commit:
+            raise RuntimeError(f"worktree HEAD {head} does not match {branch} tip {commit}")
+        return commit
 
     try:
-        env = os.environ.copy()
-        env["GIT_TERMINAL_PROMPT"] = "0"
-        clone_cmd = ["git", "clone", "-b", branch, repo_url, local_path]
-
         for attempt in range(2):
-            _prepare_empty_clone_target()
             if attempt > 0:
+                log_message("[SYNC] Rebuilding mirror and worktree from scratch", "WARNING")
+                _remove_path(local_path)
+                _remove_path(mirror_path)
                 time.sleep(0.5)
-            log_message(
-                f"[SYNC] Cloning repository {repo_url} (branch: {branch}) to {local_path}"
-                + ("" if attempt == 0 else " (retry after cleanup)")
-            )
-            result = subprocess.run(
-                clone_cmd,
-                capture_output=True,
-                text=True,
-                stdin=subprocess.DEVNULL,
-                env=env,
-            )
-            if result.returncode == 0:
-                log_message("[SYNC] Git clone completed successfully")
+            try:
+                _unlink_stale_git_locks()
+                fresh_mirror = _ensure_mirror()
+                if not fresh_mirror:
+                    _fetch()
+                commit = _checkout(rebuild_worktree=fresh_mirror)
+                log_message(f"[SYNC] {local_path} at {branch} {commit[:12]}")
                 return True
-
-            err = (result.stderr or "") + (result.stdout or "")
-            log_message(f"Git clone failed (attempt {attempt + 1}): {err}", "ERROR")
-            if attempt == 1:
-                return False
-            log_message("[SYNC] Retrying once after full cleanup", "WARNING")
+            except (RuntimeError, OSError, subprocess.TimeoutExpired) as e:
+                log_message(f"Git sync failed (attempt {attempt + 1}): {e}", "ERROR")
+        return False
 
     except Exception as e:
         log_message(f"Sync failed: {e}", "ERROR")
@@ -327,10 +418,82 @@ def make_shell_scripts_executable(directory_path: str) -> None:
                 except Exception as e:
                     log_message(f"Failed to make executable {file_path}: {e}", "WARNING")
 
+MODULE_TREE_INDEX = ".module_trees.json"
+
+
+def get_repo_module_trees(repo_search_path: str) -> Dict[str, str]:
+    """
+    Read the git tree id of every module directory in the synced repository.
+    
+    One `git ls-tree` call covers all modules. Tree ids come from the checked-out
+    commit, which matches the files on disk because sync_from_repo() leaves a clean
+    worktree.
+    
+    Args:
+        repo_search_path: Repository directory containing the module directories
+        
+    Returns:
+        Dict[str, str]: module name -> tree id, or {} if the path is not a git checkout
+    """
+    try:
+        result = subprocess.run(
+            ["git", "-C", repo_search_path, "ls-tree", "HEAD", "./"],
+            capture_output=True,
+            text=True,
+            stdin=subprocess.DEVNULL,
+            timeout=30,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        debug_log(f"  ⚠️ Could not read module tree ids: {e}")
+        return {}
+    if result.returncode != 0:
+        debug_log(f"  ⚠️ Could not read module tree ids: {result.stderr.strip()}")
+        return {}
+    trees = {}
+    for line in result.stdout.splitlines():
+        meta, _, path = line.partition("\t")
+        parts = meta.split()
+        if len(parts) == 3 and parts[1] == "tree":
+            trees[os.path.basename(path.rstrip("/"))] = parts[2]
+    return trees
+
+
+def load_module_tree_index(local_modules_path: str) -> Dict[str, str]:
+    """Load the recorded repository tree id of each installed module ({} if none)."""
+    index_file = os.path.join(local_modules_path, MODULE_TREE_INDEX)
+    try:
+        with open(index_file, "r") as f:
+            data = json.load(f)
+        return {k: v for k, v in data.items() if isinstance(v, str)} if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        log_message(f"Ignoring unreadable module tree index {index_file}: {e}", "WARNING")
+        return {}
+
+
+def save_module_tree_index(local_modules_path: str, trees: Dict[str, str]) -> None:
+    """Persist the installed-module tree ids written by detect/update."""
+    index_file = os.path.join(local_modules_path, MODULE_TREE_INDEX)
+    tmp_file = f"{index_file}.tmp"
+    try:
+        with open(tmp_file, "w") as f:
+            json.dump(trees, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, index_file)
+    except Exception as e:
+        log_message(f"Failed to save module tree index {index_file}: {e}", "WARNING")
+
+
 def detect_module_updates(local_modules_path: str, repo_modules_path: str) -> List[str]:
     """
     Detect which modules need updates by comparing schema versions and content versions.
     
+    Git tree ids of the repository's module directories act as a skip index: a module
+    whose tree id equals the one recorded when it was installed is unchanged and is
+    skipped without parsing any index.json. Everything else goes through the
+    schema_version comparison, which stays the only thing that triggers an update.
+    A changed tree with an unchanged schema_version is reported as a missing bump.
+    
     Args:
         local_modules_path: Path to local modules directory
         repo_modules_path: Path to repository modules directory
@@ -365,58 +528,60 @@ def detect_module_updates(local_modules_path: str, repo_modules_path: str) -> Li
         return modules_to_update
     
     # Check each module in the repository
-    repo_modules = os.listdir(repo_search_path)
+    repo_registry = get_module_registry(repo_search_path)
+    local_registry = get_module_registry(local_search_path)
+    repo_modules = repo_registry.names()
     debug_log(f"📦 Found {len(repo_modules)} modules in repository: {', '.join(repo_modules)}")
     
+    repo_trees = get_repo_module_trees(repo_search_path)
+    installed_trees = load_module_tree_index(local_modules_path)
+    installed_trees_changed = False
+    unchanged_count = 0
+    
     for module_name in repo_modules:
         repo_module_path = os.path.join(repo_search_path, module_name)
         local_module_path = os.path.join(local_search_path, module_name)
         
+        repo_tree = repo_trees.get(module_name)
+        if repo_tree and installed_trees.get(module_name) == repo_tree and os.path.isdir(local_module_path):
+            unchanged_count += 1
+            continue
+        
         debug_log(f"🔍 Checking module: {module_name}")
         debug_log(f"  Repository path: {repo_module_path}")
         debug_log(f"  Local path: {local_module_path}")
         
-        if not os.path.isdir(repo_module_path):
-            debug_log(f"  ⏭️ Skipping {module_name} - not a directory")
-            continue
-        
-        # Load repository module index
-        debug_log(f"  📖 Loading repository index.json...")
-        repo_index = load_module_index(repo_module_path)
-        if not repo_index:
+        # Load repository module record
+        repo_record = repo_registry.get(module_name)
+        if not repo_record:
             log_message(f"  ❌ No valid index.json found for repo module: {module_name}", "WARNING")
             continue
         
-        repo_schema_version = repo_index.get("metadata", {}).get("schema_version", "unknown")
-        debug_log(f"  📋 Repository schema version: {repo_schema_version}")
+        debug_log(f"  📋 Repository schema version: {repo_record.schema_version}")
         
-        # Load local module index (if exists)
-        local_index = None
-        if os.path.exists(local_module_path):
-            debug_log(f"  📖 Loading local index.json...")
-            local_index = load_module_index(local_module_path)
-            if local_index:
-                local_schema_version = local_index.get("metadata", {}).get("schema_version", "unknown")
-                debug_log(f"  📋 Local schema version: {local_schema_version}")
-            else:
-                debug_log(f"  ⚠️ Failed to load local index.json")
+        # Load local module record (if exists)
+        local_record = local_registry.get(module_name)
+        if local_record:
+            debug_log(f"  📋 Local schema version: {local_record.schema_version}")
+        elif os.path.exists(local_module_path):
+            debug_log(f"  ⚠️ Failed to load local index.json")
         else:
             debug_log(f"  📁 Local module directory does not exist")
         
         # Check if local module is disabled - skip entirely if so
-        if local_index and not local_index.get("metadata", {}).get("enabled", True):
+        if local_record and not local_record.enabled:
             debug_log(f"  ⏭️ Module {module_name} is disabled, skipping update check")
             continue
         
         # Simple schema version comparison - no special cases, no module self-evaluation
-        repo_schema_version = repo_index.get("metadata", {}).get("schema_version")
+        repo_schema_version = repo_record.schema_version
         if not repo_schema_version:
             log_message(f"  ❌ No schema_version found in repo module: {module_name}", "WARNING")
             continue
         
         local_schema_version = "0.0.0"  # Default for new modules
-        if local_index:
-            local_schema_version = local_index.get("metadata", {}).get("schema_version", "0.0.0")
+        if local_record:
+            local_schema_version = local_record.schema_version or "0.0.0"
         
         debug_log(f"  📊 Schema version comparison: {local_schema_version} vs {repo_schema_version}")
         comparison = compare_schema_versions(repo_schema_version, local_schema_version)
@@ -428,9 +593,24 @@ def detect_module_updates(local_modules_path: str, repo_modules_path: str) -> Li
             modules_to_update.append(module_name)
         else:
             debug_log(f"  ✅ Module {module_name} is up to date: {local_schema_version}")
+            if repo_tree and local_record and comparison == 0:
+                if module_name not in installed_trees:
+                    # First sighting: same schema_version means same content, as before tree ids existed
+                    installed_trees[module_name] = repo_tree
+                    installed_trees_changed = True
+                else:
+                    log_message(
+                        f"  ⚠️ Module {module_name} changed in repository without a schema_version bump "
+                        f"({local_schema_version}); not updating",
+                        "WARNING",
+                    )
         
         debug_log(f"  {'='*50}")
     
+    if installed_trees_changed:
+        save_module_tree_index(local_modules_path, installed_trees)
+    if repo_trees:
+        debug_log(f"⚡ Skipped {unchanged_count} unchanged modules by tree id")
     debug_log(f"🎯 Module detection complete. Found {len(modules_to_update)} modules needing updates: {modules_to_update}")
     return modules_to_update
 
@@ -517,10 +697,118 @@ def _preserve_migrations_has_run_state(backup_module_path: str, local_module_pat
         log_message(f"Could not preserve migrations has_run state: {e}", "WARNING")
 
 
+_EXEC_BITS = stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH
+# ioctl(dest_fd, FICLONE, src_fd): copy-on-write clone of a file's data (linux/fs.h)
+_FICLONE = 0x40049409
+_NO_REFLINK_ERRNOS = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS}
+_AT_FDCWD = -100
+_RENAME_EXCHANGE = 2
+
+
+def _exchange_paths(path_a: str, path_b: str) -> bool:
+    """
+    Atomically swap two paths with renameat2(RENAME_EXCHANGE).
+    
+    Returns:
+        bool: True if swapped, False if the kernel, libc or filesystem cannot exchange
+    """
+    try:
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return False
+    renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    renameat2.restype = ctypes.c_int
+    if renameat2(_AT_FDCWD, os.fsencode(path_a), _AT_FDCWD, os.fsencode(path_b), _RENAME_EXCHANGE) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+        return False
+    raise OSError(err, os.strerror(err), path_a)
+
+
+def _stage_module_tree(repo_module_path: str, live_module_path: Optional[str], staging_path: str) -> Dict[str, int]:
+    """
+    Build the new module tree in staging_path.
+    
+    Every staged file gets its own inode: the live tree becomes <name>.backup after
+    the swap, and a module rewriting one of its files in place must not change the
+    rollback copy. Files identical to the live module are reflinked (FICLONE,
+    copy-on-write) from it where the filesystem supports that, and copied otherwise.
+    Shell scripts get their exec bits while being staged.
+    
+    Returns:
+        Dict[str, int]: counts of "linked" (reflinked) and "copied" files
+    """
+    stats = {"linked": 0, "copied": 0}
+    reflink = {"supported": fcntl is not None}
+
+    def _reflink(src: str, dst: str) -> bool:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                return True
+            except OSError as e:
+                if e.errno not in _NO_REFLINK_ERRNOS:
+                    raise
+                reflink["supported"] = False
+                return False
+
+    def _stage_file(src: str, dst: str) -> str:
+        wanted_mode = stat.S_IMODE(os.stat(src).st_mode)
+        if dst.endswith('.sh'):
+            wanted_mode |= _EXEC_BITS
+        if live_module_path and reflink["supported"]:
+            live_file = os.path.join(live_module_path, os.path.relpath(dst, staging_path))
+            try:
+                live_stat = os.lstat(live_file)
+                if (stat.S_ISREG(live_stat.st_mode)
+                        and filecmp.cmp(src, live_file, shallow=False)
+                        and _reflink(live_file, dst)):
+                    shutil.copystat(src, dst)
+                    if stat.S_IMODE(os.stat(dst).st_mode) != wanted_mode:
+                        os.chmod(dst, wanted_mode)
+                    stats["linked"] += 1
+                    return dst
+            except OSError:
+                pass
+        shutil.copy2(src, dst)
+        if stat.S_IMODE(os.stat(dst).st_mode) != wanted_mode:
+            os.chmod(dst, wanted_mode)
+        stats["copied"] += 1
+        return dst
+
+    shutil.copytree(repo_module_path, staging_path, copy_function=_stage_file)
+    return stats
+
+
+def _swap_in_staged_module(staging_path: str, local_module_path: str, backup_path: str) -> None:
+    """
+    Replace local_module_path with staging_path and keep the previous tree at backup_path.
+    
+    With renameat2(RENAME_EXCHANGE) the live path always exists; otherwise two
+    renames leave only a rename-sized window instead of a copy-sized one.
+    """
+    if os.path.exists(backup_path):
+        shutil.rmtree(backup_path)
+    if not os.path.exists(local_module_path):
+        os.rename(staging_path, local_module_path)
+        return
+    if _exchange_paths(staging_path, local_module_path):
+        # staging_path now holds the previous tree
+        os.rename(staging_path, backup_path)
+    else:
+        os.rename(local_module_path, backup_path)
+        os.rename(staging_path, local_module_path)
+
+
 def update_modules(modules_to_update: List[str], local_modules_path: str, repo_modules_path: str) -> Dict[str, bool]:
     """
     Update specified modules by clobbering local versions with repo versions.
     
+    Each module is staged next to the live one (<name>.staging), carrying over the
+    local repository config and migration state, then swapped in atomically. The
+    previous tree is kept at <name>.backup for rollback_module_update().
+    
     Args:
         modules_to_update: List of module names to update
         local_modules_path: Path to local modules directory
@@ -540,47 +828,97 @@ def update_modules(modules_to_update: List[str], local_modules_path: str, repo_m
     if os.path.exists(os.path.join(local_modules_path, "modules")):
         local_search_path = os.path.join(local_modules_path, "modules")
     
+    repo_trees = get_repo_module_trees(repo_search_path)
+    installed_trees = load_module_tree_index(local_modules_path)
+    
     for module_name in modules_to_update:
+        repo_module_path = os.path.join(repo_search_path, module_name)
+        local_module_path = os.path.join(local_search_path, module_name)
+        backup_path = f"{local_module_path}.backup"
+        staging_path = f"{local_module_path}.staging"
         try:
-            repo_module_path = os.path.join(repo_search_path, module_name)
-            local_module_path = os.path.join(local_search_path, module_name)
-            backup_path = f"{local_module_path}.backup"
-            # Create backup if local module exists
-            if os.path.exists(local_module_path):
-                if os.path.exists(backup_path):
-                    shutil.rmtree(backup_path)
-                shutil.move(local_module_path, backup_path)
-                log_message(f"Backed up {module_name} to {backup_path}")
+            if os.path.exists(staging_path):
+                shutil.rmtree(staging_path)
+            live_exists = os.path.exists(local_module_path)
             
-            # Copy repo module to local
-            shutil.copytree(repo_module_path, local_module_path)
-            log_message(f"Updated module {module_name}")
+            # Stage repo module next to the live one
+            stats = _stage_module_tree(repo_module_path, local_module_path if live_exists else None, staging_path)
+            log_message(f"Staged module {module_name} ({stats['copied']} copied, {stats['linked']} unchanged/reflinked)")
             # Restore local repository dict (url, branch, default_branch) so schema update never clobbers it
-            if os.path.exists(backup_path):
-                _preserve_local_repository_config(backup_path, local_module_path, module_name)
-                _preserve_migrations_has_run_state(backup_path, local_module_path, module_name)
-            # Ensure all shell scripts in the module are executable
-            make_shell_scripts_executable(local_module_path)
+            if live_exists:
+                _preserve_local_repository_config(local_module_path, staging_path, module_name)
+                _preserve_migrations_has_run_state(local_module_path, staging_path, module_name)
+            
+            _swap_in_staged_module(staging_path, local_module_path, backup_path)
+            if live_exists:
+                log_message(f"Backed up {module_name} to {backup_path}")
+            log_message(f"Updated module {module_name}")
             # Schema update successful - module will be executed later in the process
             results[module_name] = True
+            if module_name in repo_trees:
+                installed_trees[module_name] = repo_trees[module_name]
             
         except Exception as e:
             log_message(f"Failed to update module {module_name}: {e}", "ERROR")
             results[module_name] = False
             
-            # Restore backup if update failed
-            backup_path = f"{local_module_path}.backup"
-            if os.path.exists(backup_path):
-                if os.path.exists(local_module_path):
-                    shutil.rmtree(local_module_path)
+            # Only the non-atomic fallback swap can leave the live path missing
+            if not os.path.exists(local_module_path) and os.path.exists(backup_path):
                 shutil.move(backup_path, local_module_path)
                 log_message(f"Restored backup for {module_name}")
-                
-                # Ensure shell scripts in restored module are executable
-                make_shell_scripts_executable(local_module_path)
+            if os.path.exists(staging_path):
+                shutil.rmtree(staging_path, ignore_errors=True)
+    
+    if any(results.values()):
+        save_module_tree_index(local_modules_path, installed_trees)
     
     return results
 
+
+def rollback_module_update(module_name: str, local_modules_path: str) -> bool:
+    """
+    Swap a module back to the tree kept at <name>.backup by the last update_modules().
+    
+    The exchange is atomic where supported, so the rolled-back-from tree simply
+    becomes the new backup.
+    
+    Args:
+        module_name: Name of the module to roll back
+        local_modules_path: Path to local modules directory
+        
+    Returns:
+        bool: True if the previous tree is live again, False otherwise
+    """
+    local_search_path = local_modules_path
+    if os.path.exists(os.path.join(local_modules_path, "modules")):
+        local_search_path = os.path.join(local_modules_path, "modules")
+    local_module_path = os.path.join(local_search_path, module_name)
+    backup_path = f"{local_module_path}.backup"
+    
+    if not os.path.isdir(backup_path):
+        log_message(f"No previous tree to roll back to for {module_name}", "ERROR")
+        return False
+    try:
+        if not os.path.exists(local_module_path):
+            os.rename(backup_path, local_module_path)
+        elif not _exchange_paths(backup_path, local_module_path):
+            staging_path = f"{local_module_path}.staging"
+            if os.path.exists(staging_path):
+                shutil.rmtree(staging_path)
+            os.rename(local_module_path, staging_path)
+            os.rename(backup_path, local_module_path)
+            os.rename(staging_path, backup_path)
+        
+        # The installed tree no longer matches the recorded repository tree
+        installed_trees = load_module_tree_index(local_modules_path)
+        if installed_trees.pop(module_name, None) is not None:
+            save_module_tree_index(local_modules_path, installed_trees)
+        log_message(f"Rolled back module {module_name} to its previous tree")
+        return True
+    except Exception as e:
+        log_message(f"Failed to roll back module {module_name}: {e}", "ERROR")
+        return False
+
 def run_update(module_path, args=None, callback=None):
     """
     Run a single update module.
@@ -600,8 +938,8 @@ def run_update(module_path, args=None, callback=None):
             # Simple module name - look in modules subdirectory
             module_path = f"modules.{module_path}"
         
-        # Use relative import from current package
-        mod = importlib.import_module(f".{module_path}", package=__name__)
+        # Reuse the loaded module unless its files changed (matters for --daemon)
+        mod = import_module_if_changed(f"{__name__}.{module_path}")
         if hasattr(mod, 'main'):
             log_message(f"Running update: {module_path}")
             result = mod.main(args)
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Orchestrator Benchmark Harness
+
+Generates a synthetic installed modules tree and a synthetic git "repo" tree of
+N modules, then times the orchestrator's hot paths against them:
+
+- get_enabled_modules (cold and warm module registry)
+- resolve_group_winners (with a stub systemctl on PATH)
+- detect_module_updates (cold and warm tree index)
+- update_modules
+- run_enabled_modules
+- StateManager.backup_module_state / restore_module_state
+
+Results are written as JSON so runs from different releases can be compared.
+
+Usage (from the directory containing the updates package):
+    python -m updates.benchmarks.orchestrator_bench --sizes 10 100 1000 --output bench.json
+    python -m updates.benchmarks.orchestrator_bench --compare old.json --output new.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import statistics
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from updates import detect_module_updates, update_modules
+from updates import index as orchestrator
+from updates.utils import StateManager, get_service_state_cache
+from updates.utils import module_registry
+
+BASE_SCHEMA_VERSION = "1.0.0"
+BUMPED_SCHEMA_VERSION = "1.0.1"
+
+# Answers `systemctl show -p ... -- unit...` with one "active" block per unit, and succeeds for anything else
+STUB_SYSTEMCTL = """#!/bin/sh
+if [ "$1" = "show" ]; then
+    shift 4
+    first=1
+    for unit in "$@"; do
+        [ "$first" = 1 ] || echo
+        first=0
+        printf 'ActiveState=active\\nSubState=running\\nUnitFileState=enabled\\n'
+    done
+fi
+exit 0
+"""
+
+
+def _module_name(i: int) -> str:
+    return f"bench{i:04d}"
+
+
+def write_module(module_dir: str, i: int, schema_version: str, module_files: int,
+                 file_size: int, sleep: float, group_pairs: int) -> None:
+    """Write one synthetic module: index.json, a main() and module_files payload files."""
+    name = _module_name(i)
+    os.makedirs(module_dir, exist_ok=True)
+    metadata = {
+        "schema_version": schema_version,
+        "name": name,
+        "description": f"Synthetic benchmark module {i}",
+        "enabled": True,
+        "priority": i % 50,
+    }
+    if i < group_pairs * 2:
+        metadata.update({
+            "group": f"group{i // 2}",
+            "group_order": i % 2,
+            "service_name": f"bench-{name}",
+        })
+    with open(os.path.join(module_dir, "index.json"), "w") as f:
+        json.dump({"metadata": metadata, "config": {}}, f, indent=4)
+    with open(os.path.join(module_dir, "__init__.py"), "w") as f:
+        f.write(
+            "import time\n\n"
+            "def main(args=None):\n"
+            f"    time.sleep({sleep!r})\n"
+            f"    print('{name} ran')\n"
+            "    return {'success': True, 'updated': False}\n"
+        )
+    payload = (f"{name} {schema_version}\n" * (file_size // 16 + 1))[:file_size]
+    for n in range(module_files):
+        with open(os.path.join(module_dir, f"data{n:03d}.txt"), "w") as f:
+            f.write(payload)
+
+
+def build_trees(work_dir: str, modules: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Create <work_dir>/local (installed modules) and <work_dir>/repo (a git repo with
+    the same modules, a bump_fraction of them at a newer schema_version).
+    """
+    local_root = os.path.join(work_dir, "local")
+    repo_root = os.path.join(work_dir, "repo")
+    bumped = set(range(0, modules, max(1, round(1 / args.bump_fraction)))) if args.bump_fraction > 0 else set()
+
+    for root in (local_root, repo_root):
+        os.makedirs(os.path.join(root, "modules"), exist_ok=True)
+        open(os.path.join(root, "modules", "__init__.py"), "w").close()
+    with open(os.path.join(local_root, "index.json"), "w") as f:
+        json.dump({"metadata": {"max_parallel_modules": args.workers}, "packages": {}}, f, indent=4)
+
+    for i in range(modules):
+        name = _module_name(i)
+        write_module(os.path.join(local_root, "modules", name), i, BASE_SCHEMA_VERSION,
+                     args.module_files, args.file_size, args.module_sleep, args.group_pairs)
+        repo_version = BUMPED_SCHEMA_VERSION if i in bumped else BASE_SCHEMA_VERSION
+        write_module(os.path.join(repo_root, "modules", name), i, repo_version,
+                     args.module_files, args.file_size, args.module_sleep, args.group_pairs)
+
+    git = ["git", "-C", repo_root, "-c", "user.name=bench", "-c", "user.email=bench@localhost"]
+    subprocess.run(git[:3] + ["init", "-q"], check=True)
+    subprocess.run(git + ["add", "-A"], check=True)
+    subprocess.run(git + ["commit", "-q", "-m", "synthetic modules"], check=True)
+
+    pristine_local = os.path.join(work_dir, "local.pristine")
+    shutil.copytree(local_root, pristine_local, symlinks=True)
+    return {"local": local_root, "repo": repo_root, "pristine_local": pristine_local, "bumped": len(bumped)}
+
+
+def build_state_tree(work_dir: str, files: int, file_size: int) -> str:
+    """Directory of files for StateManager backup/restore, spread over subdirectories of 100."""
+    data_dir = os.path.join(work_dir, "state_data")
+    payload = b"x" * file_size
+    for n in range(files):
+        sub = os.path.join(data_dir, f"d{n // 100:03d}")
+        os.makedirs(sub, exist_ok=True)
+        with open(os.path.join(sub, f"f{n:05d}.dat"), "wb") as f:
+            f.write(payload)
+    return data_dir
+
+
+@contextlib.contextmanager
+def quiet(enabled: bool = True):
+    """Silence stdout (log_message prints there) while a benchmark runs."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def measure(fn: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None,
+            silence: bool = True) -> Dict[str, Any]:
+    """Run setup() (untimed) then fn() (timed) repeat times."""
+    runs = []
+    for _ in range(repeat):
+        with quiet(silence):
+            if setup:
+                setup()
+            start = time.perf_counter()
+            fn()
+            runs.append(time.perf_counter() - start)
+    return {
+        "min_s": min(runs),
+        "median_s": statistics.median(runs),
+        "max_s": max(runs),
+        "runs_s": runs,
+    }
+
+
+def _purge_imported_modules() -> None:
+    """Forget previously imported synthetic modules so each run imports the current tree."""
+    for name in [m for m in sys.modules if m == "modules" or m.startswith("modules.")]:
+        del sys.modules[name]
+
+
+def run_size(modules: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Build trees for one module count and run every benchmark against them."""
+    work_dir = tempfile.mkdtemp(prefix=f"hs-bench-{modules}-")
+    silence = not args.verbose
+    results = []
+
+    def record(name: str, stats: Dict[str, Any], **extra) -> None:
+        row = {"benchmark": name, "modules": modules, **extra, **stats}
+        results.append(row)
+        print(f"  {name:<32} median {stats['median_s'] * 1000:10.2f} ms", file=sys.stderr)
+
+    try:
+        print(f"Building synthetic trees with {modules} modules in {work_dir}", file=sys.stderr)
+        trees = build_trees(work_dir, modules, args)
+        local, repo, pristine = trees["local"], trees["repo"], trees["pristine_local"]
+
+        def reset_local():
+            shutil.rmtree(local)
+            shutil.copytree(pristine, local, symlinks=True)
+
+        # Module discovery
+        record("get_enabled_modules.cold",
+               measure(lambda: orchestrator.get_enabled_modules(local), args.repeat,
+                       setup=module_registry._registries.clear, silence=silence))
+        record("get_enabled_modules.warm",
+               measure(lambda: orchestrator.get_enabled_modules(local), args.repeat, silence=silence))
+
+        with quiet(silence):
+            enabled = orchestrator.get_enabled_modules(local)
+        record("resolve_group_winners",
+               measure(lambda: orchestrator.resolve_group_winners(local, enabled), args.repeat,
+                       setup=get_service_state_cache().invalidate, silence=silence),
+               group_pairs=args.group_pairs)
+
+        # Update detection and module copy
+        tree_index = os.path.join(local, ".module_trees.json")
+
+        def drop_tree_index():
+            if os.path.exists(tree_index):
+                os.remove(tree_index)
+
+        record("detect_module_updates.cold",
+               measure(lambda: detect_module_updates(local, repo), args.repeat,
+                       setup=drop_tree_index, silence=silence),
+               bumped=trees["bumped"])
+        with quiet(silence):
+            detect_module_updates(local, repo)
+        record("detect_module_updates.warm",
+               measure(lambda: detect_module_updates(local, repo), args.repeat, silence=silence),
+               bumped=trees["bumped"])
+
+        with quiet(silence):
+            reset_local()
+            to_update = detect_module_updates(local, repo)
+        record("update_modules",
+               measure(lambda: update_modules(to_update, local, os.path.join(repo, "modules")), args.repeat,
+                       setup=reset_local, silence=silence),
+               updated=len(to_update), module_files=args.module_files, file_size=args.file_size)
+
+        # Module execution
+        with quiet(silence):
+            reset_local()
+        sys.path.insert(0, local)
+        try:
+            with quiet(silence):
+                to_run = orchestrator.resolve_group_winners(local, orchestrator.get_enabled_modules(local))
+            record("run_enabled_modules",
+                   measure(lambda: orchestrator.run_enabled_modules(local, to_run), args.repeat,
+                           setup=_purge_imported_modules, silence=silence),
+                   executed=len(to_run), module_sleep=args.module_sleep)
+        finally:
+            sys.path.remove(local)
+            _purge_imported_modules()
+
+        # StateManager backup/restore
+        data_dir = build_state_tree(work_dir, args.state_files, args.file_size)
+        with quiet(silence):
+            state_manager = StateManager(os.path.join(work_dir, "backups"))
+        record("state_manager.backup_module_state",
+               measure(lambda: state_manager.backup_module_state("bench", files=[data_dir]), args.repeat,
+                       silence=silence),
+               files=args.state_files, file_size=args.file_size)
+        record("state_manager.restore_module_state",
+               measure(lambda: state_manager.restore_module_state("bench"), args.repeat, silence=silence),
+               files=args.state_files, file_size=args.file_size)
+    finally:
+        if args.keep:
+            print(f"Kept benchmark trees in {work_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    """Commit of the updates checkout being benchmarked, if it is a git checkout."""
+    try:
+        result = subprocess.run(
+            ["git", "-C", os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rev-parse", "HEAD"],
+            capture_output=True, text=True, timeout=10
+        )
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(baseline_path: str, report: Dict[str, Any]) -> None:
+    """Print current/baseline median ratios for benchmarks present in both reports."""
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    before = {(r["benchmark"], r["modules"]): r["median_s"] for r in baseline.get("results", [])}
+    print(f"Comparison against {baseline_path} ({baseline.get('meta', {}).get('git_commit')}):", file=sys.stderr)
+    for r in report["results"]:
+        old = before.get((r["benchmark"], r["modules"]))
+        if not old:
+            continue
+        ratio = r["median_s"] / old
+        flag = "  REGRESSION" if ratio > 1.2 else ""
+        print(f"  {r['benchmark']:<32} {r['modules']:>5}  {old * 1000:10.2f} ms -> "
+              f"{r['median_s'] * 1000:10.2f} ms  x{ratio:.2f}{flag}", file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the update orchestrator on synthetic module trees")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Module counts to benchmark (default: 10 100 1000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark (default: 3)")
+    parser.add_argument("--module-files", type=int, default=5,
+                        help="Payload files per synthetic module (default: 5)")
+    parser.add_argument("--state-files", type=int, default=500,
+                        help="Files in the StateManager backup/restore tree (default: 500)")
+    parser.add_argument("--file-size", type=int, default=4096, help="Size of each generated file in bytes (default: 4096)")
+    parser.add_argument("--module-sleep", type=float, default=0.0,
+                        help="Seconds each synthetic main() sleeps (default: 0, no-op)")
+    parser.add_argument("--bump-fraction", type=float, default=0.1,
+                        help="Fraction of repo modules with a newer schema_version (default: 0.1)")
+    parser.add_argument("--group-pairs", type=int, default=5,
+                        help="Number of two-member module groups for resolve_group_winners (default: 5)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="metadata.max_parallel_modules in the synthetic global index (default: 1)")
+    parser.add_argument("--output", metavar="PATH", help="Write the JSON report to PATH instead of stdout")
+    parser.add_argument("--compare", metavar="PATH", help="Baseline JSON report to compare medians against")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated trees")
+    parser.add_argument("--verbose", action="store_true", help="Show orchestrator log output")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.CRITICAL)
+
+    stub_bin = tempfile.mkdtemp(prefix="hs-bench-bin-")
+    stub_path = os.path.join(stub_bin, "systemctl")
+    with open(stub_path, "w") as f:
+        f.write(STUB_SYSTEMCTL)
+    os.chmod(stub_path, 0o755)
+    original_path = os.environ.get("PATH", "")
+    os.environ["PATH"] = f"{stub_bin}{os.pathsep}{original_path}"
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "keep", "verbose")},
+        },
+        "results": [],
+    }
+    try:
+        for modules in args.sizes:
+            report["results"].extend(run_size(modules, args))
+    finally:
+        os.environ["PATH"] = original_path
+        shutil.rmtree(stub_bin, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        compare(args.compare, report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,10 +26,20 @@ import logging
 import subprocess
 import importlib
 import sys
+import contextlib
+import threading
+import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 from datetime import datetime
 from . import compare_schema_versions, run_update, load_module_index, sync_from_repo, repo_sync_lock, detect_module_updates, update_modules, DEBUG
-from .utils import run_all_maintenance
+from .utils import run_all_maintenance, get_module_registry, prefetch_service_states, is_service_active
+from .utils.module_registry import import_module_if_changed
+from .utils.permission_engine import begin_permission_plan, apply_permission_plan
+from .utils.permission_audit import audit_permissions
+from .utils.daemon import UpdateDaemon, send_daemon_command, DEFAULT_SOCKET_PATH, DEFAULT_INTERVAL as DEFAULT_DAEMON_INTERVAL
+from .utils.tracing import span, enable_tracing, get_tracer
 
 # Add current directory to path for relative imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -38,7 +48,9 @@ def setup_global_update_logging():
     """
     Log to stdout only; the shell wrapper owns file truncation/redirection.
     """
-    console_handler = logging.StreamHandler(sys.stdout)
+    # Never log into a capture target: the handler must hold the real stdout
+    stream = sys.stdout._original if isinstance(sys.stdout, _ThreadRoutedStream) else sys.stdout
+    console_handler = logging.StreamHandler(stream)
     console_handler.setLevel(logging.INFO)
     unified_format = logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s',
                                        datefmt='%Y-%m-%d %H:%M:%S')
@@ -79,6 +91,9 @@ def log_to_file(message: str, level: str = "INFO"):
 DEFAULT_REPO_URL = "https://github.com/homeserversltd/updates.git"
 DEFAULT_LOCAL_PATH = "/tmp/homeserver-updates-repo"
 DEFAULT_MODULES_PATH = "/usr/local/lib/updates"
+DEFAULT_MAX_PARALLEL_MODULES = 4
+DEFAULT_OUTPUT_TAIL_LINES = 200
+MAX_PARTIAL_LINE_CHARS = 8192
 
 def load_global_index(modules_path: str) -> dict:
     """Load the global index.json that tracks current module versions."""
@@ -440,47 +455,21 @@ def update_orchestrator(modules_path: str, repo_path: str) -> bool:
 def get_enabled_modules(modules_path: str) -> list:
     """Get list of all enabled modules that should be executed, sorted by priority."""
     enabled_modules = []
-    module_priorities = []
     
     try:
-        # Check both possible module locations
-        modules_search_path = os.path.join(modules_path, "modules")
-        if not os.path.exists(modules_search_path):
-            modules_search_path = modules_path
-        
-        if not os.path.exists(modules_search_path):
+        registry = get_module_registry(modules_path)
+        if not os.path.exists(registry.search_path):
             log_message("No modules directory found", "WARNING")
             return enabled_modules
         
-        for item in os.listdir(modules_search_path):
-            item_path = os.path.join(modules_search_path, item)
-            if os.path.isdir(item_path):
-                # Skip backup directories created by StateManager
-                if item.endswith('.backup'):
-                    log_message(f"Skipping backup directory: {item}")
-                    continue
-                
-                index_file = os.path.join(item_path, "index.json")
-                if os.path.exists(index_file):
-                    try:
-                        with open(index_file, 'r') as f:
-                            config = json.load(f)
-                        
-                        # Check if module is enabled (default to True if not specified)
-                        enabled = config.get("metadata", {}).get("enabled", True)
-                        if enabled:
-                            # Get priority (lower number = higher priority, default to 100)
-                            priority = config.get("metadata", {}).get("priority", 100)
-                            module_priorities.append((priority, item))
-                            log_message(f"Found enabled module: {item} (priority: {priority})")
-                        else:
-                            log_message(f"Skipping disabled module: {item}")
-                    except Exception as e:
-                        log_message(f"Error reading module '{item}': {e}", "WARNING")
+        for record in registry.records():
+            if not record.enabled:
+                log_message(f"Skipping disabled module: {record.name}")
         
-        # Sort by priority (ascending order - lower numbers first)
-        module_priorities.sort(key=lambda x: x[0])
-        enabled_modules = [module for priority, module in module_priorities]
+        # Sorted by priority (ascending order - lower numbers first)
+        for record in registry.enabled():
+            enabled_modules.append(record.name)
+            log_message(f"Found enabled module: {record.name} (priority: {record.priority})")
         
         log_message(f"Total enabled modules: {len(enabled_modules)}")
         if enabled_modules:
@@ -492,63 +481,40 @@ def get_enabled_modules(modules_path: str) -> list:
         return enabled_modules
 
 
-def _load_module_metadata(modules_path: str, module_name: str) -> dict:
-    """Load metadata (and config) from a module's index.json. Returns {} on failure."""
-    for base in [os.path.join(modules_path, "modules"), modules_path]:
-        index_file = os.path.join(base, module_name, "index.json")
-        if os.path.exists(index_file):
-            try:
-                with open(index_file, "r") as f:
-                    return json.load(f)
-            except Exception:
-                pass
-    return {}
-
-
 def _is_service_active(service_name: str) -> bool:
-    """Return True if systemctl reports the service as active."""
-    try:
-        r = subprocess.run(
-            ["systemctl", "is-active", "--quiet", service_name],
-            capture_output=True,
-            timeout=5,
-        )
-        return r.returncode == 0
-    except Exception:
-        return False
+    """Return True if systemctl reports the service as active (served from the shared state cache)."""
+    return is_service_active(service_name)
 
 
 def resolve_group_winners(modules_path: str, enabled_modules: list) -> list:
     """
     Resolve grouped modules so only one implementation runs per group (ladder logic).
     Modules with metadata.group (e.g. "git") are in a group; group_order is ascending
-    (oldest first). For each group we run systemctl is-active on service_name for each
-    implementation in order; the first active one wins and is the only one run.
+    (oldest first). The service_name states of all group members are fetched with one
+    systemctl call; walking each group in order, the first active one wins and is the only one run.
     Returns the final list of module names to execute (order preserved; group losers removed).
     """
     if not enabled_modules:
         return []
-    modules_search_path = os.path.join(modules_path, "modules")
-    if not os.path.exists(modules_search_path):
-        modules_search_path = modules_path
+    registry = get_module_registry(modules_path)
     # Per-module: (group, group_order, service_name)
     meta = {}
     group_members = {}  # group -> [(group_order, service_name, module_name), ...]
     for name in enabled_modules:
-        data = _load_module_metadata(modules_path, name)
-        m = data.get("metadata", {})
-        group = m.get("group")
+        record = registry.get(name)
+        group = record.group if record else None
         if not group:
             meta[name] = (None, None, None)
             continue
-        order = m.get("group_order", 99)
-        service = m.get("service_name", name)
+        order = record.group_order
+        service = record.service_name
         meta[name] = (group, order, service)
         if group not in group_members:
             group_members[group] = []
         group_members[group].append((order, service, name))
     for group in group_members:
         group_members[group].sort(key=lambda x: (x[0], x[2]))
+    prefetch_service_states(svc for members in group_members.values() for _o, svc, _n in members)
     # For each group, pick first active implementation
     group_winner = {}
     for group, members in group_members.items():
@@ -574,58 +540,139 @@ def resolve_group_winners(modules_path: str, enabled_modules: list) -> list:
     return run_list
 
 
-def run_update_with_logging(module_path: str, args=None):
+class _ThreadRoutedStream:
+    """
+    Stand-in for sys.stdout/sys.stderr that sends writes from a thread with an
+    active capture target to that target, and everything else to the real stream.
+
+    contextlib.redirect_stdout swaps a process-wide global, so two modules
+    running concurrently would capture each other's output.
+    """
+
+    def __init__(self, original):
+        self._original = original
+        self._local = threading.local()
+
+    def set_target(self, target):
+        self._local.target = target
+
+    def clear_target(self):
+        self._local.target = None
+
+    def _current(self):
+        return getattr(self._local, "target", None) or self._original
+
+    def write(self, data):
+        return self._current().write(data)
+
+    def flush(self):
+        return self._current().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._current(), name)
+
+
+def _install_output_router():
+    """Wrap sys.stdout/sys.stderr once so module output can be captured per thread."""
+    if not isinstance(sys.stdout, _ThreadRoutedStream):
+        sys.stdout = _ThreadRoutedStream(sys.stdout)
+    if not isinstance(sys.stderr, _ThreadRoutedStream):
+        sys.stderr = _ThreadRoutedStream(sys.stderr)
+
+
+@contextlib.contextmanager
+def _capture_module_output(stdout_target, stderr_target):
+    """Route the calling thread's stdout/stderr to the given targets."""
+    _install_output_router()
+    sys.stdout.set_target(stdout_target)
+    sys.stderr.set_target(stderr_target)
+    try:
+        yield
+    finally:
+        sys.stdout.clear_target()
+        sys.stderr.clear_target()
+
+
+class _LineStreamLogger(io.TextIOBase):
+    """
+    Write-only text stream that logs every complete line as soon as it is written
+    and remembers only the last tail_lines lines, so memory stays constant no
+    matter how much a module prints.
+    """
+
+    def __init__(self, prefix: str, level: str = "INFO", tail_lines: int = DEFAULT_OUTPUT_TAIL_LINES):
+        super().__init__()
+        self._prefix = prefix
+        self._level = level
+        self._partial = ""
+        self.tail = deque(maxlen=max(0, tail_lines))
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if not data:
+            return 0
+        lines = (self._partial + data).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._emit(line)
+        # Progress output without newlines must not grow the buffer unbounded
+        if len(self._partial) > MAX_PARTIAL_LINE_CHARS:
+            self._emit(self._partial)
+            self._partial = ""
+        return len(data)
+
+    def _emit(self, line: str):
+        # Keep only the final state of carriage-return progress bars
+        line = line.rstrip("\r").rsplit("\r", 1)[-1]
+        log_to_file(f"{self._prefix}{line}", self._level)
+        self.tail.append(line)
+
+    def close(self):
+        if self._partial:
+            self._emit(self._partial)
+            self._partial = ""
+        super().close()
+
+
+def run_update_with_logging(module_path: str, args=None, output_tail: dict = None,
+                            tail_lines: int = DEFAULT_OUTPUT_TAIL_LINES):
     """
     Enhanced version of run_update that captures and logs all subprocess output.
     This ensures ALL module output gets streamed to the centralized log file.
+
+    Output is logged line by line while the module runs. If output_tail is given,
+    its "stdout" and "stderr" keys are set to the last tail_lines lines of each stream.
     """
     try:
-        # Import the module dynamically with forced reload
         module_parts = module_path.split('.')
-        
-
-        
-        # Remove the module from cache if it exists to force reload
-        if module_path in sys.modules:
-            del sys.modules[module_path]
-        
-        # Import the module fresh from disk
-        module = __import__(module_path, fromlist=[module_parts[-1]])
+        module = import_module_if_changed(module_path)
         
         # Check if module has a main function
         if hasattr(module, 'main'):
             log_to_file(f"Calling {module_path}.main() with output capture...")
             
-            # Capture the module's output by temporarily redirecting stdout/stderr
-            import io
-            import contextlib
-            
-            # Create string buffers to capture output
-            stdout_buffer = io.StringIO()
-            stderr_buffer = io.StringIO()
+            # Prefix lines with the module name; modules may run concurrently
+            name = module_parts[-1]
+            stdout_stream = _LineStreamLogger(f"  [{name}] ", "INFO", tail_lines)
+            stderr_stream = _LineStreamLogger(f"  [{name}:stderr] ", "WARNING", tail_lines)
             
-            # Redirect stdout and stderr to our buffers
-            with contextlib.redirect_stdout(stdout_buffer), contextlib.redirect_stderr(stderr_buffer):
+            # Redirect this thread's stdout and stderr to the line loggers
+            with _capture_module_output(stdout_stream, stderr_stream):
                 try:
                     result = module.main(args)
                 except Exception as module_error:
                     log_to_file(f"Module {module_path} raised exception: {module_error}", "ERROR")
                     result = {"success": False, "error": str(module_error)}
+                finally:
+                    # Flush any trailing line without a newline
+                    stdout_stream.close()
+                    stderr_stream.close()
             
-            # Get captured output
-            stdout_content = stdout_buffer.getvalue()
-            stderr_content = stderr_buffer.getvalue()
-            
-            # Log captured output to our centralized log
-            if stdout_content.strip():
-                log_to_file("STDOUT from module:")
-                for line in stdout_content.strip().split('\n'):
-                    log_to_file(f"  {line}")
-            
-            if stderr_content.strip():
-                log_to_file("STDERR from module:", "WARNING")
-                for line in stderr_content.strip().split('\n'):
-                    log_to_file(f"  {line}", "WARNING")
+            if output_tail is not None:
+                output_tail["stdout"] = list(stdout_stream.tail)
+                output_tail["stderr"] = list(stderr_stream.tail)
             
             log_to_file(f"Module {module_path} completed with result: {result}")
             return result
@@ -641,30 +688,43 @@ def run_update_with_logging(module_path: str, args=None):
         log_to_file(f"Failed to execute module {module_path}: {e}", "ERROR")
         return None
 
-def run_enabled_modules(modules_path: str, enabled_modules: list) -> dict:
-    """Run all enabled modules after schema updates are complete."""
-    results = {}
-    
-    if not enabled_modules:
-        log_to_file("No enabled modules to run")
-        return results
-    
-    log_to_file(f"Running {len(enabled_modules)} enabled modules...")
-    
-    for module_name in enabled_modules:
+
+def _failed_module_result(error: str) -> dict:
+    """Per-module result dict for a module that could not be executed at all."""
+    return {
+        "executed": False,
+        "system_success": False,
+        "updated": False,
+        "error": error,
+        "rollback_success": None,
+        "details": {},
+        "self_update_needed": False,
+        "restart_attempts": 0,
+        "output_tail": {"stdout": [], "stderr": []}
+    }
+
+
+def execute_module(module_name: str, tail_lines: int = DEFAULT_OUTPUT_TAIL_LINES) -> dict:
+    """
+    Run a single module (including one restart after self-update) and interpret its result.
+    Returns the per-module result dict used in run_enabled_modules() results; its
+    "output_tail" holds the last tail_lines lines the module printed to stdout/stderr.
+    """
+    with span(module_name, "module"):
+        output_tail = {"stdout": [], "stderr": []}
         try:
             log_to_file(f"Executing module: {module_name}")
             log_to_file("-" * 60)
             log_to_file(f"MODULE: {module_name} - START")
             log_to_file("-" * 60)
-            
+        
             # Run the module's main function with output capture
-            result = run_update_with_logging(f"modules.{module_name}")
-            
+            result = run_update_with_logging(f"modules.{module_name}", output_tail=output_tail, tail_lines=tail_lines)
+        
             log_to_file("-" * 60)
             log_to_file(f"MODULE: {module_name} - END")
             log_to_file("-" * 60)
-            
+        
             # Enhanced result interpretation
             module_result = {
                 "executed": result is not None,
@@ -674,20 +734,21 @@ def run_enabled_modules(modules_path: str, enabled_modules: list) -> dict:
                 "rollback_success": None,
                 "details": result if isinstance(result, dict) else {},
                 "self_update_needed": False,
-                "restart_attempts": 0
+                "restart_attempts": 0,
+                "output_tail": output_tail
             }
-            
+        
             # Check if module needs self-update (returned False)
             if result is False:
                 log_message(f"🔄 Module '{module_name}' needs self-update - restarting...")
                 module_result["self_update_needed"] = True
                 module_result["restart_attempts"] = 1
-                
+            
                 # Attempt to restart the module once
                 try:
                     log_message(f"🔄 Restarting module '{module_name}' after self-update...")
-                    restart_result = run_update_with_logging(f"modules.{module_name}")
-                    
+                    restart_result = run_update_with_logging(f"modules.{module_name}", output_tail=output_tail, tail_lines=tail_lines)
+                
                     if restart_result is False:
                         log_message(f"⚠️ Module '{module_name}' still needs restart after self-update", "WARNING")
                         module_result["restart_attempts"] = 2
@@ -697,25 +758,25 @@ def run_enabled_modules(modules_path: str, enabled_modules: list) -> dict:
                         log_message(f"✅ Module '{module_name}' successfully restarted after self-update")
                         module_result["system_success"] = True
                         module_result["updated"] = True
-                        
+                    
                         # Process the restart result
                         if isinstance(restart_result, dict):
                             module_result["updated"] = restart_result.get("updated", False)
                             module_result["error"] = restart_result.get("error")
                             module_result["rollback_success"] = restart_result.get("rollback_success")
-                        
+                    
                 except Exception as restart_error:
                     log_message(f"✗ Failed to restart module '{module_name}' after self-update: {restart_error}", "ERROR")
                     module_result["system_success"] = False
                     module_result["error"] = f"Restart failed: {restart_error}"
-                    
+                
             elif isinstance(result, dict):
                 # Module returned detailed status dictionary
                 module_result["system_success"] = result.get("success", False)
                 module_result["updated"] = result.get("updated", False)
                 module_result["error"] = result.get("error")
                 module_result["rollback_success"] = result.get("rollback_success")
-                
+            
                 # Determine overall status message
                 if module_result["system_success"]:
                     if module_result["updated"]:
@@ -735,21 +796,170 @@ def run_enabled_modules(modules_path: str, enabled_modules: list) -> dict:
                 # Module returned None - assume failure
                 module_result["system_success"] = False
                 log_message(f"✗ Module '{module_name}' execution failed", "ERROR")
+        
+            return module_result
             
-            results[module_name] = module_result
-                
         except Exception as e:
             log_message(f"Failed to execute module '{module_name}': {e}", "ERROR")
-            results[module_name] = {
-                "executed": False,
-                "system_success": False,
-                "updated": False,
-                "error": str(e),
-                "rollback_success": None,
-                "details": {},
-                "self_update_needed": False,
-                "restart_attempts": 0
-            }
+            failed = _failed_module_result(str(e))
+            failed["output_tail"] = output_tail
+            return failed
+
+
+def _as_name_list(value) -> list:
+    """Normalize a metadata field that may be a single name or a list of names."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [v for v in value if isinstance(v, str)]
+
+
+def build_module_graph(modules_path: str, modules_to_run: list) -> tuple:
+    """
+    Read metadata.depends_on / metadata.conflicts_with for the modules about to run.
+    References to modules that are not in modules_to_run (disabled, group losers,
+    unknown names) are ignored. Returns (depends_on, conflicts_with, declared) where
+    both maps are keyed by module name and declared is True if any module declared either.
+    """
+    run_set = set(modules_to_run)
+    depends_on = {name: [] for name in modules_to_run}
+    conflicts_with = {name: set() for name in modules_to_run}
+    declared = False
+    registry = get_module_registry(modules_path)
+    for name in modules_to_run:
+        record = registry.get(name)
+        deps = _as_name_list(record.depends_on if record else None)
+        conflicts = _as_name_list(record.conflicts_with if record else None)
+        if deps or conflicts:
+            declared = True
+        for dep in deps:
+            if dep in run_set and dep != name:
+                depends_on[name].append(dep)
+            else:
+                log_message(f"Module '{name}': ignoring depends_on '{dep}' (not scheduled this run)")
+        for other in conflicts:
+            if other in run_set and other != name:
+                conflicts_with[name].add(other)
+                conflicts_with[other].add(name)
+    return depends_on, conflicts_with, declared
+
+
+def _find_dependency_cycle(modules_to_run: list, depends_on: dict) -> list:
+    """Return the modules left over by a topological sort (non-empty means a cycle)."""
+    remaining = {name: set(deps) for name, deps in depends_on.items()}
+    resolved = set()
+    progress = True
+    while progress:
+        progress = False
+        for name in modules_to_run:
+            if name not in resolved and remaining[name] <= resolved:
+                resolved.add(name)
+                progress = True
+    return [name for name in modules_to_run if name not in resolved]
+
+
+def get_max_parallel_modules(modules_path: str) -> int:
+    """Worker pool size for module execution (metadata.max_parallel_modules in the global index)."""
+    try:
+        value = int(load_global_index(modules_path).get("metadata", {}).get("max_parallel_modules", DEFAULT_MAX_PARALLEL_MODULES))
+    except (TypeError, ValueError):
+        value = DEFAULT_MAX_PARALLEL_MODULES
+    return max(1, value)
+
+
+def get_output_tail_lines(modules_path: str) -> int:
+    """Lines of module output kept per stream in results (metadata.module_output_tail_lines in the global index)."""
+    try:
+        value = int(load_global_index(modules_path).get("metadata", {}).get("module_output_tail_lines", DEFAULT_OUTPUT_TAIL_LINES))
+    except (TypeError, ValueError):
+        value = DEFAULT_OUTPUT_TAIL_LINES
+    return max(0, value)
+
+
+def _run_modules_scheduled(modules_to_run: list, depends_on: dict, conflicts_with: dict, max_workers: int,
+                           tail_lines: int = DEFAULT_OUTPUT_TAIL_LINES) -> dict:
+    """
+    Run modules on a bounded worker pool. A module starts once all of its dependencies
+    have finished and none of its conflicting modules is running; among ready modules,
+    the earlier one in modules_to_run (priority order) is started first.
+    """
+    results = {}
+    pending = list(modules_to_run)
+    finished = set()
+    running = {}  # future -> module name
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="module") as executor:
+        while pending or running:
+            for name in list(pending):
+                if len(running) >= max_workers:
+                    break
+                if any(dep not in finished for dep in depends_on[name]):
+                    continue
+                if conflicts_with[name] & set(running.values()):
+                    continue
+                pending.remove(name)
+                failed_deps = [dep for dep in depends_on[name] if not results[dep]["system_success"]]
+                if failed_deps:
+                    log_message(f"Module '{name}': dependencies failed ({', '.join(failed_deps)}); running anyway", "WARNING")
+                log_message(f"Scheduling module: {name}")
+                running[executor.submit(execute_module, name, tail_lines)] = name
+
+            if not running:
+                # Unreachable with an acyclic graph; never spin
+                for name in pending:
+                    results[name] = _failed_module_result("Unschedulable (dependency cycle)")
+                break
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    log_message(f"Failed to execute module '{name}': {e}", "ERROR")
+                    results[name] = _failed_module_result(str(e))
+                finished.add(name)
+
+    # Keep priority order in the results so summaries read the same as sequential runs
+    return {name: results[name] for name in modules_to_run if name in results}
+
+
+def run_enabled_modules(modules_path: str, enabled_modules: list) -> dict:
+    """
+    Run all enabled modules after schema updates are complete.
+
+    Without any metadata.depends_on / metadata.conflicts_with declarations, modules run
+    one at a time in priority order. Otherwise they are scheduled as a dependency graph
+    on a worker pool of metadata.max_parallel_modules (global index.json).
+    """
+    results = {}
+    
+    if not enabled_modules:
+        log_to_file("No enabled modules to run")
+        return results
+    
+    log_to_file(f"Running {len(enabled_modules)} enabled modules...")
+
+    depends_on, conflicts_with, declared = build_module_graph(modules_path, enabled_modules)
+    max_workers = get_max_parallel_modules(modules_path)
+    tail_lines = get_output_tail_lines(modules_path)
+    cycle = _find_dependency_cycle(enabled_modules, depends_on) if declared else []
+    if cycle:
+        log_message(f"Dependency cycle between modules: {', '.join(cycle)}; falling back to priority order", "ERROR")
+
+    # Permission targets modules defer are merged and applied once, after the last module
+    begin_permission_plan()
+    try:
+        if declared and not cycle and max_workers > 1:
+            log_message(f"Scheduling modules by dependency graph ({max_workers} workers)")
+            results = _run_modules_scheduled(enabled_modules, depends_on, conflicts_with, max_workers, tail_lines)
+        else:
+            for module_name in enabled_modules:
+                results[module_name] = execute_module(module_name, tail_lines)
+    finally:
+        with span("permission_plan", "orchestrator"):
+            apply_permission_plan()
     
     # Enhanced summary reporting
     total_modules = len(results)
@@ -849,12 +1059,14 @@ async def run_schema_based_updates(repo_url: str = None, local_repo_path: str =
         exec_shell_args = None
         exec_env = None
 
-        # Lock through clone + orchestrator read/copy + module copy so another process
-        # cannot rm -rf local_repo_path between git clone and shutil.copytree.
+        # Lock through sync + orchestrator read/copy + module copy so another process
+        # cannot rewrite local_repo_path between checkout and shutil.copytree.
         with repo_sync_lock(local_repo_path):
             # Step 1: Sync from repository
             log_to_file("Step 1: Syncing from repository...")
-            if not sync_from_repo(repo_url, local_repo_path, branch):
+            with span("sync", "orchestrator"):
+                synced = sync_from_repo(repo_url, local_repo_path, branch)
+            if not synced:
                 results["errors"].append("Failed to sync from repository")
                 return results
 
@@ -862,12 +1074,14 @@ async def run_schema_based_updates(repo_url: str = None, local_repo_path: str =
 
             # Step 1.5: Check if orchestrator itself needs updating
             log_to_file("Step 1.5: Checking orchestrator schema version...")
-            orchestrator_needs_update = check_orchestrator_update(modules_path, local_repo_path)
+            with span("orchestrator_check", "orchestrator"):
+                orchestrator_needs_update = check_orchestrator_update(modules_path, local_repo_path)
             if orchestrator_needs_update and os.environ.get("HS_UPDATER_RESTARTED") != "1":
                 log_to_file("CRITICAL: Orchestrator update detected - updating orchestrator first")
 
                 log_message("Step 1.6: Updating orchestrator system...")
-                orchestrator_success = update_orchestrator(modules_path, local_repo_path)
+                with span("orchestrator_update", "orchestrator"):
+                    orchestrator_success = update_orchestrator(modules_path, local_repo_path)
                 if orchestrator_success:
                     log_message("Orchestrator updated successfully; restarting updater once before applying module updates…")
 
@@ -884,7 +1098,11 @@ async def run_schema_based_updates(repo_url: str = None, local_repo_path: str =
                             shell_args.append("--legacy")
                     exec_env = os.environ.copy()
                     exec_env["HS_UPDATER_RESTARTED"] = "1"
-                    if os.path.exists(shell_script_path):
+                    if "--daemon" in current_args:
+                        # A daemon restarts as a daemon; it applies the module updates right after binding its socket
+                        exec_shell_path = sys.executable
+                        exec_shell_args = [sys.executable, "-m", "updates.index"] + current_args
+                    elif os.path.exists(shell_script_path):
                         exec_shell_path = shell_script_path
                         exec_shell_args = [shell_script_path] + shell_args
                     else:
@@ -910,7 +1128,8 @@ async def run_schema_based_updates(repo_url: str = None, local_repo_path: str =
                     log_message(f"  Local modules path: {modules_path}")
                     log_message(f"  Repository modules path: {repo_modules_path}")
 
-                modules_to_update = detect_module_updates(modules_path, repo_modules_path)
+                with span("detect_module_updates", "orchestrator"):
+                    modules_to_update = detect_module_updates(modules_path, repo_modules_path)
                 results["modules_detected"] = modules_to_update
 
                 if DEBUG:
@@ -923,7 +1142,8 @@ async def run_schema_based_updates(repo_url: str = None, local_repo_path: str =
 
                 if modules_to_update:
                     log_message("Step 3: Updating modules...")
-                    update_results = update_modules(modules_to_update, modules_path, repo_modules_path)
+                    with span("update_modules", "orchestrator", modules=", ".join(modules_to_update)):
+                        update_results = update_modules(modules_to_update, modules_path, repo_modules_path)
                     results["modules_updated"] = update_results
 
         if do_exec:
@@ -940,21 +1160,24 @@ async def run_schema_based_updates(repo_url: str = None, local_repo_path: str =
 
         # Step 4: Run maintenance tasks for all modules
         log_message("Step 4: Running maintenance tasks...")
-        maintenance_results = run_all_maintenance(modules_path)
+        with span("maintenance", "orchestrator"):
+            maintenance_results = run_all_maintenance(modules_path)
         results["maintenance_results"] = maintenance_results
         
         # Step 5: Get all enabled modules, resolve group winners (one per group), then run
         log_message("Step 5: Getting enabled modules...")
-        enabled_modules = get_enabled_modules(modules_path)
+        with span("module_selection", "orchestrator"):
+            enabled_modules = get_enabled_modules(modules_path)
+            modules_to_run = resolve_group_winners(modules_path, enabled_modules)
         results["enabled_modules"] = enabled_modules
-        modules_to_run = resolve_group_winners(modules_path, enabled_modules)
         results["modules_to_run"] = modules_to_run
 
         if modules_to_run:
             log_message("Step 6: Running resolved modules (one per group)...")
             log_message("Note: Modules are executed regardless of whether they were schema-updated")
             log_message("This ensures content and tab updates are handled after schema updates")
-            module_execution_results = run_enabled_modules(modules_path, modules_to_run)
+            with span("run_enabled_modules", "orchestrator"):
+                module_execution_results = run_enabled_modules(modules_path, modules_to_run)
             results["modules_executed"] = module_execution_results
         else:
             log_message("No modules to run (none enabled or no group winner active)")
@@ -964,16 +1187,19 @@ async def run_schema_based_updates(repo_url: str = None, local_repo_path: str =
         log_message("Step 7: Updating global index...")
         successful_updates = [module for module, success in results["modules_updated"].items() if success] if results["modules_updated"] else []
         if successful_updates:
-            results["global_index_updated"] = update_global_index(modules_path, successful_updates, False, repo_modules_path)
+            with span("update_global_index", "orchestrator"):
+                results["global_index_updated"] = update_global_index(modules_path, successful_updates, False, repo_modules_path)
         
         # Step 8: Update homeserver config timestamp
         log_message("Step 8: Updating homeserver config timestamp...")
-        homeserver_timestamp_updated = update_homeserver_config_timestamp()
+        with span("update_config_timestamp", "orchestrator"):
+            homeserver_timestamp_updated = update_homeserver_config_timestamp()
         results["homeserver_timestamp_updated"] = homeserver_timestamp_updated
         
         # Step 9: Restart gunicorn service (final step to avoid killing update process)
         log_message("Step 9: Restarting gunicorn service...")
-        gunicorn_restart_success = restart_gunicorn_service()
+        with span("restart_gunicorn", "orchestrator"):
+            gunicorn_restart_success = restart_gunicorn_service()
         results["gunicorn_restart_success"] = gunicorn_restart_success
         
         # Enhanced Summary with detailed module status reporting
@@ -1219,65 +1445,40 @@ def disable_component(modules_path: str, module_name: str, component_name: str)
 def list_modules(modules_path: str) -> bool:
     """List all modules with their status"""
     try:
-        modules_search_path = os.path.join(modules_path, "modules")
-        if not os.path.exists(modules_search_path):
-            modules_search_path = modules_path
-
-        if not os.path.exists(modules_search_path):
+        registry = get_module_registry(modules_path)
+        if not os.path.exists(registry.search_path):
             log_message("No modules directory found", "ERROR")
             return False
 
         modules = []
-        for item in os.listdir(modules_search_path):
-            item_path = os.path.join(modules_search_path, item)
-            if os.path.isdir(item_path):
-                # Exclude backup directories from listing
-                if item.endswith('.backup'):
-                    continue
-                index_file = os.path.join(item_path, "index.json")
-                if os.path.exists(index_file):
-                    try:
-                        with open(index_file, 'r') as f:
-                            config = json.load(f)
-
-                        enabled = config.get("metadata", {}).get("enabled", True)
-                        schema_version = config.get("metadata", {}).get("schema_version", "unknown")
-                        description = config.get("metadata", {}).get("description", "No description")
+        for record in registry.records():
+            branch = record.branch
+            default_branch = record.default_branch
 
-                        # Check for branch in module's index.json
-                        branch = None
-                        default_branch = None
-
-                        # Try repo.branch first (sbin, vault, permissions, keyman)
+            # If we have a branch, ensure default_branch is set
+            if branch and not default_branch:
+                default_branch = branch
+                try:
+                    # Write back default_branch to index.json
+                    config = registry.load_config(record.name)
+                    if config:
                         if "repo" in config and "branch" in config["repo"]:
-                            branch = config["repo"]["branch"]
-                            default_branch = config["repo"].get("default_branch", branch)
-                        # Try config.repository.branch (website, linker)
-                        elif "config" in config and "repository" in config["config"] and "branch" in config["config"]["repository"]:
-                            branch = config["config"]["repository"]["branch"]
-                            default_branch = config["config"]["repository"].get("default_branch", branch)
-
-                        # If we have a branch, ensure default_branch is set
-                        if branch and not default_branch:
-                            default_branch = branch
-                            # Write back default_branch to index.json
-                            if "repo" in config and "branch" in config["repo"]:
-                                config["repo"]["default_branch"] = default_branch
-                            elif "config" in config and "repository" in config["config"]:
-                                config["config"]["repository"]["default_branch"] = default_branch
-                            with open(index_file, 'w') as f:
-                                json.dump(config, f, indent=4)
-
-                        modules.append({
-                            "name": item,
-                            "enabled": enabled,
-                            "version": schema_version,
-                            "description": description,
-                            "branch": branch,
-                            "default_branch": default_branch
-                        })
-                    except Exception as e:
-                        log_message(f"Error reading module '{item}': {e}", "WARNING")
+                            config["repo"]["default_branch"] = default_branch
+                        elif "config" in config and "repository" in config["config"]:
+                            config["config"]["repository"]["default_branch"] = default_branch
+                        with open(os.path.join(record.path, "index.json"), 'w') as f:
+                            json.dump(config, f, indent=4)
+                except Exception as e:
+                    log_message(f"Error reading module '{record.name}': {e}", "WARNING")
+
+            modules.append({
+                "name": record.name,
+                "enabled": record.enabled,
+                "version": record.schema_version or "unknown",
+                "description": record.description,
+                "branch": branch,
+                "default_branch": default_branch
+            })
 
         if not modules:
             log_message("No modules found")
@@ -1396,25 +1597,18 @@ def get_module_status(modules_path: str, module_name: str = None) -> bool:
     try:
         if module_name:
             # Get status for specific module
-            module_path = os.path.join(modules_path, "modules", module_name)
-            if not os.path.exists(module_path):
-                module_path = os.path.join(modules_path, module_name)
-            
-            if not os.path.exists(module_path):
-                log_message(f"Module '{module_name}' not found", "ERROR")
+            registry = get_module_registry(modules_path)
+            record = registry.get(module_name)
+            if record is None:
+                if not os.path.isdir(os.path.join(registry.search_path, module_name)):
+                    log_message(f"Module '{module_name}' not found", "ERROR")
+                else:
+                    log_message(f"Module '{module_name}' has no index.json", "ERROR")
                 return False
             
-            index_file = os.path.join(module_path, "index.json")
-            if not os.path.exists(index_file):
-                log_message(f"Module '{module_name}' has no index.json", "ERROR")
-                return False
-            
-            with open(index_file, 'r') as f:
-                config = json.load(f)
-            
-            enabled = config.get("metadata", {}).get("enabled", True)
-            schema_version = config.get("metadata", {}).get("schema_version", "unknown")
-            description = config.get("metadata", {}).get("description", "No description")
+            enabled = record.enabled
+            schema_version = record.schema_version or "unknown"
+            description = record.description
             
             log_message(f"Module: {module_name}")
             log_message(f"Status: {'ENABLED' if enabled else 'DISABLED'}")
@@ -1422,6 +1616,7 @@ def get_module_status(modules_path: str, module_name: str = None) -> bool:
             log_message(f"Description: {description}")
             
             # Show components if they exist
+            config = registry.load_config(module_name)
             components = None
             if "config" in config and "target_paths" in config["config"] and "components" in config["config"]["target_paths"]:
                 components = config["config"]["target_paths"]["components"]
@@ -1445,6 +1640,295 @@ def get_module_status(modules_path: str, module_name: str = None) -> bool:
         log_message(f"Failed to get module status: {e}", "ERROR")
         return False
 
+def audit_permissions_report(incremental: bool = False, prune_missing: bool = False) -> bool:
+    """
+    Report managed paths whose owner, group or mode drifted (--audit-permissions).
+    Read-only: nothing is changed on the system.
+
+    Args:
+        incremental: Re-list only directories whose mtime changed since the last audit
+        prune_missing: Drop indexed paths that no longer exist from the permission index
+
+    Returns:
+        bool: True if no drift (or audit error) was found
+    """
+    try:
+        result = audit_permissions(incremental=incremental, prune_missing=prune_missing)
+        if not result.targets:
+            log_message("No permission targets recorded yet; they are recorded as modules set permissions", "WARNING")
+            return True
+
+        log_message(f"Audited {result.checked} entries under {result.targets} targets in {result.seconds:.2f}s"
+                    + (f" ({result.directories_reused} directories unchanged)" if incremental else ""))
+        for drift in result.drift:
+            log_message(f"DRIFT {drift}", "WARNING")
+        for path in result.missing:
+            log_message(f"MISSING {path}" + (" (dropped from the permission index)" if prune_missing else ""))
+        for error in result.errors:
+            log_message(f"ERROR {error}", "ERROR")
+        log_message(f"Permission drift: {len(result.drift)} entries, {len(result.missing)} missing, "
+                    f"{len(result.errors)} errors")
+        return not result.drift and not result.errors
+    except Exception as e:
+        log_message(f"Failed to audit permissions: {e}", "ERROR")
+        return False
+
+def check_for_updates(repo_url: str, local_repo: str, modules_path: str, branch: str) -> dict:
+    """
+    Detect available updates without applying them (--check-only).
+
+    Args:
+        repo_url: Git repository URL containing updates
+        local_repo: Local path to clone/sync repository
+        modules_path: Path to local modules directory
+        branch: Git branch to sync from
+
+    Returns:
+        dict: success, orchestrator_update, schema_updates (module names),
+              content_updates (per-module counts) and updates_available
+    """
+    global_index = load_global_index(modules_path)
+    log_message("Check-only mode: detecting updates without applying...")
+
+    # Step 0: Check orchestrator update first
+    orchestrator_update_available = False
+    # Use repository URL from metadata for check-only mode
+    check_repo_url = global_index.get("metadata", {}).get("repository_url", repo_url)
+    with repo_sync_lock(local_repo):
+        if not sync_from_repo(check_repo_url, local_repo, branch):
+            log_message("Failed to sync repository for orchestrator check", "ERROR")
+            return {"success": False, "error": "Failed to sync repository"}
+        orchestrator_needs_update = check_orchestrator_update(modules_path, local_repo)
+        if orchestrator_needs_update:
+            orchestrator_update_available = True
+            log_message("Orchestrator update available")
+        else:
+            log_message("Orchestrator is up to date")
+        # Step 1: Schema-level check (needs same clone as sync)
+        repo_modules_path = os.path.join(local_repo, "modules")
+        if not os.path.exists(repo_modules_path):
+            repo_modules_path = local_repo
+        modules_to_update = detect_module_updates(modules_path, repo_modules_path)
+
+    schema_updates_available = modules_to_update
+
+    if modules_to_update:
+        log_message("Schema updates available:")
+        for module in modules_to_update:
+            log_message(f"  - {module} (schema update needed)")
+    else:
+        log_message("All module schemas are up to date")
+
+    # Step 2: Content updates check (OS and Website modules)
+    log_message("Checking enabled modules for content updates...")
+    enabled_modules = get_enabled_modules(modules_path)
+    content_updates_available = []
+
+    # Check OS module for package updates
+    if "os" in enabled_modules:
+        try:
+            # Import and run the OS module's check functionality
+            from . import run_update
+            check_result = run_update("modules.os", ["--check"])
+
+            if isinstance(check_result, dict) and check_result.get("upgradable", 0) > 0:
+                count = check_result.get("upgradable", 0)
+                log_message(f"  - OS module: {count} packages available for upgrade")
+                content_updates_available.append({
+                    "module": "os",
+                    "count": count,
+                    "details": check_result
+                })
+            else:
+                log_message("  - OS module: No package updates available")
+
+        except Exception as e:
+            log_message(f"  - OS module check failed: {e}", "WARNING")
+    else:
+        log_message("  - OS module not enabled, skipping package check")
+
+    # Check Website module for content updates
+    if "website" in enabled_modules:
+        try:
+            # Import and run the Website module's check functionality
+            from . import run_update
+            check_result = run_update("modules.website", ["--check"])
+
+            if isinstance(check_result, dict):
+                if check_result.get("website_update_available", False):
+                    log_message("  - Website module: Content update available")
+                    content_updates_available.append({
+                        "module": "website",
+                        "count": 1,
+                        "details": check_result
+                    })
+                elif check_result.get("tab_updates_available", False):
+                    tab_count = check_result.get("details", {}).get("premium_tabs", {}).get("tabs_needing_updates", 0)
+                    log_message(f"  - Website module: {tab_count} premium tab updates available")
+                    content_updates_available.append({
+                        "module": "website",
+                        "count": tab_count,
+                        "details": check_result
+                    })
+                else:
+                    log_message("  - Website module: No content updates available")
+            else:
+                log_message("  - Website module: No content updates available")
+
+        except Exception as e:
+            log_message(f"  - Website module check failed: {e}", "WARNING")
+    else:
+        log_message("  - Website module not enabled, skipping content check")
+
+    # Check Sbin module for content updates
+    if "sbin" in enabled_modules:
+        try:
+            # Import and run the Sbin module's check functionality
+            from . import run_update
+            check_result = run_update("modules.sbin", ["--check"])
+
+            if isinstance(check_result, dict):
+                if check_result.get("updated", False):
+                    log_message("  - Sbin module: Content update available")
+                    content_updates_available.append({
+                        "module": "sbin",
+                        "count": 1,
+                        "details": check_result
+                    })
+                else:
+                    log_message("  - Sbin module: No content updates available")
+            else:
+                log_message("  - Sbin module: No content updates available")
+
+        except Exception as e:
+            log_message(f"  - Sbin module check failed: {e}", "WARNING")
+    else:
+        log_message("  - Sbin module not enabled, skipping content check")
+
+    # Check Migrations module for pending migrations
+    if "migrations" in enabled_modules:
+        try:
+            # Import and run the Migrations module's check functionality
+            from . import run_update
+            check_result = run_update("modules.migrations", ["--check"])
+
+            if isinstance(check_result, dict):
+                pending_count = check_result.get("pending_migrations", 0)
+                if pending_count > 0:
+                    log_message(f"  - Migrations module: {pending_count} pending migrations")
+                    content_updates_available.append({
+                        "module": "migrations",
+                        "count": pending_count,
+                        "details": check_result
+                    })
+                else:
+                    log_message("  - Migrations module: No pending migrations")
+            else:
+                log_message("  - Migrations module: No pending migrations")
+
+        except Exception as e:
+            log_message(f"  - Migrations module check failed: {e}", "WARNING")
+    else:
+        log_message("  - Migrations module not enabled, skipping migration check")
+
+    # Summary
+    log_message("Check summary:")
+    if orchestrator_update_available:
+        log_message("  - Orchestrator update available")
+    if schema_updates_available:
+        log_message(f"  - Schema updates: {len(schema_updates_available)} modules")
+    if content_updates_available:
+        total_content_items = sum(item["count"] for item in content_updates_available)
+        log_message(f"  - Content updates: {total_content_items} items across {len(content_updates_available)} modules")
+
+    if not orchestrator_update_available and not schema_updates_available and not content_updates_available:
+        log_message("  - No updates available")
+    else:
+        log_message("  - Updates are available - run without --check to apply them")
+
+    return {
+        "success": True,
+        "orchestrator_update": orchestrator_update_available,
+        "schema_updates": schema_updates_available,
+        "content_updates": [{"module": item["module"], "count": item["count"]} for item in content_updates_available],
+        "updates_available": bool(orchestrator_update_available or schema_updates_available or content_updates_available),
+    }
+
+def run_updates_blocking(repo_url: str, local_repo: str, modules_path: str, branch: str) -> dict:
+    """Run run_schema_based_updates() to completion from synchronous code and return its results."""
+    with span("run_schema_based_updates", "orchestrator"):
+        if sys.version_info >= (3, 7):
+            return asyncio.run(run_schema_based_updates(repo_url, local_repo, modules_path, branch))
+        loop = asyncio.get_event_loop()
+        return loop.run_until_complete(run_schema_based_updates(repo_url, local_repo, modules_path, branch))
+
+
+def summarize_update_results(results: dict) -> dict:
+    """Compact, JSON-serialisable outcome of run_schema_based_updates() for daemon clients."""
+    execution_results = results.get("modules_executed") or {}
+    failed = sorted(name for name, r in execution_results.items() if not r["system_success"])
+    unrestored = sorted(name for name, r in execution_results.items()
+                        if not r["system_success"] and not r["rollback_success"])
+    return {
+        "success": bool(results.get("sync_success")) and not results.get("errors") and not unrestored,
+        "orchestrator_updated": results.get("orchestrator_updated", False),
+        "modules_updated": sorted(m for m, ok in (results.get("modules_updated") or {}).items() if ok),
+        "modules_executed": sorted(execution_results),
+        "modules_failed": failed,
+        "modules_unrestored": unrestored,
+        "errors": results.get("errors", []),
+    }
+
+
+def get_daemon_interval(modules_path: str) -> float:
+    """Seconds between scheduled daemon runs, from global metadata.daemon_interval (0 disables the timer)."""
+    value = load_global_index(modules_path).get("metadata", {}).get("daemon_interval", DEFAULT_DAEMON_INTERVAL)
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return DEFAULT_DAEMON_INTERVAL
+
+
+def run_daemon(args) -> bool:
+    """
+    Stay resident (--daemon): run updates on a timer and serve run/check/status on a UNIX socket.
+
+    The module registry, systemd state cache, shared HTTP session and imported
+    modules live as long as the process, so later runs start warm. Repository
+    URL and branch are re-read from index.json for every job.
+
+    Args:
+        args: Parsed command line arguments
+
+    Returns:
+        bool: True on a clean shutdown
+    """
+    def target() -> tuple:
+        metadata = load_global_index(args.modules_path).get("metadata", {})
+        repo_url = args.repo_url
+        if repo_url == DEFAULT_REPO_URL:
+            repo_url = metadata.get("repository_url", DEFAULT_REPO_URL)
+        return repo_url, args.branch or metadata.get("branch", "master")
+
+    def handle_run(request: dict) -> dict:
+        repo_url, branch = target()
+        try:
+            results = run_updates_blocking(repo_url, args.local_repo, args.modules_path, branch)
+        finally:
+            # The restart marker only covers the first run after an orchestrator self-update
+            os.environ.pop("HS_UPDATER_RESTARTED", None)
+        return summarize_update_results(results)
+
+    def handle_check(request: dict) -> dict:
+        repo_url, branch = target()
+        return check_for_updates(repo_url, args.local_repo, args.modules_path, branch)
+
+    interval = args.daemon_interval if args.daemon_interval is not None else get_daemon_interval(args.modules_path)
+    daemon = UpdateDaemon(args.daemon_socket, {"run": handle_run, "check": handle_check}, interval)
+    # After an orchestrator self-update the restarted daemon finishes the interrupted run right away
+    return daemon.serve_forever(run_at_start=os.environ.get("HS_UPDATER_RESTARTED") == "1")
+
+
 def main():
     """
     Main entry point for the update orchestrator.
@@ -1482,15 +1966,51 @@ def main():
                        help="Get status for a specific module")
     parser.add_argument("--all-status", action="store_true",
                        help="Get status for all modules")
+    parser.add_argument("--audit-permissions", action="store_true",
+                       help="Report managed paths whose owner, group or mode drifted, without changing anything")
+    parser.add_argument("--incremental", action="store_true",
+                       help="With --audit-permissions: re-list only directories whose mtime changed since the last audit")
+    parser.add_argument("--prune-missing", action="store_true",
+                       help="With --audit-permissions: drop indexed paths that no longer exist from the permission index")
+    parser.add_argument("--trace", metavar="PATH",
+                       help="Record step/module timings and write a Chrome trace-event JSON file to PATH")
+
+    # Daemon mode
+    parser.add_argument("--daemon", action="store_true",
+                       help="Stay resident: run updates on a timer and accept commands on a UNIX socket")
+    parser.add_argument("--daemon-socket", default=DEFAULT_SOCKET_PATH, metavar="PATH",
+                       help=f"Control socket of the daemon (default: {DEFAULT_SOCKET_PATH})")
+    parser.add_argument("--daemon-interval", type=float, default=None, metavar="SECONDS",
+                       help="Seconds between scheduled daemon runs, 0 to disable (default: metadata.daemon_interval or 86400)")
+    parser.add_argument("--daemon-command", choices=["status", "check", "run"],
+                       help="Send a command to a running daemon and print its JSON response")
+    parser.add_argument("--no-wait", action="store_true",
+                       help="With --daemon-command run/check: return once the job has started")
     
     args = parser.parse_args()
     
     try:
         # Initialize global logging system FIRST
         setup_global_update_logging()
+        if args.trace:
+            enable_tracing()
         
+        # Daemon client/server
+        if args.daemon_command:
+            try:
+                response = send_daemon_command(args.daemon_socket, args.daemon_command, wait=not args.no_wait)
+            except OSError as e:
+                log_message(f"Cannot reach updater daemon at {args.daemon_socket}: {e}", "ERROR")
+                sys.exit(1)
+            print(json.dumps(response, indent=2, default=str))
+            sys.exit(0 if response.get("success") else 1)
+
+        elif args.daemon:
+            success = run_daemon(args)
+            sys.exit(0 if success else 1)
+
         # Handle module management operations first
-        if args.enable_module:
+        elif args.enable_module:
             success = enable_module(args.modules_path, args.enable_module)
             sys.exit(0 if success else 1)
         
@@ -1524,6 +2044,10 @@ def main():
         elif args.all_status:
             success = get_module_status(args.modules_path)
             sys.exit(0 if success else 1)
+
+        elif args.audit_permissions:
+            success = audit_permissions_report(incremental=args.incremental, prune_missing=args.prune_missing)
+            sys.exit(0 if success else 1)
         
         # Handle update operations
         elif args.legacy:
@@ -1543,174 +2067,10 @@ def main():
             
             # Run new schema-based system
             if args.check_only:
-                log_message("Check-only mode: detecting updates without applying...")
-                
-                # Step 0: Check orchestrator update first
-                orchestrator_update_available = False
-                # Use repository URL from metadata for check-only mode
-                check_repo_url = global_index.get("metadata", {}).get("repository_url", args.repo_url)
-                with repo_sync_lock(args.local_repo):
-                    if not sync_from_repo(check_repo_url, args.local_repo, args.branch):
-                        log_message("Failed to sync repository for orchestrator check", "ERROR")
-                        return
-                    orchestrator_needs_update = check_orchestrator_update(args.modules_path, args.local_repo)
-                    if orchestrator_needs_update:
-                        orchestrator_update_available = True
-                        log_message("Orchestrator update available")
-                    else:
-                        log_message("Orchestrator is up to date")
-                    # Step 1: Schema-level check (needs same clone as sync)
-                    repo_modules_path = os.path.join(args.local_repo, "modules")
-                    if not os.path.exists(repo_modules_path):
-                        repo_modules_path = args.local_repo
-                    modules_to_update = detect_module_updates(args.modules_path, repo_modules_path)
-
-                schema_updates_available = modules_to_update
-                
-                if modules_to_update:
-                    log_message("Schema updates available:")
-                    for module in modules_to_update:
-                        log_message(f"  - {module} (schema update needed)")
-                else:
-                    log_message("All module schemas are up to date")
-                
-                # Step 2: Content updates check (OS and Website modules)
-                log_message("Checking enabled modules for content updates...")
-                enabled_modules = get_enabled_modules(args.modules_path)
-                content_updates_available = []
-                
-                # Check OS module for package updates
-                if "os" in enabled_modules:
-                    try:
-                        # Import and run the OS module's check functionality
-                        from . import run_updateL
-                        check_result = run_update("modules.os", ["--check"])
-                        
-                        if isinstance(check_result, dict) and check_result.get("upgradable", 0) > 0:
-                            count = check_result.get("upgradable", 0)
-                            log_message(f"  - OS module: {count} packages available for upgrade")
-                            content_updates_available.append({
-                                "module": "os",
-                                "count": count,
-                                "details": check_result
-                            })
-                        else:
-                            log_message("  - OS module: No package updates available")
-                            
-                    except Exception as e:
-                        log_message(f"  - OS module check failed: {e}", "WARNING")
-                else:
-                    log_message("  - OS module not enabled, skipping package check")
-                
-                # Check Website module for content updates
-                if "website" in enabled_modules:
-                    try:
-                        # Import and run the Website module's check functionality
-                        from . import run_update
-                        check_result = run_update("modules.website", ["--check"])
-                        
-                        if isinstance(check_result, dict):
-                            if check_result.get("website_update_available", False):
-                                log_message("  - Website module: Content update available")
-                                content_updates_available.append({
-                                    "module": "website",
-                                    "count": 1,
-                                    "details": check_result
-                                })
-                            elif check_result.get("tab_updates_available", False):
-                                tab_count = check_result.get("details", {}).get("premium_tabs", {}).get("tabs_needing_updates", 0)
-                                log_message(f"  - Website module: {tab_count} premium tab updates available")
-                                content_updates_available.append({
-                                    "module": "website",
-                                    "count": tab_count,
-                                    "details": check_result
-                                })
-                            else:
-                                log_message("  - Website module: No content updates available")
-                        else:
-                            log_message("  - Website module: No content updates available")
-                            
-                    except Exception as e:
-                        log_message(f"  - Website module check failed: {e}", "WARNING")
-                else:
-                    log_message("  - Website module not enabled, skipping content check")
-                
-                # Check Sbin module for content updates
-                if "sbin" in enabled_modules:
-                    try:
-                        # Import and run the Sbin module's check functionality
-                        from . import run_update
-                        check_result = run_update("modules.sbin", ["--check"])
-                        
-                        if isinstance(check_result, dict):
-                            if check_result.get("updated", False):
-                                log_message("  - Sbin module: Content update available")
-                                content_updates_available.append({
-                                    "module": "sbin",
-                                    "count": 1,
-                                    "details": check_result
-                                })
-                            else:
-                                log_message("  - Sbin module: No content updates available")
-                        else:
-                            log_message("  - Sbin module: No content updates available")
-                            
-                    except Exception as e:
-                        log_message(f"  - Sbin module check failed: {e}", "WARNING")
-                else:
-                    log_message("  - Sbin module not enabled, skipping content check")
-                
-                # Check Migrations module for pending migrations
-                if "migrations" in enabled_modules:
-                    try:
-                        # Import and run the Migrations module's check functionality
-                        from . import run_update
-                        check_result = run_update("modules.migrations", ["--check"])
-                        
-                        if isinstance(check_result, dict):
-                            pending_count = check_result.get("pending_migrations", 0)
-                            if pending_count > 0:
-                                log_message(f"  - Migrations module: {pending_count} pending migrations")
-                                content_updates_available.append({
-                                    "module": "migrations",
-                                    "count": pending_count,
-                                    "details": check_result
-                                })
-                            else:
-                                log_message("  - Migrations module: No pending migrations")
-                        else:
-                            log_message("  - Migrations module: No pending migrations")
-                            
-                    except Exception as e:
-                        log_message(f"  - Migrations module check failed: {e}", "WARNING")
-                else:
-                    log_message("  - Migrations module not enabled, skipping migration check")
-                
-                # Summary
-                log_message("Check summary:")
-                if orchestrator_update_available:
-                    log_message("  - Orchestrator update available")
-                if schema_updates_available:
-                    log_message(f"  - Schema updates: {len(schema_updates_available)} modules")
-                if content_updates_available:
-                    total_content_items = sum(item["count"] for item in content_updates_available)
-                    log_message(f"  - Content updates: {total_content_items} items across {len(content_updates_available)} modules")
-                
-                if not orchestrator_update_available and not schema_updates_available and not content_updates_available:
-                    log_message("  - No updates available")
-                else:
-                    log_message("  - Updates are available - run without --check to apply them")
+                check_for_updates(args.repo_url, args.local_repo, args.modules_path, args.branch)
             else:
                 # Full update process
-                if sys.version_info >= (3, 7):
-                    results = asyncio.run(run_schema_based_updates(
-                        args.repo_url, args.local_repo, args.modules_path, args.branch
-                    ))
-                else:
-                    loop = asyncio.get_event_loop()
-                    results = loop.run_until_complete(run_schema_based_updates(
-                        args.repo_url, args.local_repo, args.modules_path, args.branch
-                    ))
+                results = run_updates_blocking(args.repo_url, args.local_repo, args.modules_path, args.branch)
                 
                 # Check if orchestrator was restarted (successful completion)
                 if results.get("orchestrator_restarted"):
@@ -1752,6 +2112,11 @@ def main():
         import traceback
         traceback.print_exc()
         sys.exit(1)
+    finally:
+        tracer = get_tracer()
+        if tracer is not None and args.trace:
+            tracer.log_summary()
+            tracer.write_chrome_trace(args.trace)
 
 if __name__ == "__main__":
     main()
@@ -21,9 +21,9 @@ import json
 import shutil
 import tempfile
 import subprocess
-import requests
 from pathlib import Path
 from updates.utils.state_manager import StateManager
+from updates.utils.http_session import get_http_session
 
 
 def load_config():
@@ -43,7 +43,7 @@ def log(msg):
 
 def download_file(url, dest):
     try:
-        r = requests.get(url, timeout=30)
+        r = get_http_session().get(url, timeout=30)
         r.raise_for_status()
         with open(dest, "wb") as f:
             f.write(r.content)
@@ -525,13 +525,14 @@ def verify_atuin_installation(admin_user):
     
     return verification_results
 
-def restore_atuin_permissions(admin_user):
+def restore_atuin_permissions(admin_user, defer=False):
     """
     Restore proper ownership and permissions for atuin files and directories.
     This is critical after updates that run as root to prevent access issues.
     
     Args:
         admin_user: The admin username for path resolution
+        defer: Register the targets in the run-wide permission plan instead of applying them now
         
     Returns:
         bool: True if permissions were restored successfully, False otherwise
@@ -590,7 +591,7 @@ def restore_atuin_permissions(admin_user):
                     ))
         
         # Apply all permission targets
-        success = permission_manager.set_permissions(targets)
+        success = permission_manager.set_permissions(targets, defer=defer)
         
         if success:
             log_message("✓ Successfully restored atuin permissions")
@@ -752,7 +753,7 @@ def main(args=None):
                 
                 # Restore permissions after successful update
                 log_message("Ensuring proper permissions after update...")
-                restore_atuin_permissions(admin_user)
+                restore_atuin_permissions(admin_user, defer=True)
                 
                 return {
                     "success": True, 
@@ -174,11 +174,14 @@ def verify_filebrowser_installation():
     
     return verification_results
 
-def restore_filebrowser_permissions():
+def restore_filebrowser_permissions(defer=False):
     """
     Restore proper ownership and permissions for filebrowser files and directories.
     This is critical after updates that run as root to prevent service failures.
     
+    Args:
+        defer: Register the targets in the run-wide permission plan instead of applying them now
+        
     Returns:
         bool: True if permissions were restored successfully, False otherwise
     """
@@ -221,7 +224,7 @@ def restore_filebrowser_permissions():
                     recursive=True
                 ))
         
-        success = permission_manager.set_permissions(targets)
+        success = permission_manager.set_permissions(targets, defer=defer)
         
         if success:
             log_message("Successfully restored filebrowser permissions")
@@ -384,7 +387,7 @@ def main(args=None):
                     raise Exception("Post-update verification failed - installation appears incomplete")
                 
                 # Restore permissions
-                if not restore_filebrowser_permissions():
+                if not restore_filebrowser_permissions(defer=True):
                     log_message("Warning: Failed to restore filebrowser permissions", "WARNING")
                 
                 return {
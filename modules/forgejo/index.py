@@ -106,8 +106,8 @@ def get_forgejo_version() -> Optional[str]:
         return None
 
 
-def restore_forgejo_permissions() -> bool:
-    """Restore ownership/permissions for Forgejo paths."""
+def restore_forgejo_permissions(defer: bool = False) -> bool:
+    """Restore ownership/permissions for Forgejo paths (defer: add them to the run-wide plan)."""
     try:
         cfg = MODULE_CONFIG["config"]
         owner = cfg.get("permissions", {}).get("owner", "git")
@@ -123,7 +123,7 @@ def restore_forgejo_permissions() -> bool:
         if not targets:
             return True
         pm = PermissionManager("forgejo")
-        return pm.set_permissions(targets)
+        return pm.set_permissions(targets, defer=defer)
     except Exception as e:
         log_message(f"Permission restoration failed: {e}", "ERROR")
         return False
@@ -253,12 +253,12 @@ def main(args=None):
     latest_version = get_latest_forgejo_version()
     if not latest_version:
         log_message("Could not determine latest Forgejo version; skipping update", "WARNING")
-        restore_forgejo_permissions()
+        restore_forgejo_permissions(defer=True)
         return {"success": True, "updated": False, "version": current_version}
 
     if _compare_versions(current_version, latest_version) >= 0:
         log_message(f"Forgejo already at latest version ({current_version})")
-        restore_forgejo_permissions()
+        restore_forgejo_permissions(defer=True)
         return {"success": True, "updated": False, "version": current_version}
 
     log_message(f"Update available: {current_version} -> {latest_version}")
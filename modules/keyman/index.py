@@ -4,7 +4,6 @@ Keyman Module - Manage /vault/keyman credential tools via manifest
 """
 import os
 import json
-import hashlib
 import shutil
 import tempfile
 from pathlib import Path
@@ -13,17 +12,12 @@ import subprocess
 from typing import Dict, Any, List, Tuple, Optional
 from updates.index import log_message
 from updates.utils.state_manager import StateManager
+from updates.utils.checksum import file_sha256
 from updates.utils.permissions import PermissionManager, PermissionTarget, get_permissions
 
 
 def sha256(path: Path) -> str:
-    if not path.exists() or not path.is_file():
-        return ""
-    h = hashlib.sha256()
-    with path.open('rb') as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    return file_sha256(path)
 
 
 def load_config(module_dir: Path) -> Dict[str, Any]:
@@ -252,9 +246,11 @@ def apply(module_dir: Path) -> Dict[str, Any]:
             shutil.copyfile(source, tmp.name)
             tmp_path = Path(tmp.name)
         
-        # Set perms before swap
-        perm_mgr.set_permissions([PermissionTarget(tmp_path.as_posix(), entry.get('owner','root'), entry.get('group','root'), int(entry.get('mode','700'),8))])
+        # Set perms before swap; the audit index records the final path, not the temp file
+        target = PermissionTarget(tmp_path.as_posix(), entry.get('owner','root'), entry.get('group','root'), int(entry.get('mode','700'),8))
+        perm_mgr.set_permissions([target], record=False)
         os.replace(tmp_path, dest)
+        perm_mgr.record_permissions([PermissionTarget(dest.as_posix(), target.owner, target.group, target.mode)])
         changed.append(str(dest))
         log_message(f"Updated keyman tool: {dest}")
 
@@ -28,6 +28,7 @@ from pathlib import Path
 from updates.index import log_message
 from updates.utils.state_manager import StateManager
 from updates.utils.permissions import PermissionManager, PermissionTarget
+from updates.utils.service_state import run_systemctl, is_service_active as _cached_is_active
 from typing import Tuple, Dict, Any
 
 # Load module configuration
@@ -532,22 +533,18 @@ def verify_mkdocs_installation():
         verification["version"] = get_current_mkdocs_version()
         verification["theme_version"] = get_current_material_theme_version()
         verification["pip_installed"] = verification["version"] is not None
-        verification["service_active"] = is_service_active("mkdocs")
+        verification["service_active"] = is_service_active("mkdocs", fresh=True)
         verification["docs_version"] = get_current_docs_version()
     except:
         pass
     return verification
 
-def is_service_active(service):
-    try:
-        result = subprocess.run(["systemctl", "is-active", "--quiet", service])
-        return result.returncode == 0
-    except:
-        return False
+def is_service_active(service, fresh=False):
+    return _cached_is_active(service, fresh=fresh)
 
 def systemctl(action, service="mkdocs"):
     try:
-        result = subprocess.run(["systemctl", action, service], capture_output=True, text=True)
+        result = run_systemctl(action, service)
         return result.returncode == 0
     except:
         return False
@@ -27,6 +27,7 @@ import urllib.request
 from updates.index import log_message
 from updates.utils.state_manager import StateManager
 from updates.utils.permissions import PermissionManager, PermissionTarget
+from updates.utils.service_state import run_systemctl, is_service_active as _cached_is_active
 from updates.utils.moduleUtils import conditional_config_return
 
 
@@ -100,7 +101,7 @@ def get_installation_config():
 def systemctl(action, service="navidrome"):
     """Execute systemctl command for a service."""
     try:
-        result = subprocess.run(["systemctl", action, service], capture_output=True, text=True)
+        result = run_systemctl(action, service)
         if result.returncode != 0:
             log_message(f"systemctl {action} {service} failed: {result.stderr}", "ERROR")
             return False
@@ -109,13 +110,9 @@ def systemctl(action, service="navidrome"):
         log_message(f"systemctl {action} {service} error: {e}", "ERROR")
         return False
 
-def is_service_active(service="navidrome"):
-    """Check if a systemd service is active."""
-    try:
-        result = subprocess.run(["systemctl", "is-active", "--quiet", service])
-        return result.returncode == 0
-    except Exception:
-        return False
+def is_service_active(service="navidrome", fresh=False):
+    """Check if a systemd service is active (fresh=True bypasses the state cache)."""
+    return _cached_is_active(service, fresh=fresh)
 
 # --- Version helpers ---
 def get_current_version():
@@ -231,11 +228,14 @@ def install_navidrome(version):
         log_message(f"Error during Navidrome installation: {str(e)}", "ERROR")
         return False
 
-def restore_navidrome_permissions():
+def restore_navidrome_permissions(defer=False):
     """
     Restore proper ownership and permissions for navidrome files and directories.
     This is critical after updates that run as root to prevent service failures.
     
+    Args:
+        defer: Register the targets in the run-wide permission plan instead of applying them now
+        
     Returns:
         bool: True if permissions were restored successfully, False otherwise
     """
@@ -285,7 +285,7 @@ def restore_navidrome_permissions():
                 ))
         
         # Apply all permission targets
-        success = permission_manager.set_permissions(targets)
+        success = permission_manager.set_permissions(targets, defer=defer)
         
         if success:
             log_message("✓ Successfully restored navidrome permissions")
@@ -339,7 +339,7 @@ def verify_navidrome_installation():
         verification_results["data_dir_exists"] = os.path.exists(data_dir)
         
         # Check service status
-        verification_results["service_active"] = is_service_active()
+        verification_results["service_active"] = is_service_active(fresh=True)
         
         # Log verification results
         for check, result in verification_results.items():
@@ -509,7 +509,7 @@ def main(args=None):
                 
                 # Restore permissions after successful update
                 log_message("Ensuring proper permissions after update...")
-                restore_navidrome_permissions()
+                restore_navidrome_permissions(defer=True)
                 
                 result = {
                     "success": True, 
@@ -185,11 +185,14 @@ def get_latest_version():
         log_message(f"Failed to get latest version info: {e}", "ERROR")
         return None
 
-def restore_ohmyposh_permissions():
+def restore_ohmyposh_permissions(defer=False):
     """
     Restore proper ownership and permissions for oh-my-posh files and directories.
     This is critical after updates that run as root to prevent access issues.
     
+    Args:
+        defer: Register the targets in the run-wide permission plan instead of applying them now
+        
     Returns:
         bool: True if permissions were restored successfully, False otherwise
     """
@@ -233,7 +236,7 @@ def restore_ohmyposh_permissions():
                 ))
         
         # Apply all permission targets
-        success = permission_manager.set_permissions(targets)
+        success = permission_manager.set_permissions(targets, defer=defer)
         
         if success:
             log_message("✓ Successfully restored oh-my-posh permissions")
@@ -553,7 +556,7 @@ def main(args=None):
                 
                 # Restore permissions after successful update
                 log_message("Ensuring proper permissions after update...")
-                restore_ohmyposh_permissions()
+                restore_ohmyposh_permissions(defer=True)
                 
                 return conditional_config_return({
                     "success": True, 
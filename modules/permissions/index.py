@@ -5,7 +5,6 @@ permissions Module - Manage /etc/sudoers.d flask-* files
 import os
 import re
 import json
-import hashlib
 import shutil
 import subprocess
 import tempfile
@@ -15,18 +14,13 @@ import subprocess
 from typing import Dict, Any, List, Tuple, Optional
 from updates.index import log_message
 from updates.utils.state_manager import StateManager
+from updates.utils.checksum import file_sha256
 from updates.utils.permissions import PermissionManager, PermissionTarget, get_permissions
 from updates.utils.moduleUtils import conditional_config_return
 
 
 def sha256(path: Path) -> str:
-    if not path.exists() or not path.is_file():
-        return ""
-    h = hashlib.sha256()
-    with path.open('rb') as f:
-        for chunk in iter(lambda: f.read(8192), b""):
-            h.update(chunk)
-    return h.hexdigest()
+    return file_sha256(path)
 
 
 def load_config(module_dir: Path) -> Dict[str, Any]:
@@ -344,9 +338,11 @@ def apply(module_dir: Path) -> Dict[str, Any]:
                 
                 return result
 
-            # set perms on temp and swap
-            perm_mgr.set_permissions([PermissionTarget(tmp_path.as_posix(), p.get('owner','root'), p.get('group','root'), int(p.get('mode','440'),8))])
+            # set perms on temp and swap; the audit index records the final path, not the temp file
+            target = PermissionTarget(tmp_path.as_posix(), p.get('owner','root'), p.get('group','root'), int(p.get('mode','440'),8))
+            perm_mgr.set_permissions([target], record=False)
             os.replace(tmp_path, dest)
+            perm_mgr.record_permissions([PermissionTarget(dest.as_posix(), target.owner, target.group, target.mode)])
             changed.append(str(dest))
             log_message(f"Updated sudoers policy: {dest}")
     else:
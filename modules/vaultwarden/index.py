@@ -29,6 +29,7 @@ from pathlib import Path
 
 from updates.utils.state_manager import StateManager
 from updates.utils.permissions import PermissionManager, PermissionTarget
+from updates.utils.service_state import run_systemctl, is_service_active as _cached_is_active
 from updates.utils.moduleUtils import conditional_config_return
 
 def log_message(message, level="INFO"):
@@ -160,7 +161,7 @@ def get_all_vaultwarden_paths():
 def systemctl(action, service):
     """Execute systemctl command for service management."""
     try:
-        result = subprocess.run(["systemctl", action, service], capture_output=True, text=True)
+        result = run_systemctl(action, service)
         if result.returncode != 0:
             log_message(f"systemctl {action} {service} failed: {result.stderr}", "ERROR")
             return False
@@ -169,13 +170,9 @@ def systemctl(action, service):
         log_message(f"systemctl {action} {service} error: {e}", "ERROR")
         return False
 
-def is_service_active(service):
-    """Check if a systemd service is active."""
-    try:
-        result = subprocess.run(["systemctl", "is-active", "--quiet", service])
-        return result.returncode == 0
-    except Exception:
-        return False
+def is_service_active(service, fresh=False):
+    """Check if a systemd service is active (fresh=True bypasses the state cache)."""
+    return _cached_is_active(service, fresh=fresh)
 
 # --- Version helpers ---
 def get_current_version():
@@ -412,7 +409,7 @@ def update_vaultwarden():
                 systemctl("stop", service_name)
                 # Wait for service to stop
                 for i in range(5):
-                    if not is_service_active(service_name):
+                    if not is_service_active(service_name, fresh=True):
                         break
                     time.sleep(1)
                 else:
@@ -463,11 +460,14 @@ def update_vaultwarden():
         log_message(f"Error during Vaultwarden update: {e}", "ERROR")
         return False
 
-def restore_vaultwarden_permissions():
+def restore_vaultwarden_permissions(defer=False):
     """
     Restore proper ownership and permissions for vaultwarden files and directories.
     This is critical after updates that run as root to prevent service failures.
     
+    Args:
+        defer: Register the targets in the run-wide permission plan instead of applying them now
+        
     Returns:
         bool: True if permissions were restored successfully, False otherwise
     """
@@ -521,7 +521,7 @@ def restore_vaultwarden_permissions():
                 ))
         
         # Apply all permission targets
-        success = permission_manager.set_permissions(targets)
+        success = permission_manager.set_permissions(targets, defer=defer)
         
         if success:
             log_message("✓ Successfully restored vaultwarden permissions")
@@ -577,7 +577,7 @@ def verify_vaultwarden_installation():
         log_message(f"Web vault exists: {verification_results['web_vault_exists']}")
         
         # Check service is active
-        verification_results["service_active"] = is_service_active(service_name)
+        verification_results["service_active"] = is_service_active(service_name, fresh=True)
         log_message(f"Service active: {verification_results['service_active']}")
         
     except Exception as e:
@@ -693,7 +693,7 @@ def main(args=None):
         # Wait for service to actually stop
         log_message("Waiting for service to stop...")
         for i in range(10):  # Wait up to 10 seconds
-            if not is_service_active(SERVICE_NAME):
+            if not is_service_active(SERVICE_NAME, fresh=True):
                 log_message("Service stopped successfully")
                 break
             time.sleep(1)
@@ -742,7 +742,7 @@ def main(args=None):
                 
                 # Restore permissions after successful update
                 log_message("Ensuring proper permissions after update...")
-                restore_vaultwarden_permissions()
+                restore_vaultwarden_permissions(defer=True)
                 
                 return conditional_config_return(
                     {"success": True, "updated": True, "old_version": current_version, "new_version": new_version, "verification": verification},
@@ -21,7 +21,6 @@ from pathlib import Path
 import subprocess
 import json
 import sys
-import hashlib
 import shutil
 
 # Handle imports for both direct execution and module execution
@@ -29,6 +28,7 @@ try:
     from updates.index import log_message
     from updates.utils.state_manager import StateManager
     from updates.utils.moduleUtils import conditional_config_return
+    from updates.utils.checksum import file_sha256
 except ImportError:
     # Add parent directory to path for direct execution
     parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -38,6 +38,7 @@ except ImportError:
         from updates.index import log_message
         from updates.utils.state_manager import StateManager
         from updates.utils.moduleUtils import conditional_config_return
+        from updates.utils.checksum import file_sha256
     except ImportError:
         # Fallback: try adding the current directory to path
         current_dir = os.path.abspath(os.path.dirname(__file__))
@@ -47,6 +48,7 @@ except ImportError:
         from updates.index import log_message
         from updates.utils.state_manager import StateManager
         from updates.utils.moduleUtils import conditional_config_return
+        from updates.utils.checksum import file_sha256
 
 # Load module configuration from index.json
 def load_module_config():
@@ -94,11 +96,11 @@ def calculate_file_sha256(file_path):
         if not os.path.exists(file_path):
             return None
         
-        hash_sha256 = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_sha256.update(chunk)
-        return hash_sha256.hexdigest()
+        digest = file_sha256(file_path)
+        if not digest:
+            log_message(f"Failed to calculate SHA256 for {file_path}: not a readable file", "ERROR")
+            return None
+        return digest
     except Exception as e:
         log_message(f"Failed to calculate SHA256 for {file_path}: {e}", "ERROR")
         return None
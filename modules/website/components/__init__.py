@@ -7,6 +7,7 @@ Component-based website update system for better modularity and maintainability.
 
 from .git_operations import GitOperations
 from .file_operations import FileOperations
+from .file_sync import SyncChangeset, sync_tree
 from .build_manager import BuildManager
 from .premium_tab_checker import PremiumTabChecker
 from .backup_manager import BackupManager
@@ -16,6 +17,8 @@ from .tab_updater import TabUpdater
 __all__ = [
     'GitOperations', 
     'FileOperations', 
+    'SyncChangeset',
+    'sync_tree',
     'BuildManager', 
     'PremiumTabChecker', 
     'BackupManager',
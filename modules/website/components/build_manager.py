@@ -9,13 +9,36 @@ Handles all build and service management operations for the website update syste
 - Service stop/start/restart operations
 - Build validation and cleanup
 - Service health checks
+- Skipping install/build steps whose inputs a file update did not change
+- Content fingerprints of npm install and build inputs, with previous build/
+  outputs kept in a small LRU so an unchanged or re-applied tree is not rebuilt
 """
 
 import os
-import subprocess
+import json
 import time
-from typing import Dict, Any, List
+import shutil
+import hashlib
+import subprocess
+from pathlib import Path
+from typing import Dict, Any, List, Optional
 from updates.index import log_message
+from updates.utils.checksum import file_sha256, tree_digest
+from updates.utils.backup_index import write_json_atomic
+from .file_sync import SyncChangeset
+
+# Paths (relative to base_dir) whose changes require each step to run again
+PIP_INPUTS = ['requirements.txt']
+NPM_INSTALL_INPUTS = ['package.json', 'package-lock.json']
+NPM_BUILD_INPUTS = ['src', 'public', 'package.json', 'package-lock.json', 'tsconfig.json', 'vite.config.ts', 'index.html']
+
+# Rewritten by the backend at runtime and after every build (version metadata), never a build input
+BUILD_FINGERPRINT_EXCLUDE = {os.path.join('src', 'config', 'homeserver.json')}
+DEFAULT_BUILD_CACHE_DIR = '/var/cache/homeserver/website/builds'
+DEFAULT_BUILD_CACHE_SIZE = 3
+# Written into build/ with the fingerprint of the inputs it was built from, so the
+# marker travels with the output through cache restores, backups and rollbacks
+BUILD_FINGERPRINT_MARKER = '.inputs-sha256'
 
 
 class BuildManager:
@@ -28,11 +51,18 @@ class BuildManager:
         # New behavior: do not stop services mid-run to avoid self-termination; restart at the end
         self.stop_services_before_build = bool(build_cfg.get('stopServices', False))
         self.restart_service_at_end = bool(build_cfg.get('restartServiceAtEnd', True))
+        # Previous build/ outputs kept by fingerprint (0 = keep none)
+        self.build_cache_dir = build_cfg.get('buildCacheDir', DEFAULT_BUILD_CACHE_DIR)
+        self.build_cache_size = int(build_cfg.get('buildCacheSize', DEFAULT_BUILD_CACHE_SIZE))
         
-    def run_build_process(self) -> bool:
+    def run_build_process(self, changeset: Optional[SyncChangeset] = None) -> bool:
         """
         Run the complete build process including pip install, NPM install, build, and service restart.
         
+        Args:
+            changeset: What the file update changed; install/build steps whose inputs it did
+                       not touch are skipped (None runs every step)
+        
         Returns:
             bool: True if build completed successfully, False otherwise
         """
@@ -45,16 +75,19 @@ class BuildManager:
                     return False
             
             # Step 2: Install Python dependencies
-            if not self._pip_install():
-                return False
+            if self._step_needed(changeset, "pip install", PIP_INPUTS):
+                if not self._pip_install():
+                    return False
             
-            # Step 3: Install NPM dependencies
-            if not self._npm_install():
-                return False
+            # Step 3: Install NPM dependencies (skipped if package files match the last install)
+            if self._step_needed(changeset, "npm install", NPM_INSTALL_INPUTS, 'node_modules'):
+                if not self._cached_npm_install():
+                    return False
             
-            # Step 4: Build the frontend
-            if not self._npm_build():
-                return False
+            # Step 4: Build the frontend (skipped or restored from cache if its inputs match a previous build)
+            if self._step_needed(changeset, "npm build", NPM_BUILD_INPUTS, 'build'):
+                if not self._cached_npm_build():
+                    return False
             
             # Step 5: Start or restart services
             if not self._start_services():
@@ -71,6 +104,199 @@ class BuildManager:
             log_message(f"[BUILD] ✗ Build process failed: {e}", "ERROR")
             return False
     
+    def _step_needed(self, changeset: Optional[SyncChangeset], step: str, inputs: List[str],
+                     output: Optional[str] = None) -> bool:
+        """True unless changeset shows none of the step's inputs changed and its output exists."""
+        if changeset is None:
+            return True
+        if output and not os.path.exists(os.path.join(self.base_dir, output)):
+            return True
+        if changeset.touches(*(os.path.join(self.base_dir, path) for path in inputs)):
+            return True
+        log_message(f"[BUILD] ✓ Skipping {step} - none of its inputs changed")
+        return False
+    
+    def _install_fingerprint(self) -> Optional[str]:
+        """sha256 over package.json and package-lock.json, or None if package.json is missing."""
+        sha256 = hashlib.sha256()
+        for name in NPM_INSTALL_INPUTS:
+            digest = file_sha256(os.path.join(self.base_dir, name))
+            if name == 'package.json' and not digest:
+                return None
+            sha256.update(f"{name}\0{digest}\n".encode())
+        return sha256.hexdigest()
+    
+    def _installed_premium_tabs(self) -> List[str]:
+        """name@version of every premium tab under premium/ (tabs carry an index.json)."""
+        tabs = []
+        premium_dir = os.path.join(self.base_dir, 'premium')
+        if not os.path.isdir(premium_dir):
+            return tabs
+        for name in sorted(os.listdir(premium_dir)):
+            index_path = os.path.join(premium_dir, name, 'index.json')
+            if name.startswith('.') or not os.path.isfile(index_path):
+                continue
+            try:
+                with open(index_path, 'r') as f:
+                    version = json.load(f).get('version', '')
+            except Exception:
+                version = ''
+            tabs.append(f"{name}@{version}")
+        return tabs
+    
+    def _build_fingerprint(self) -> Optional[str]:
+        """
+        sha256 over every build input (src/, public/, package files, tsconfig, vite config)
+        and the premium tab set, or None if it cannot be computed.
+        """
+        try:
+            sha256 = hashlib.sha256()
+            for name in NPM_BUILD_INPUTS:
+                path = os.path.join(self.base_dir, name)
+                if os.path.isdir(path):
+                    files = tree_digest(path).files
+                    for rel in sorted(files):
+                        if os.path.join(name, rel) not in BUILD_FINGERPRINT_EXCLUDE:
+                            sha256.update(f"{name}/{rel}\0{files[rel]}\n".encode())
+                else:
+                    sha256.update(f"{name}\0{file_sha256(path)}\n".encode())
+            for tab in self._installed_premium_tabs():
+                sha256.update(f"premium\0{tab}\n".encode())
+            return sha256.hexdigest()
+        except Exception as e:
+            log_message(f"[BUILD] ⚠ Could not fingerprint build inputs: {e}", "WARNING")
+            return None
+    
+    def _load_cache_state(self) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.build_cache_dir, 'state.json'), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            log_message(f"[BUILD] ⚠ Ignoring unreadable build cache state: {e}", "WARNING")
+            return {}
+    
+    def _save_cache_state(self, state: Dict[str, Any]) -> None:
+        try:
+            os.makedirs(self.build_cache_dir, exist_ok=True)
+            write_json_atomic(Path(self.build_cache_dir) / 'state.json', state)
+        except OSError as e:
+            log_message(f"[BUILD] ⚠ Could not save build cache state: {e}", "WARNING")
+    
+    def _cached_npm_install(self) -> bool:
+        """Run npm install unless package.json/package-lock.json match the last successful install."""
+        fingerprint = self._install_fingerprint()
+        state = self._load_cache_state()
+        if (fingerprint and state.get('npm_install') == fingerprint
+                and os.path.isdir(os.path.join(self.base_dir, 'node_modules'))):
+            log_message("[BUILD] ✓ Skipping npm install - package files match the last install")
+            return True
+        if not self._npm_install():
+            return False
+        # npm install may rewrite package-lock.json, so record the files as they are now
+        state = self._load_cache_state()
+        state['npm_install'] = self._install_fingerprint()
+        self._save_cache_state(state)
+        return True
+    
+    def _cached_npm_build(self) -> bool:
+        """Build unless build/ already matches the inputs; reuse a cached build/ for known inputs."""
+        fingerprint = self._build_fingerprint()
+        if fingerprint is None:
+            return self._npm_build()
+        
+        state = self._load_cache_state()
+        if self._read_build_marker() == fingerprint:
+            log_message("[BUILD] ✓ Skipping npm build - build/ already matches its inputs")
+            self._touch_cached_build(state, fingerprint)
+            return True
+        if self._restore_cached_build(state, fingerprint):
+            return True
+        
+        # A failed or interrupted build must not leave the previous marker behind
+        self._write_build_marker(None)
+        if not self._npm_build():
+            return False
+        self._write_build_marker(fingerprint)
+        self._store_build(fingerprint)
+        return True
+    
+    def _read_build_marker(self) -> Optional[str]:
+        """Fingerprint recorded in build/, or None if build/ or its marker is missing."""
+        try:
+            with open(os.path.join(self.base_dir, 'build', BUILD_FINGERPRINT_MARKER), 'r') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+    
+    def _write_build_marker(self, fingerprint: Optional[str]) -> None:
+        """Record the fingerprint build/ was built from (None removes the marker)."""
+        marker = os.path.join(self.base_dir, 'build', BUILD_FINGERPRINT_MARKER)
+        try:
+            if fingerprint is None:
+                if os.path.lexists(marker):
+                    os.unlink(marker)
+            elif os.path.isdir(os.path.dirname(marker)):
+                with open(marker, 'w') as f:
+                    f.write(f"{fingerprint}\n")
+        except OSError as e:
+            log_message(f"[BUILD] ⚠ Could not update build fingerprint marker: {e}", "WARNING")
+    
+    def _touch_cached_build(self, state: Dict[str, Any], fingerprint: str) -> None:
+        """Mark a cached build as the most recently used."""
+        if fingerprint in state.get('builds', {}):
+            state['builds'][fingerprint]['last_used'] = time.time()
+        self._save_cache_state(state)
+    
+    def _restore_cached_build(self, state: Dict[str, Any], fingerprint: str) -> bool:
+        """Swap a cached build/ for these inputs into place. Returns False if there is none."""
+        cached = os.path.join(self.build_cache_dir, fingerprint)
+        if fingerprint not in state.get('builds', {}) or not os.path.isdir(cached):
+            return False
+        build_dir = os.path.join(self.base_dir, 'build')
+        staging = f"{build_dir}.cached-{os.getpid()}"
+        old = f"{build_dir}.old-{os.getpid()}"
+        try:
+            shutil.copytree(cached, staging, symlinks=True)
+            if os.path.exists(build_dir):
+                os.rename(build_dir, old)
+            os.rename(staging, build_dir)
+            shutil.rmtree(old, ignore_errors=True)
+        except OSError as e:
+            log_message(f"[BUILD] ⚠ Could not restore cached build {fingerprint[:12]}: {e}", "WARNING")
+            if not os.path.exists(build_dir) and os.path.exists(old):
+                os.rename(old, build_dir)
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
+        self._write_build_marker(fingerprint)
+        self._touch_cached_build(state, fingerprint)
+        log_message(f"[BUILD] ✓ Restored build/ from cache ({fingerprint[:12]}) instead of rebuilding")
+        return True
+    
+    def _store_build(self, fingerprint: str) -> None:
+        """Keep a copy of the fresh build/ under its fingerprint and evict the least recently used."""
+        state = self._load_cache_state()
+        builds = state.setdefault('builds', {})
+        if self.build_cache_size > 0:
+            cached = os.path.join(self.build_cache_dir, fingerprint)
+            staging = f"{cached}.tmp"
+            try:
+                os.makedirs(self.build_cache_dir, exist_ok=True)
+                shutil.rmtree(staging, ignore_errors=True)
+                shutil.copytree(os.path.join(self.base_dir, 'build'), staging, symlinks=True)
+                shutil.rmtree(cached, ignore_errors=True)
+                os.rename(staging, cached)
+                builds[fingerprint] = {'last_used': time.time()}
+            except OSError as e:
+                log_message(f"[BUILD] ⚠ Could not cache build output: {e}", "WARNING")
+                shutil.rmtree(staging, ignore_errors=True)
+        
+        for old in sorted(builds, key=lambda fp: builds[fp].get('last_used', 0))[:max(0, len(builds) - self.build_cache_size)]:
+            shutil.rmtree(os.path.join(self.build_cache_dir, old), ignore_errors=True)
+            del builds[old]
+        self._save_cache_state(state)
+    
     def _stop_services(self) -> bool:
         """Stop relevant services before build."""
         services_to_stop = ['gunicorn.service']
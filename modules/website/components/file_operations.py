@@ -6,16 +6,16 @@ File Operations Component
 
 Handles all file copying and synchronization operations for the website update system including:
 - Safe non-destructive src directory updates
-- Component-based file copying 
+- Component-based delta sync (only changed files are copied, see file_sync.py)
 - Configuration preservation
 - Detailed operation logging
 """
 
 import os
-import shutil
 import subprocess
 from typing import Dict, Any
 from updates.index import log_message
+from .file_sync import SyncChangeset, sync_tree
 
 
 class FileOperations:
@@ -24,6 +24,8 @@ class FileOperations:
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.target_paths = config.get('config', {}).get('target_paths', {})
+        # Everything the last update_components() call changed, for the build step
+        self.changeset = SyncChangeset()
         
     def update_components(self, source_dir: str) -> bool:
         """
@@ -36,6 +38,7 @@ class FileOperations:
             bool: True if all components updated successfully, False otherwise
         """
         log_message(f"[FILE] Starting component update from source: {source_dir}")
+        self.changeset = SyncChangeset()
         
         components = self.target_paths.get('components', {})
         log_message(f"[FILE] Found {len(components)} components to process")
@@ -89,12 +92,13 @@ class FileOperations:
                 log_message(f"[FILE] ✗ Failed to update component {component_name}: {e}", "ERROR")
                 return False
         
-        log_message("[FILE] ✓ All enabled components updated successfully")
+        log_message(f"[FILE] ✓ All enabled components updated successfully ({self.changeset.summary()})")
         return True
     
     def _update_standard_component(self, component_name: str, source_path: str, target_path: str) -> None:
         """
-        Update a standard component (non-src) with simple replacement.
+        Update a standard component (non-src) so the target matches the source exactly.
+        Only changed files are copied; files no longer in the source are removed.
         
         Args:
             component_name: Name of the component
@@ -103,26 +107,14 @@ class FileOperations:
         """
         log_message(f"[FILE] Updating standard component: {component_name}")
         
-        # Remove existing target if it exists
-        if os.path.exists(target_path):
-            if os.path.isdir(target_path):
-                shutil.rmtree(target_path)
-            else:
-                os.remove(target_path)
-        
-        # Ensure parent directory exists
-        os.makedirs(os.path.dirname(target_path), exist_ok=True)
-        
-        # Copy new content
-        if os.path.isdir(source_path):
-            shutil.copytree(source_path, target_path)
-            kind = "dir"
-        else:
-            shutil.copy2(source_path, target_path)
-            kind = "file"
+        changes = sync_tree(source_path, target_path, delete=True)
+        self.changeset += changes
+        if changes.failed:
+            raise Exception(f"Could not sync {len(changes.failed)} entries of {component_name}")
         
         # Summarize instead of per-action details
-        log_message(f"[FILE] ✓ Updated component: {component_name} ({kind})")
+        kind = "dir" if os.path.isdir(source_path) else "file"
+        log_message(f"[FILE] ✓ Updated component: {component_name} ({kind}: {changes.summary()})")
     
     def _selective_src_update(self, source_path: str, target_path: str) -> None:
         """
@@ -162,38 +154,16 @@ class FileOperations:
             os.makedirs(target_path, exist_ok=True)
             log_message(f"[FILE_COPY_DEBUG] ✓ Target directory ensured: {target_path}")
             
-            # Copy files from source to target, preserving what we can (quiet summary)
+            # Copy changed files from source to target (quiet summary)
             log_message(f"[FILE] Syncing src directory (quiet)…")
             
-            dirs_created = 0
-            files_copied = 0
-            for root, dirs, files in os.walk(source_path):
-                # Calculate relative path from source
-                rel_path = os.path.relpath(root, source_path)
-                target_dir = target_path if rel_path == '.' else os.path.join(target_path, rel_path)
-
-                # Create target directory if missing
-                if not os.path.exists(target_dir):
-                    os.makedirs(target_dir, exist_ok=True)
-                    dirs_created += 1
-                
-                # Copy files
-                for file in files:
-                    src_file = os.path.join(root, file)
-                    dst_file = os.path.join(target_dir, file)
-                    
-                    # Skip homeserver.json - we'll restore it later
-                    if dst_file == config_path:
-                        continue
-                    
-                    try:
-                        shutil.copy2(src_file, dst_file)
-                        files_copied += 1
-                    except Exception as copy_error:
-                        log_message(f"[FILE] ✗ Failed to copy {src_file}: {copy_error}", "ERROR")
-                        raise
+            # Skip homeserver.json - we'll restore it later
+            changes = sync_tree(source_path, target_path, exclude={config_path})
+            self.changeset += changes
+            if changes.failed:
+                raise Exception(f"Failed to copy {len(changes.failed)} files, first: {changes.failed[0]}")
             
-            log_message(f"[FILE] ✓ File sync completed ({dirs_created} dirs, {files_copied} files)")
+            log_message(f"[FILE] ✓ File sync completed ({changes.summary()})")
             
             # STEP 4: Restore user configuration file
             config_dir = os.path.join(target_path, 'config')
@@ -271,7 +241,9 @@ class FileOperations:
             
             # STEP 2: First clobber - copy all defaults from repository
             log_message("[FILE] First clobber: Copying repository defaults...")
-            self._copy_directory_contents(source_path, target_path)
+            # homeserver.json is restored right after, so don't copy the default over it first
+            exclude = {os.path.join(config_dir, 'homeserver.json')} if config_backup else set()
+            self._copy_directory_contents(source_path, target_path, exclude)
             log_message("[FILE] ✓ Repository defaults copied")
             
             # STEP 3: Second clobber - restore user's config on top
@@ -312,7 +284,7 @@ class FileOperations:
             log_message(f"[FILE] ✗ Clobber-twice src update failed: {e}", "ERROR")
             raise
     
-    def _copy_directory_contents(self, source_path: str, target_path: str) -> None:
+    def _copy_directory_contents(self, source_path: str, target_path: str, exclude=frozenset()) -> None:
         """
         Copy all contents from source to target directory using file-level operations.
         This avoids directory-level operations that can fail with "Device or resource busy".
@@ -321,29 +293,17 @@ class FileOperations:
         os.makedirs(target_path, exist_ok=True)
         
         # Use file-level operations to avoid directory handle issues
-        self._copy_directory_contents_recursive(source_path, target_path)
+        self._copy_directory_contents_recursive(source_path, target_path, exclude)
     
-    def _copy_directory_contents_recursive(self, source_path: str, target_path: str) -> None:
+    def _copy_directory_contents_recursive(self, source_path: str, target_path: str, exclude=frozenset()) -> None:
         """
-        Recursively copy directory contents using file-level operations only.
+        Recursively copy changed files using file-level operations only (no deletes).
         This works around gunicorn directory handle issues.
         """
-        for item in os.listdir(source_path):
-            source_item = os.path.join(source_path, item)
-            target_item = os.path.join(target_path, item)
-            
-            if os.path.isdir(source_item):
-                # Create target directory if it doesn't exist
-                os.makedirs(target_item, exist_ok=True)
-                # Recursively copy directory contents
-                self._copy_directory_contents_recursive(source_item, target_item)
-            else:
-                # Copy individual file - this should work even with gunicorn running
-                try:
-                    shutil.copy2(source_item, target_item)
-                    log_message(f"[FILE] ✓ Copied file: {item}")
-                except Exception as e:
-                    log_message(f"[FILE] ⚠ Warning: Could not copy {item}: {e}", "WARNING")
+        # Copy individual files - this works even with gunicorn running; failures are warnings
+        changes = sync_tree(source_path, target_path, exclude=exclude)
+        self.changeset += changes
+        log_message(f"[FILE] ✓ Copied {os.path.basename(source_path.rstrip('/'))}: {changes.summary()}")
     
     def _is_user_created_theme(self, theme_path: str) -> bool:
         """
@@ -418,17 +378,13 @@ class FileOperations:
                 continue
 
             try:
-                if os.path.isdir(src_item_path):
-                    # For directories (e.g., utils), replace that directory only
-                    if os.path.exists(dst_item_path):
-                        shutil.rmtree(dst_item_path)
-                    shutil.copytree(src_item_path, dst_item_path)
-                    log_message(f"[FILE] ✓ Updated premium core directory: {item}")
-                else:
-                    # For files, copy (overwrite) without touching siblings
-                    os.makedirs(os.path.dirname(dst_item_path), exist_ok=True)
-                    shutil.copy2(src_item_path, dst_item_path)
-                    log_message(f"[FILE] ✓ Updated premium core file: {item}")
+                # Directories (e.g., utils) are mirrored exactly, files overwritten without touching siblings
+                changes = sync_tree(src_item_path, dst_item_path, delete=True)
+                self.changeset += changes
+                if changes.failed:
+                    raise Exception(f"could not sync {len(changes.failed)} entries")
+                kind = "directory" if os.path.isdir(src_item_path) else "file"
+                log_message(f"[FILE] ✓ Updated premium core {kind}: {item} ({changes.summary()})")
             except Exception as e:
                 log_message(f"[FILE] ✗ Failed updating premium core item '{item}': {e}", "ERROR")
                 raise
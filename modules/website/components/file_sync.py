@@ -0,0 +1,194 @@
+"""
+HOMESERVER Website Update Components
+Copyright (C) 2024 HOMESERVER LLC
+
+File Sync Component
+
+rsync-like one-way sync of a source tree into a target tree for FileOperations:
+- files with the same size and mtime are skipped; same size but different mtime
+  (every fresh clone) falls back to comparing sha256, so only real content
+  changes are copied
+- compares and copies run on a thread pool; each copy is a shutil.copy2 onto the
+  target path, the same file-level operation the updater has always used
+- optionally deletes target entries that no longer exist in the source
+- returns a SyncChangeset listing what was added, updated, deleted or only had
+  its mode fixed, which the build step uses to skip work when nothing relevant changed
+"""
+
+import os
+import stat
+import shutil
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import AbstractSet, List, Optional, Tuple
+from updates.index import log_message
+from updates.utils.checksum import file_sha256
+
+DEFAULT_SYNC_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+
+@dataclass
+class SyncChangeset:
+    """Target paths changed by a sync."""
+    added: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    metadata: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    def __iadd__(self, other: "SyncChangeset") -> "SyncChangeset":
+        self.added += other.added
+        self.updated += other.updated
+        self.deleted += other.deleted
+        self.metadata += other.metadata
+        self.failed += other.failed
+        self.unchanged += other.unchanged
+        return self
+
+    @property
+    def changed(self) -> bool:
+        """True if any content was added, updated or deleted."""
+        return bool(self.added or self.updated or self.deleted)
+
+    def paths(self) -> List[str]:
+        return self.added + self.updated + self.deleted
+
+    def touches(self, *prefixes: str) -> bool:
+        """True if content at or below any of the given paths changed."""
+        roots = [prefix.rstrip("/") for prefix in prefixes]
+        return any(path == root or path.startswith(root + "/") for path in self.paths() for root in roots)
+
+    def summary(self) -> str:
+        text = (f"{len(self.added)} added, {len(self.updated)} updated, {len(self.deleted)} deleted, "
+                f"{len(self.metadata)} mode-only, {self.unchanged} unchanged")
+        return f"{text}, {len(self.failed)} failed" if self.failed else text
+
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+def _sync_file(source: str, target: str, source_st: os.stat_result,
+               target_st: Optional[os.stat_result]) -> str:
+    """Bring one regular file up to date. Returns "added", "updated", "metadata" or "unchanged"."""
+    if target_st is not None and stat.S_ISREG(target_st.st_mode) and target_st.st_size == source_st.st_size:
+        same = (target_st.st_mtime_ns == source_st.st_mtime_ns
+                or file_sha256(source, use_cache=False) == file_sha256(target))
+        if same:
+            if stat.S_IMODE(target_st.st_mode) != stat.S_IMODE(source_st.st_mode):
+                os.chmod(target, stat.S_IMODE(source_st.st_mode))
+                return "metadata"
+            return "unchanged"
+    if target_st is not None and not stat.S_ISREG(target_st.st_mode):
+        _remove(target)
+    shutil.copy2(source, target)
+    return "added" if target_st is None else "updated"
+
+
+def _sync_symlink(source: str, target: str, target_st: Optional[os.stat_result]) -> str:
+    link = os.readlink(source)
+    if target_st is not None:
+        if stat.S_ISLNK(target_st.st_mode) and os.readlink(target) == link:
+            return "unchanged"
+        _remove(target)
+    os.symlink(link, target)
+    return "added" if target_st is None else "updated"
+
+
+def _lstat(path: str) -> Optional[os.stat_result]:
+    try:
+        return os.lstat(path)
+    except FileNotFoundError:
+        return None
+
+
+def sync_tree(source: str, target: str, delete: bool = False, exclude: AbstractSet[str] = frozenset(),
+              workers: int = DEFAULT_SYNC_WORKERS) -> SyncChangeset:
+    """
+    Make target match source, copying only files whose content changed.
+
+    Args:
+        source: Source file or directory
+        target: Target file or directory (created if missing)
+        delete: Also remove target entries that are not in source
+        exclude: Target paths never written or deleted (e.g. user configuration)
+        workers: Threads comparing and copying files
+
+    Returns:
+        SyncChangeset: What changed below target; per-file failures are logged and listed in .failed
+    """
+    changes = SyncChangeset()
+    if os.path.realpath(source) == os.path.realpath(target):
+        return changes
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+
+    # Walk the source, creating directories and collecting per-file work
+    files: List[Tuple[str, str, os.stat_result, Optional[os.stat_result]]] = []
+    stale: List[str] = []
+    stack = [(source, target)]
+    while stack:
+        source_path, target_path = stack.pop()
+        if target_path in exclude:
+            continue
+        try:
+            source_st = os.stat(source_path) if source_path == source else os.lstat(source_path)
+            target_st = _lstat(target_path)
+            if stat.S_ISLNK(source_st.st_mode):
+                result = _sync_symlink(source_path, target_path, target_st)
+                if result == "unchanged":
+                    changes.unchanged += 1
+                else:
+                    getattr(changes, result).append(target_path)
+            elif stat.S_ISDIR(source_st.st_mode):
+                if target_st is not None and not stat.S_ISDIR(target_st.st_mode):
+                    _remove(target_path)
+                    changes.deleted.append(target_path)
+                    target_st = None
+                if target_st is None:
+                    os.makedirs(target_path, exist_ok=True)
+                    changes.added.append(target_path)
+                names = os.listdir(source_path)
+                if delete and target_st is not None:
+                    wanted = set(names)
+                    stale.extend(os.path.join(target_path, name) for name in os.listdir(target_path)
+                                 if name not in wanted)
+                stack.extend((os.path.join(source_path, name), os.path.join(target_path, name)) for name in names)
+            elif stat.S_ISREG(source_st.st_mode):
+                files.append((source_path, target_path, source_st, target_st))
+        except OSError as e:
+            log_message(f"[FILE] ⚠ Could not sync {source_path}: {e}", "WARNING")
+            changes.failed.append(target_path)
+
+    def sync_one(item: Tuple[str, str, os.stat_result, Optional[os.stat_result]]) -> Tuple[str, str]:
+        source_path, target_path, source_st, target_st = item
+        try:
+            return target_path, _sync_file(source_path, target_path, source_st, target_st)
+        except OSError as e:
+            log_message(f"[FILE] ⚠ Could not copy {source_path}: {e}", "WARNING")
+            return target_path, "failed"
+
+    if len(files) > 1 and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(sync_one, files))
+    else:
+        results = [sync_one(item) for item in files]
+    for target_path, result in results:
+        if result == "unchanged":
+            changes.unchanged += 1
+        else:
+            getattr(changes, result).append(target_path)
+
+    for path in stale:
+        if path in exclude:
+            continue
+        try:
+            _remove(path)
+            changes.deleted.append(path)
+        except OSError as e:
+            log_message(f"[FILE] ⚠ Could not remove stale {path}: {e}", "WARNING")
+            changes.failed.append(path)
+    return changes
@@ -23,6 +23,7 @@ import threading
 from typing import Dict, Any, Optional, Tuple, List
 from datetime import datetime
 from updates.index import log_message
+from updates.utils.tracing import span
 import subprocess
 
 from .backup_manager import BackupManager
@@ -83,13 +84,15 @@ class WebsiteUpdater:
             
             # Step 1: Clone repository
             log_message("Step 1: Cloning repository...")
-            temp_dir = self.git.clone_repository()
+            with span("clone", "website"):
+                temp_dir = self.git.clone_repository()
             if not temp_dir:
                 raise Exception("Failed to clone repository")
             
             # Step 2: Check if update is needed
             log_message("Step 2: Checking if update is needed...")
-            update_needed, nuclear_restore, update_details = self._check_version_update_needed(temp_dir)
+            with span("version_check", "website"):
+                update_needed, nuclear_restore, update_details = self._check_version_update_needed(temp_dir)
             result["details"] = update_details
             
             if not update_needed:
@@ -105,31 +108,39 @@ class WebsiteUpdater:
             
             # Step 3: Create comprehensive backup (everything)
             log_message("Step 3: Creating comprehensive backup...")
-            if not self.backup_manager.backup_for_website_update():
+            with span("backup", "website"):
+                backed_up = self.backup_manager.backup_for_website_update()
+            if not backed_up:
                 raise Exception("Failed to create comprehensive backup")
             
             # Step 4: Capture premium tab state before clobbering
             log_message("Step 4: Capturing premium tab state...")
-            premium_tab_state = self._capture_premium_tab_state()
+            with span("capture_premium_tabs", "website"):
+                premium_tab_state = self._capture_premium_tab_state()
             if not premium_tab_state:
                 log_message("⚠ Warning: Could not capture premium tab state", "WARNING")
             
             # Step 4.5: Capture and backup user customizations (themes, configs) before clobbering
             log_message("Step 4.5: Capturing and backing up user customizations...")
-            user_customizations = self._capture_and_backup_user_customizations()
+            with span("capture_customizations", "website"):
+                user_customizations = self._capture_and_backup_user_customizations()
             if not user_customizations:
                 log_message("⚠ Warning: Could not capture user customizations", "WARNING")
             
             # Step 5: Validate file operations
             log_message("Step 5: Validating file operations...")
-            if not self.files.validate_file_operations(temp_dir):
+            with span("validate_files", "website"):
+                files_valid = self.files.validate_file_operations(temp_dir)
+            if not files_valid:
                 raise Exception("File operation validation failed")
             
             # Step 5.5: No need to stop gunicorn - clobber-twice approach handles it gracefully
             
             # Step 6: Update files (this clobbers src/backend)
             log_message("Step 6: Updating website files (clobbering src/backend)...")
-            if not self.files.update_components(temp_dir):
+            with span("update_files", "website"):
+                files_updated = self.files.update_components(temp_dir)
+            if not files_updated:
                 raise Exception("File update failed")
             
             # Step 6.5: Restore user customizations (themes, configs) or use defaults
@@ -146,7 +157,8 @@ class WebsiteUpdater:
             # Step 7: Restore premium tabs using premium installer
             log_message("Step 7: Restoring premium tabs...")
             if premium_tab_state:
-                tab_restoration_success = self._restore_premium_tabs(premium_tab_state)
+                with span("restore_premium_tabs", "website"):
+                    tab_restoration_success = self._restore_premium_tabs(premium_tab_state)
                 result["premium_tabs_restored"] = tab_restoration_success
                 if not tab_restoration_success:
                     log_message("⚠ Warning: Premium tab restoration failed", "WARNING")
@@ -155,11 +167,16 @@ class WebsiteUpdater:
             
             # Step 8: Restore permissions before build process
             log_message("Step 8: Restoring permissions before build...")
-            self._restore_permissions()  # Don't fail on permission issues
+            with span("restore_permissions", "website"):
+                self._restore_permissions()  # Don't fail on permission issues
             
             # Step 9: Run build process (now includes restored premium tabs)
             log_message("Step 9: Running build process with premium tabs...")
-            if not self.build.run_build_process():
+            # Reinstalled premium tabs change files the sync did not see, so then every step runs
+            tabs_reinstalled = bool(premium_tab_state and premium_tab_state.get("installed_tabs"))
+            with span("build", "website"):
+                built = self.build.run_build_process(None if tabs_reinstalled else self.files.changeset)
+            if not built:
                 raise Exception("Build process failed")
             
             # Step 10: Update version metadata
@@ -193,7 +210,8 @@ class WebsiteUpdater:
             # so restore_module_state only restores files while gunicorn stays alive.
             log_message("Attempting rollback using StateManager (files only)...")
             try:
-                rollback_success = self.backup_manager.state_manager.restore_module_state("website")
+                with span("rollback", "website"):
+                    rollback_success = self.backup_manager.state_manager.restore_module_state("website")
                 result["rollback_success"] = rollback_success
                 if rollback_success:
                     log_message("Rollback file restoration successful — restarting gunicorn...")
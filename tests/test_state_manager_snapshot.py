@@ -0,0 +1,120 @@
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+StateManager snapshot correctness.
+
+Every snapshot mode must keep each backup generation independent of the live
+files: a file rewritten in place (same inode, same size) after a backup must not
+change what that backup restores, whether the backup copied, hardlinked or
+reflinked its blobs.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from updates.utils import checksum
+from updates.utils.backup_store import BlobStore
+from updates.utils.checksum import ChecksumCache
+from updates.utils.state_manager import StateManager
+
+MODULE = "snapshot_test"
+ORIGINAL = {
+    "config.json": b'{"port": 4533, "scan": "1h"}\n',
+    "data/library.db": b"SQLite format 3\x00" + bytes(range(256)) * 16,
+    "data/cache/cover.jpg": b"\xff\xd8\xff\xe0" + b"\x5a" * 4096,
+}
+# Same lengths as ORIGINAL so only the content differs, never the size
+REWRITTEN = {rel: bytes(b ^ 0xFF for b in content) for rel, content in ORIGINAL.items()}
+
+
+def _reflink_supported() -> bool:
+    probe_dir = tempfile.mkdtemp()
+    try:
+        return BlobStore(probe_dir).supports_reflink()
+    finally:
+        shutil.rmtree(probe_dir, ignore_errors=True)
+
+
+class SnapshotModeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.live = os.path.join(self.tmp, "live")
+        self.backups = os.path.join(self.tmp, "backups")
+        # Keep the shared checksum cache out of /var/cache and free of other runs' digests
+        self._saved_cache = checksum._cache
+        checksum._cache = ChecksumCache(None)
+        for rel, content in ORIGINAL.items():
+            path = os.path.join(self.live, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content)
+
+    def tearDown(self):
+        checksum._cache = self._saved_cache
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _rewrite_in_place(self, contents):
+        for rel, content in contents.items():
+            with open(os.path.join(self.live, rel), "r+b") as f:
+                f.write(content)
+
+    def _assert_live(self, contents):
+        for rel, content in contents.items():
+            with open(os.path.join(self.live, rel), "rb") as f:
+                self.assertEqual(f.read(), content, rel)
+
+    def _check_mode(self, mode):
+        manager = StateManager(backup_dir=self.backups, snapshot_mode=mode)
+        self.assertTrue(manager.backup_module_state(MODULE, files=[self.live]))
+        self._rewrite_in_place(REWRITTEN)
+        # Second backup: hardlink/reflink modes reuse or link from the first generation
+        self.assertTrue(manager.backup_module_state(MODULE, files=[self.live]))
+        generations = manager.list_backup_generations(MODULE)
+        self.assertEqual(len(generations), 1)
+
+        self.assertTrue(manager.restore_module_state(MODULE, generation=generations[0]))
+        self._assert_live(ORIGINAL)
+        self.assertTrue(manager.restore_module_state(MODULE))
+        self._assert_live(REWRITTEN)
+
+        # Restored files must not share storage with the backups either
+        self._rewrite_in_place({rel: b"\x00" * len(content) for rel, content in ORIGINAL.items()})
+        self.assertTrue(manager.restore_module_state(MODULE, generation=generations[0]))
+        self._assert_live(ORIGINAL)
+        self.assertTrue(manager.restore_module_state(MODULE))
+        self._assert_live(REWRITTEN)
+
+    def test_copy(self):
+        self._check_mode("copy")
+
+    def test_hardlink(self):
+        self._check_mode("hardlink")
+
+    @unittest.skipUnless(_reflink_supported(), "filesystem does not support FICLONE")
+    def test_reflink(self):
+        self._check_mode("reflink")
+
+    def test_auto(self):
+        self._check_mode("auto")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -39,6 +39,25 @@ from .maintenanceRunner import (
     run_module_maintenance,
     list_maintenance_modules
 )
+from .module_registry import (
+    ModuleRegistry,
+    ModuleRecord,
+    get_module_registry
+)
+from .service_state import (
+    ServiceState,
+    ServiceStateCache,
+    get_service_state_cache,
+    prefetch_service_states,
+    get_service_state,
+    is_service_active,
+    is_service_enabled,
+    run_systemctl,
+    run_systemctl_each
+)
+from .http_session import get_http_session, close_http_session
+from .checksum import file_sha256, tree_digest, TreeDigest
+from .daemon import UpdateDaemon, send_daemon_command
 from .moduleUtils import (
     load_root_config,
     conditional_config_return,
@@ -61,6 +80,25 @@ __all__ = [
     'run_all_maintenance',
     'run_module_maintenance',
     'list_maintenance_modules',
+    'ModuleRegistry',
+    'ModuleRecord',
+    'get_module_registry',
+    'ServiceState',
+    'ServiceStateCache',
+    'get_service_state_cache',
+    'prefetch_service_states',
+    'get_service_state',
+    'is_service_active',
+    'is_service_enabled',
+    'run_systemctl',
+    'run_systemctl_each',
+    'get_http_session',
+    'file_sha256',
+    'tree_digest',
+    'TreeDigest',
+    'close_http_session',
+    'UpdateDaemon',
+    'send_daemon_command',
     'load_root_config',
     'conditional_config_return',
     'get_module_debug_mode'
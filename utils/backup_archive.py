@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Backup Archives
+
+Single-file compressed backups for StateManager(snapshot_mode="archive"). The
+backed-up paths are streamed into <module>_backup/files.tar.zst in one pass
+(files.tar.xz when the zstandard package is not installed), and the archive is
+hashed while it is written, so it is never read back to checksum it. Restores
+stream through the archive once and extract only the requested paths.
+
+Members are stored under their absolute path without the leading "/", with
+modes, owners, mtimes and symlinks preserved.
+"""
+
+import os
+import lzma
+import shutil
+import hashlib
+import tarfile
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+from .index import log_message
+from .checksum import get_checksum_cache
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore
+
+ARCHIVE_NAME = "files.tar"
+ZSTD_LEVEL = 6
+XZ_PRESET = 3
+
+# Our own archives: keep absolute-rooted names, owners and modes as recorded
+_EXTRACT_ARGS = {"filter": "fully_trusted"} if hasattr(tarfile, "data_filter") else {}
+
+
+class _HashingWriter:
+    """Write-only file object that hashes and counts everything passing through."""
+
+    def __init__(self, f):
+        self._f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    def flush(self) -> None:
+        self._f.flush()
+
+
+def find_archive(module_backup_dir: Path) -> Optional[Path]:
+    """The module's files archive, if the backup was made in archive mode."""
+    for suffix in (".zst", ".xz"):
+        archive = module_backup_dir / f"{ARCHIVE_NAME}{suffix}"
+        if archive.exists():
+            return archive
+    return None
+
+
+def _arcname(path: str) -> str:
+    return os.path.abspath(path).lstrip("/")
+
+
+def write_archive(module_backup_dir: Path, paths: Iterable[str]) -> Tuple[Path, str, int, List[str]]:
+    """
+    Stream paths into a compressed tar in the module backup directory.
+
+    Args:
+        module_backup_dir: Directory receiving files.tar.zst / files.tar.xz
+        paths: Files and directories to archive (recursively, symlinks not followed)
+
+    Returns:
+        tuple: (archive path, sha256 of the archive, archive size, paths archived)
+    """
+    suffix = ".zst" if zstandard is not None else ".xz"
+    archive = module_backup_dir / f"{ARCHIVE_NAME}{suffix}"
+    tmp_archive = archive.with_name(archive.name + ".tmp")
+    archived = []
+    with open(tmp_archive, "wb") as raw:
+        writer = _HashingWriter(raw)
+        if zstandard is not None:
+            compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(writer, closefd=False)
+        else:
+            compressed = lzma.LZMAFile(writer, "wb", preset=XZ_PRESET)
+        with compressed, tarfile.open(fileobj=compressed, mode="w|") as tar:
+            for path in paths:
+                try:
+                    tar.add(path, arcname=_arcname(path))
+                    archived.append(path)
+                except OSError as e:
+                    log_message(f"Failed to archive {path}: {e}", "WARNING")
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_archive, archive)
+
+    digest = writer.sha256.hexdigest()
+    # Later checksums of the backup directory reuse this digest instead of reading the archive again
+    get_checksum_cache().put(os.stat(archive), digest)
+    return archive, digest, writer.size, archived
+
+
+def _remove_target(path: str) -> None:
+    if os.path.islink(path) or os.path.isfile(path):
+        os.unlink(path)
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
+
+
+def extract_archive(archive: Path, paths: Iterable[str]) -> List[str]:
+    """
+    Replace each of paths with its copy in the archive, in one streaming pass.
+
+    Args:
+        archive: files.tar.zst or files.tar.xz
+        paths: Backed-up paths to restore; others in the archive are skipped
+
+    Returns:
+        List[str]: Paths that were found in the archive and restored
+    """
+    wanted = {_arcname(path): path for path in paths}
+    restored = []
+    directories = []
+
+    with open(archive, "rb") as raw:
+        if archive.suffix == ".zst":
+            if zstandard is None:
+                raise RuntimeError(f"zstandard is required to restore {archive}")
+            compressed = zstandard.ZstdDecompressor().stream_reader(raw, closefd=False)
+        else:
+            compressed = lzma.LZMAFile(raw, "rb")
+        with compressed, tarfile.open(fileobj=compressed, mode="r|") as tar:
+            for member in tar:
+                root = member.name if member.name in wanted else next(
+                    (name for name in wanted if member.name.startswith(name + "/")), None)
+                if root is None:
+                    continue
+                if member.name == root:
+                    _remove_target(wanted[root])
+                    os.makedirs(os.path.dirname(wanted[root]) or "/", exist_ok=True)
+                    restored.append(wanted[root])
+                if member.isdir():
+                    # Directory modes and mtimes last, as extractall() does
+                    os.makedirs(os.path.join("/", member.name), exist_ok=True)
+                    directories.append(member)
+                else:
+                    tar.extract(member, path="/", **_EXTRACT_ARGS)
+
+            for member in reversed(directories):
+                target = os.path.join("/", member.name)
+                tar.chown(member, target, numeric_owner=False)
+                tar.chmod(member, target)
+                tar.utime(member, target)
+    return restored
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Backup Index
+
+Per-module backup records for StateManager. Every module's record lives in its
+own shard, so backing up or removing one module reads and writes only that
+module's file and modules can be backed up concurrently:
+
+    index/<module>.json   full record of one module's backup (atomic: temp file + fsync + rename)
+    index/summary.json    {module: {"timestamp", "description"}} for quick listings
+    index/.lock           flock held while the summary is rewritten
+
+A module_backups.json left by older versions (one file holding every record)
+is split into shards the first time the index is opened, then renamed to
+module_backups.json.migrated.
+"""
+
+import os
+import json
+import tempfile
+import contextlib
+from pathlib import Path
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from .index import log_message
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+
+SUMMARY_FILE = "summary.json"
+LEGACY_INDEX_FILE = "module_backups.json"
+
+
+def write_json_atomic(path: Path, data: Any) -> None:
+    """Write JSON to path via temp file + fsync + rename, then fsync the directory."""
+    # A unique temp file per call, so concurrent writers (threads included) never share one
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            # mkstemp creates 0600; keep the mode a plain open() would have given
+            os.fchmod(f.fileno(), 0o644)
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_name)
+        raise
+    _fsync_dir(path.parent)
+
+
+def _fsync_dir(directory: Path) -> None:
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class BackupIndex:
+    """Sharded module backup records under <backup_root>/index."""
+
+    def __init__(self, backup_root: Path):
+        self.backup_root = Path(backup_root)
+        self.index_dir = self.backup_root / "index"
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._migrate_legacy_index()
+
+    def _shard(self, module_name: str) -> Path:
+        return self.index_dir / f"{module_name}.json"
+
+    @contextlib.contextmanager
+    def lock(self) -> Iterator[None]:
+        """Hold the index lock exclusively (serialises summary rewrites)."""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.index_dir / ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _migrate_legacy_index(self) -> None:
+        legacy_file = self.backup_root / LEGACY_INDEX_FILE
+        if not legacy_file.exists():
+            return
+        with self.lock():
+            if not legacy_file.exists():
+                return
+            try:
+                with open(legacy_file, "r") as f:
+                    records = json.load(f)
+                for module_name, record in records.items():
+                    if not self._shard(module_name).exists():
+                        write_json_atomic(self._shard(module_name), record)
+                self._update_summary({name: record for name, record in records.items()})
+                os.replace(legacy_file, legacy_file.with_name(f"{LEGACY_INDEX_FILE}.migrated"))
+                log_message(f"Migrated {len(records)} module backup records to {self.index_dir}")
+            except Exception as e:
+                log_message(f"Failed to migrate module backup index {legacy_file}: {e}", "WARNING")
+
+    def _read_summary(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.index_dir / SUMMARY_FILE, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            log_message(f"Ignoring unreadable backup summary: {e}", "WARNING")
+            return {}
+
+    def _update_summary(self, changes: Dict[str, Optional[Dict[str, Any]]]) -> None:
+        """Apply record changes (None = removed) to the summary. Caller holds the lock."""
+        summary = self._read_summary()
+        for module_name, record in changes.items():
+            if record is None:
+                summary.pop(module_name, None)
+            else:
+                summary[module_name] = {
+                    "timestamp": record.get("timestamp"),
+                    "description": record.get("description", ""),
+                }
+        write_json_atomic(self.index_dir / SUMMARY_FILE, summary)
+
+    def names(self) -> List[str]:
+        """Modules with a backup record, sorted."""
+        return sorted(
+            entry.name[:-len(".json")] for entry in os.scandir(self.index_dir)
+            if entry.name.endswith(".json") and entry.name != SUMMARY_FILE and not entry.name.startswith(".")
+        )
+
+    def load(self, module_name: str) -> Optional[Dict[str, Any]]:
+        """A module's record, or None if it has none (or it is unreadable)."""
+        try:
+            with open(self._shard(module_name), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log_message(f"Failed to load backup record for {module_name}: {e}", "WARNING")
+            return None
+
+    def save(self, module_name: str, record: Dict[str, Any]) -> None:
+        """Write a module's record atomically and update the summary."""
+        write_json_atomic(self._shard(module_name), record)
+        with self.lock():
+            self._update_summary({module_name: record})
+
+    def remove(self, module_name: str) -> None:
+        """Delete a module's record and drop it from the summary."""
+        try:
+            self._shard(module_name).unlink()
+        except FileNotFoundError:
+            pass
+        _fsync_dir(self.index_dir)
+        with self.lock():
+            self._update_summary({module_name: None})
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """{module: {"timestamp", "description"}} without opening any record."""
+        with self.lock():
+            return self._read_summary()
+
+
+class LazyRecords(Mapping):
+    """
+    Read-only mapping of module name -> record that loads each shard on first access.
+
+    Keys are the names given; a name whose shard cannot be read (or was removed
+    since) maps to None, so iterating, len() and items() never raise for one bad shard.
+    """
+
+    def __init__(self, names: List[str], loader: Callable[[str], Any]):
+        self._names = names
+        self._loader = loader
+        self._loaded: Dict[str, Any] = {}
+
+    def __getitem__(self, module_name: str) -> Any:
+        if module_name not in self._loaded:
+            if module_name not in self._names:
+                raise KeyError(module_name)
+            self._loaded[module_name] = self._loader(module_name)
+        return self._loaded[module_name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
@@ -0,0 +1,571 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Backup Object Store
+
+Content-addressed file storage for StateManager. File contents are stored once
+as blobs named by their sha256, shared by every module and every backup
+generation under the same backup root. A backup is a manifest listing the
+backed-up paths, with one row per directory, file and symlink:
+
+    [relpath, kind, mode, size, mtime_ns, ctime_ns, inode, ref]
+
+kind is "d" (directory), "f" (file, ref = blob sha256) or "l" (symlink,
+ref = link target); relpath "" is the backed-up path itself. A file whose
+size, mtime, ctime and inode match its row in the previous manifest reuses that
+row's blob without being read, so a new backup only reads and writes changed
+files.
+
+How file bytes move between the live tree and the store is set by the snapshot
+mode (StateManager(snapshot_mode=...)):
+
+    copy      every file is read, hashed and copied again on each backup
+    hardlink  files unchanged since the previous manifest (size, mtime, ctime,
+              inode) share its blob without being read; changed files are copied
+    reflink   like hardlink, but changed files are cloned with the FICLONE
+              ioctl (btrfs, XFS) instead of copied, and restores clone blobs back
+    auto      reflink where the filesystem supports it, hardlink otherwise
+    archive   no object store: files are streamed into one compressed tar per
+              backup (see backup_archive.py)
+
+Blobs are never hardlinked to live files: a snapshot is always an independent
+copy or a copy-on-write clone, so later in-place writes to a live file cannot
+change it.
+
+Layout under a StateManager backup root:
+    objects/ab/cdef...    blobs (read-only)
+    objects/tmp/          partial blob writes
+    objects/.lock         flock: shared while backing up, exclusive during garbage collection
+"""
+
+import os
+import json
+import stat
+import errno
+import shutil
+import hashlib
+import tempfile
+import contextlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple
+from .index import log_message
+from .checksum import file_sha256
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
+
+MANIFEST_VERSION = 1
+COPY_BUFFER_SIZE = 1024 * 1024
+SNAPSHOT_MODES = ("copy", "hardlink", "reflink", "auto", "archive")
+
+# ioctl(dest_fd, FICLONE, src_fd): share src's extents copy-on-write (linux/fs.h)
+FICLONE = 0x40049409
+# Errors meaning "this filesystem/pair of files cannot be cloned", not "the file is bad"
+_NO_REFLINK_ERRNOS = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS}
+
+# Manifest row columns
+REL, KIND, MODE, SIZE, MTIME, CTIME, INODE, REF = range(8)
+
+
+def _hash_fd(fd: int) -> str:
+    sha256 = hashlib.sha256()
+    with os.fdopen(os.dup(fd), "rb") as f:
+        f.seek(0)
+        while True:
+            chunk = f.read(COPY_BUFFER_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class BlobStore:
+    """sha256-addressed blobs under <root>/objects."""
+
+    def __init__(self, root: str, reflink: bool = False):
+        """
+        Args:
+            root: Backup root; blobs live in <root>/objects
+            reflink: Clone file data with FICLONE instead of copying, falling back to copies
+                     once the filesystem turns out not to support it
+        """
+        self.objects_dir = Path(root) / "objects"
+        self.tmp_dir = self.objects_dir / "tmp"
+        self.reflink = reflink and fcntl is not None
+
+    def _clone(self, src_fd: int, dst_fd: int) -> bool:
+        """Reflink src into dst. Returns False (and stops trying) if the filesystem cannot."""
+        if not self.reflink:
+            return False
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            return True
+        except OSError as e:
+            if e.errno not in _NO_REFLINK_ERRNOS:
+                raise
+            log_message(f"Reflinks not supported for {self.objects_dir} ({e.strerror}); copying instead")
+            self.reflink = False
+            return False
+
+    def object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest[2:]
+
+    def has(self, digest: str) -> bool:
+        return self.object_path(digest).exists()
+
+    def put_file(self, source: str) -> Tuple[str, int, bool]:
+        """
+        Store the contents of source: cloned and then hashed, or hashed while copying.
+
+        Either way the digest is computed from the stored bytes, so a file being
+        written while it is backed up cannot end up under the wrong name.
+
+        Args:
+            source: File to store
+
+        Returns:
+            tuple: (sha256 hex digest, bytes stored (0 if the blob already existed), cloned)
+        """
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with open(source, "rb") as src, os.fdopen(fd, "wb") as dst:
+                cloned = self._clone(src.fileno(), dst.fileno())
+                if cloned:
+                    digest = _hash_fd(dst.fileno())
+                    size = os.fstat(dst.fileno()).st_size
+                else:
+                    sha256 = hashlib.sha256()
+                    size = 0
+                    while True:
+                        chunk = src.read(COPY_BUFFER_SIZE)
+                        if not chunk:
+                            break
+                        sha256.update(chunk)
+                        dst.write(chunk)
+                        size += len(chunk)
+                    digest = sha256.hexdigest()
+            target = self.object_path(digest)
+            if target.exists():
+                os.unlink(tmp_path)
+                return digest, 0, cloned
+            target.parent.mkdir(exist_ok=True)
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, target)
+            return digest, size, cloned
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+
+    def put_bytes(self, data: bytes) -> Tuple[str, int]:
+        """
+        Store a block of bytes.
+
+        Returns:
+            tuple: (sha256 hex digest, bytes stored (0 if the blob already existed))
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        target = self.object_path(digest)
+        if target.exists():
+            return digest, 0
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as dst:
+                dst.write(data)
+            target.parent.mkdir(exist_ok=True)
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, target)
+            return digest, len(data)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+
+    def read_bytes(self, digest: str) -> bytes:
+        with open(self.object_path(digest), "rb") as f:
+            return f.read()
+
+    def materialize(self, digest: str, target: str) -> None:
+        """Write the blob to target as a new, independent file (a copy-on-write clone if possible)."""
+        if self.reflink:
+            with open(self.object_path(digest), "rb") as src, open(target, "wb") as dst:
+                if self._clone(src.fileno(), dst.fileno()):
+                    return
+                shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+            return
+        shutil.copyfile(self.object_path(digest), target)
+
+    def supports_reflink(self) -> bool:
+        """Probe whether blobs can be cloned on this filesystem."""
+        if fcntl is None:
+            return False
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryFile(dir=self.tmp_dir) as src, tempfile.TemporaryFile(dir=self.tmp_dir) as dst:
+            src.write(b"reflink probe")
+            src.flush()
+            try:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                return True
+            except OSError:
+                return False
+
+    @contextlib.contextmanager
+    def lock(self, exclusive: bool = False, blocking: bool = True) -> Iterator[bool]:
+        """
+        Hold the store lock. Backups take it shared; garbage collection exclusive.
+
+        Yields:
+            bool: False if blocking=False and the lock was not available
+        """
+        if fcntl is None:
+            yield True
+            return
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.objects_dir / ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+            if not blocking:
+                flags |= fcntl.LOCK_NB
+            try:
+                fcntl.flock(fd, flags)
+            except BlockingIOError:
+                yield False
+                return
+            yield True
+        finally:
+            os.close(fd)
+
+    def collect_garbage(self, referenced: Set[str]) -> Tuple[int, int]:
+        """
+        Delete blobs not in referenced and leftover partial writes. Caller holds the exclusive lock.
+
+        Returns:
+            tuple: (blobs removed, bytes freed)
+        """
+        removed = freed = 0
+        if not self.objects_dir.exists():
+            return 0, 0
+        for prefix_dir in self.objects_dir.iterdir():
+            if not prefix_dir.is_dir():
+                continue
+            if prefix_dir == self.tmp_dir:
+                shutil.rmtree(prefix_dir, ignore_errors=True)
+                continue
+            for blob in prefix_dir.iterdir():
+                if prefix_dir.name + blob.name in referenced:
+                    continue
+                try:
+                    freed += blob.stat().st_size
+                    blob.unlink()
+                    removed += 1
+                except OSError:
+                    pass
+            with contextlib.suppress(OSError):
+                prefix_dir.rmdir()
+        return removed, freed
+
+
+def _row(rel: str, st: os.stat_result, ref: Optional[str] = None) -> list:
+    if stat.S_ISDIR(st.st_mode):
+        kind = "d"
+    elif stat.S_ISLNK(st.st_mode):
+        kind = "l"
+    else:
+        kind = "f"
+    return [rel, kind, st.st_mode, st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino, ref]
+
+
+def _walk(top: str) -> Iterator[Tuple[str, str, os.stat_result]]:
+    """Yield (relpath, path, lstat) below top; every directory comes before its contents."""
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(top, rel_dir)) as entries:
+            for entry in entries:
+                rel = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                st = entry.stat(follow_symlinks=False)
+                yield rel, entry.path, st
+                if stat.S_ISDIR(st.st_mode):
+                    stack.append(rel)
+
+
+class ManifestBuilder:
+    """Snapshots paths into a store, reusing unchanged blobs from a previous manifest."""
+
+    def __init__(self, store: BlobStore, previous: Optional[Dict[str, Any]] = None,
+                 reuse_unchanged: bool = True):
+        """
+        Args:
+            store: Store receiving the blobs
+            previous: Manifest of the previous backup of the same paths
+            reuse_unchanged: Trust size/mtime/ctime/inode to skip reading unchanged files
+                             (False for snapshot_mode "copy")
+        """
+        self.store = store
+        self.previous = (previous or {}).get("paths", {}) if reuse_unchanged else {}
+        self.paths: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"files": 0, "reused": 0, "stored": 0, "cloned": 0, "bytes_written": 0}
+
+    def _file_ref(self, path: str, st: os.stat_result, old: Optional[list]) -> str:
+        self.stats["files"] += 1
+        if (old is not None and old[KIND] == "f" and old[SIZE] == st.st_size
+                and old[MTIME] == st.st_mtime_ns and old[CTIME] == st.st_ctime_ns
+                and old[INODE] == st.st_ino and self.store.has(old[REF])):
+            self.stats["reused"] += 1
+            return old[REF]
+        digest, stored, cloned = self.store.put_file(path)
+        if stored:
+            self.stats["stored"] += 1
+            if cloned:
+                self.stats["cloned"] += 1
+            else:
+                self.stats["bytes_written"] += stored
+        return digest
+
+    def add(self, path: str) -> None:
+        """Snapshot one file, directory or symlink (recursively, without following symlinks)."""
+        old_rows = {row[REL]: row for row in self.previous.get(path, {}).get("entries", [])}
+        st = os.lstat(path)
+        rows = []
+
+        def add_row(rel: str, entry_path: str, entry_st: os.stat_result) -> None:
+            if stat.S_ISLNK(entry_st.st_mode):
+                rows.append(_row(rel, entry_st, os.readlink(entry_path)))
+            elif stat.S_ISREG(entry_st.st_mode):
+                rows.append(_row(rel, entry_st, self._file_ref(entry_path, entry_st, old_rows.get(rel))))
+            elif stat.S_ISDIR(entry_st.st_mode):
+                rows.append(_row(rel, entry_st))
+            # Sockets, fifos and device nodes are not backed up
+
+        add_row("", path, st)
+        if stat.S_ISDIR(st.st_mode):
+            for rel, entry_path, entry_st in _walk(path):
+                add_row(rel, entry_path, entry_st)
+        self.paths[path] = {"entries": rows}
+
+    def manifest(self, created: int) -> Dict[str, Any]:
+        return {"version": MANIFEST_VERSION, "created": created, "paths": self.paths}
+
+
+def restore_path(store: BlobStore, path: str, record: Dict[str, Any]) -> None:
+    """
+    Replace path with the tree recorded in a manifest entry.
+
+    Args:
+        store: Store holding the blobs
+        path: Backed-up path to recreate
+        record: manifest["paths"][path]
+    """
+    if os.path.islink(path) or os.path.isfile(path):
+        os.unlink(path)
+    elif os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    directories = []
+    for row in record["entries"]:
+        target = os.path.join(path, row[REL]) if row[REL] else path
+        kind = row[KIND]
+        if kind == "d":
+            os.makedirs(target, exist_ok=True)
+            directories.append((target, row))
+        elif kind == "l":
+            os.symlink(row[REF], target)
+        else:
+            store.materialize(row[REF], target)
+            os.chmod(target, stat.S_IMODE(row[MODE]))
+            os.utime(target, ns=(row[MTIME], row[MTIME]))
+
+    # Directory modes and mtimes last: adding entries changes mtime and a read-only mode would block them
+    for target, row in reversed(directories):
+        os.chmod(target, stat.S_IMODE(row[MODE]))
+        os.utime(target, ns=(row[MTIME], row[MTIME]))
+
+
+def _remove(path: str, st: os.stat_result) -> None:
+    if stat.S_ISDIR(st.st_mode):
+        shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+
+def _file_matches(path: str, st: os.stat_result, row: list) -> bool:
+    """Whether a live regular file has the row's content, reading it only when metadata is inconclusive."""
+    if st.st_size != row[SIZE]:
+        return False
+    if (st.st_mtime_ns, st.st_ctime_ns, st.st_ino) == (row[MTIME], row[CTIME], row[INODE]):
+        return True
+    return file_sha256(path) == row[REF]
+
+
+def delta_restore_path(store: BlobStore, path: str, record: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Bring path back to the tree recorded in a manifest entry, touching only what differs.
+
+    Files whose size, mtime, ctime and inode match their row are kept without being
+    read; files of the same size are kept if their sha256 matches. Everything else is
+    rewritten (temp file + rename), missing entries are created and entries not in the
+    manifest are deleted. Mode and mtime are reset on every kept entry that drifted.
+
+    Args:
+        store: Store holding the blobs
+        path: Backed-up path to bring back
+        record: manifest["paths"][path]
+
+    Returns:
+        dict: Counts of "written", "deleted", "metadata" (only mode/mtime reset) and "unchanged" entries
+
+    Raises:
+        OSError: If the tree cannot be brought back; the caller should fall back to restore_path()
+    """
+    counts = {"written": 0, "deleted": 0, "metadata": 0, "unchanged": 0}
+    rows = {row[REL]: row for row in record["entries"]}
+
+    live = {}
+    try:
+        root_st = os.lstat(path)
+    except FileNotFoundError:
+        root_st = None
+    if root_st is not None:
+        live[""] = root_st
+        if stat.S_ISDIR(root_st.st_mode) and rows[""][KIND] == "d":
+            for rel, _, st in _walk(path):
+                live[rel] = st
+
+    # Delete extra entries (and entries whose kind changed) top-down, skipping what an rmtree already removed
+    removed_dirs = []
+    for rel in sorted(live, key=lambda r: (r.count(os.sep), r)):
+        if any(rel.startswith(d + os.sep) for d in removed_dirs):
+            continue
+        st = live[rel]
+        row = rows.get(rel)
+        if row is not None and _row(rel, st)[KIND] == row[KIND]:
+            continue
+        target = os.path.join(path, rel) if rel else path
+        _remove(target, st)
+        counts["deleted"] += 1
+        if stat.S_ISDIR(st.st_mode):
+            removed_dirs.append(rel)
+        del live[rel]
+    for rel in [r for r in live if any(r.startswith(d + os.sep) for d in removed_dirs)]:
+        del live[rel]
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    directories = []
+    for row in record["entries"]:
+        rel, kind = row[REL], row[KIND]
+        target = os.path.join(path, rel) if rel else path
+        st = live.get(rel)
+        if kind == "d":
+            if st is None:
+                os.makedirs(target, exist_ok=True)
+                counts["written"] += 1
+            directories.append((target, row, st))
+        elif kind == "l":
+            if st is not None and os.readlink(target) == row[REF]:
+                counts["unchanged"] += 1
+                continue
+            if st is not None:
+                os.unlink(target)
+            os.symlink(row[REF], target)
+            counts["written"] += 1
+        elif st is not None and _file_matches(target, st, row):
+            if stat.S_IMODE(st.st_mode) != stat.S_IMODE(row[MODE]) or st.st_mtime_ns != row[MTIME]:
+                os.chmod(target, stat.S_IMODE(row[MODE]))
+                os.utime(target, ns=(row[MTIME], row[MTIME]))
+                counts["metadata"] += 1
+            else:
+                counts["unchanged"] += 1
+        else:
+            tmp_target = f"{target}.hs-restore.tmp"
+            store.materialize(row[REF], tmp_target)
+            os.chmod(tmp_target, stat.S_IMODE(row[MODE]))
+            os.utime(tmp_target, ns=(row[MTIME], row[MTIME]))
+            os.replace(tmp_target, target)
+            counts["written"] += 1
+
+    # Directory modes and mtimes last: adding or removing entries changes mtime
+    for target, row, st in reversed(directories):
+        os.chmod(target, stat.S_IMODE(row[MODE]))
+        os.utime(target, ns=(row[MTIME], row[MTIME]))
+        if st is not None:
+            if stat.S_IMODE(st.st_mode) != stat.S_IMODE(row[MODE]):
+                counts["metadata"] += 1
+            else:
+                counts["unchanged"] += 1
+    return counts
+
+
+def verify_path(path: str, record: Dict[str, Any]) -> bool:
+    """Whether path has exactly the entries of a manifest record, with matching kinds and file sizes."""
+    try:
+        live = {"": os.lstat(path)}
+        if stat.S_ISDIR(live[""].st_mode):
+            live.update((rel, st) for rel, _, st in _walk(path))
+    except OSError:
+        return False
+    if len(live) != len(record["entries"]):
+        return False
+    for row in record["entries"]:
+        st = live.get(row[REL])
+        if st is None or _row(row[REL], st)[KIND] != row[KIND]:
+            return False
+        if row[KIND] == "f" and st.st_size != row[SIZE]:
+            return False
+    return True
+
+
+def load_manifest(manifest_file: Path) -> Optional[Dict[str, Any]]:
+    """Parsed manifest, or None if it does not exist or cannot be read."""
+    try:
+        with open(manifest_file, "r") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log_message(f"Failed to read backup manifest {manifest_file}: {e}", "WARNING")
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        log_message(f"Unsupported backup manifest version in {manifest_file}", "WARNING")
+        return None
+    return manifest
+
+
+def write_manifest(manifest_file: Path, manifest: Dict[str, Any]) -> None:
+    """Write a manifest atomically (temp file + fsync + rename)."""
+    tmp_file = manifest_file.with_name(manifest_file.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, manifest_file)
+
+
+def manifest_digests(manifests: Iterable[Dict[str, Any]]) -> Set[str]:
+    """All blob digests referenced by the given manifests."""
+    digests = set()
+    for manifest in manifests:
+        for record in manifest.get("paths", {}).values():
+            digests.update(row[REF] for row in record["entries"] if row[KIND] == "f")
+    return digests
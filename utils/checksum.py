@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Checksum Engine
+
+sha256 of files and trees for StateManager and modules:
+- files are read with a reusable 1 MiB buffer (hashlib releases the GIL on large
+  updates, so several files hash in parallel on a thread pool)
+- digests are cached by (device, inode, size, mtime_ns, ctime_ns), in memory
+  and in a JSON file that survives between runs, so unchanged files are never
+  read twice
+- trees get a Merkle digest: every directory's digest covers its entries'
+  names, kinds and digests, so any subtree can be verified on its own
+
+Usage:
+    from updates.utils.checksum import file_sha256, tree_digest
+
+    file_sha256("/usr/local/sbin/tool")          # "" if missing or unreadable
+    digest = tree_digest("/var/www/homeserver/src")
+    digest.root                                  # digest of the whole tree
+    digest.directories["components"]             # digest of one subtree
+"""
+
+import os
+import json
+import stat
+import atexit
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from .index import log_message
+
+READ_BUFFER_SIZE = 1024 * 1024
+DEFAULT_CACHE_PATH = "/var/cache/homeserver/updates/checksums.json"
+MAX_CACHE_ENTRIES = 200000
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+
+class ChecksumCache:
+    """sha256 digests keyed by file identity, optionally persisted to a JSON file."""
+
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH):
+        self.path = path
+        self._entries: Dict[str, str] = {}
+        self._loaded = path is None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(st: os.stat_result) -> str:
+        return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}:{st.st_ctime_ns}"
+
+    def _load(self) -> None:
+        """Read the cache file on first use. Caller holds the lock."""
+        self._loaded = True
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self._entries.update(data)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log_message(f"Ignoring unreadable checksum cache {self.path}: {e}", "WARNING")
+
+    def get(self, st: os.stat_result) -> Optional[str]:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            return self._entries.get(self.key(st))
+
+    def put(self, st: os.stat_result, digest: str) -> None:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            key = self.key(st)
+            # Re-insert so the oldest entries are the ones dropped when the cache is full
+            self._entries.pop(key, None)
+            self._entries[key] = digest
+            if len(self._entries) > MAX_CACHE_ENTRIES:
+                for old_key in list(self._entries)[:len(self._entries) - MAX_CACHE_ENTRIES]:
+                    del self._entries[old_key]
+            self._dirty = True
+
+    def save(self) -> bool:
+        """
+        Write the cache file if anything changed (temp file + rename).
+
+        Returns:
+            bool: True if the cache is persisted (or there was nothing to write)
+        """
+        with self._lock:
+            if not self._dirty or self.path is None:
+                return True
+            entries = dict(self._entries)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entries, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            log_message(f"Could not save checksum cache {self.path}: {e}", "WARNING")
+            return False
+
+
+_cache = ChecksumCache()
+atexit.register(_cache.save)
+
+
+def get_checksum_cache() -> ChecksumCache:
+    """Process-wide ChecksumCache used by file_sha256() and tree_digest()."""
+    return _cache
+
+
+def _hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    buffer = bytearray(READ_BUFFER_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            sha256.update(view[:n])
+    return sha256.hexdigest()
+
+
+def _cached_sha256(path: str, st: os.stat_result, use_cache: bool) -> str:
+    if use_cache:
+        digest = _cache.get(st)
+        if digest is not None:
+            return digest
+    digest = _hash_file(path)
+    if use_cache:
+        _cache.put(st, digest)
+    return digest
+
+
+def file_sha256(path, use_cache: bool = True) -> str:
+    """
+    sha256 hex digest of a regular file.
+
+    Args:
+        path: File path (str or Path)
+        use_cache: Reuse/record the digest in the checksum cache
+
+    Returns:
+        str: Hex digest, or "" if path is not a readable regular file
+    """
+    try:
+        st = os.stat(path)
+        if not stat.S_ISREG(st.st_mode):
+            return ""
+        return _cached_sha256(os.fspath(path), st, use_cache)
+    except OSError:
+        return ""
+
+
+class TreeDigest:
+    """Merkle digest of a file or directory tree."""
+
+    def __init__(self, root: str, directories: Dict[str, str], files: Dict[str, str]):
+        self.root = root
+        self.directories = directories
+        self.files = files
+
+    def __repr__(self):
+        return f"TreeDigest({self.root!r}, directories={len(self.directories)}, files={len(self.files)})"
+
+
+def _node(kind: str, payload: str) -> str:
+    return hashlib.sha256(f"{kind}\0{payload}".encode()).hexdigest()
+
+
+def tree_digest(path: str, workers: int = DEFAULT_WORKERS, use_cache: bool = True) -> TreeDigest:
+    """
+    Merkle digest of path: file contents are hashed in parallel, then combined bottom-up.
+
+    A file node is sha256("f\\0<content sha256>"), a symlink node sha256("l\\0<target>"),
+    and a directory node the sha256 of its sorted "<name>\\0<node>" lines. Unreadable
+    files count as empty.
+
+    Args:
+        path: File or directory
+        workers: Hashing threads
+        use_cache: Reuse/record file digests in the checksum cache
+
+    Returns:
+        TreeDigest: root digest plus digests per directory and per file (by relative path, "" = path)
+    """
+    files: List[Tuple[str, str, os.stat_result]] = []
+    children: Dict[str, List[Tuple[str, str]]] = {}
+    symlinks: Dict[str, str] = {}
+
+    st = os.lstat(path)
+    if stat.S_ISREG(st.st_mode):
+        files.append(("", path, st))
+    elif stat.S_ISLNK(st.st_mode):
+        symlinks[""] = os.readlink(path)
+    elif stat.S_ISDIR(st.st_mode):
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            children[rel_dir] = []
+            with os.scandir(os.path.join(path, rel_dir)) as entries:
+                for entry in entries:
+                    rel = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                    entry_st = entry.stat(follow_symlinks=False)
+                    children[rel_dir].append((entry.name, rel))
+                    if stat.S_ISDIR(entry_st.st_mode):
+                        stack.append(rel)
+                    elif stat.S_ISLNK(entry_st.st_mode):
+                        symlinks[rel] = os.readlink(entry.path)
+                    elif stat.S_ISREG(entry_st.st_mode):
+                        files.append((rel, entry.path, entry_st))
+
+    def hash_one(item: Tuple[str, str, os.stat_result]) -> Tuple[str, str]:
+        rel, file_path, file_st = item
+        try:
+            return rel, _cached_sha256(file_path, file_st, use_cache)
+        except OSError:
+            return rel, hashlib.sha256(b"").hexdigest()
+
+    if len(files) > 1 and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            file_digests = dict(executor.map(hash_one, files))
+    else:
+        file_digests = dict(hash_one(item) for item in files)
+
+    nodes = {rel: _node("f", digest) for rel, digest in file_digests.items()}
+    nodes.update((rel, _node("l", target)) for rel, target in symlinks.items())
+
+    # Deepest directories first so every child directory's node exists before its parent's
+    directories = {}
+    for rel_dir in sorted(children, key=lambda r: r.count(os.sep) + (1 if r else 0), reverse=True):
+        lines = "".join(f"{name}\0{nodes[rel]}\n" for name, rel in sorted(children[rel_dir]) if rel in nodes)
+        nodes[rel_dir] = directories[rel_dir] = _node("d", lines)
+
+    return TreeDigest(nodes.get("", _node("d", "")), directories, file_digests)
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Updater Daemon
+
+Keeps the orchestrator resident (index.py --daemon) so the module registry,
+systemd state cache, HTTP session and imported modules stay warm between runs.
+Jobs are started by an interval timer or through a local UNIX socket that
+speaks one JSON object per line in each direction:
+
+    {"command": "status"}
+    {"command": "check"}
+    {"command": "run", "wait": false}
+
+Only one job (run or check) executes at a time; a request arriving while a job
+is active is answered with {"success": false, "busy": true}. "status" is always
+answered immediately.
+
+The daemon does not know what a run is: index.py registers the job handlers.
+"""
+
+import os
+import json
+import time
+import signal
+import socket
+import threading
+import socketserver
+from typing import Any, Callable, Dict, Optional
+from .index import log_message
+
+DEFAULT_SOCKET_PATH = "/run/homeserver-updates.sock"
+DEFAULT_INTERVAL = 86400
+
+JobHandler = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Reads one JSON request line, writes one JSON response line."""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line.strip():
+            return
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            response = {"success": False, "error": f"Invalid request: {e}"}
+        else:
+            response = self.server.daemon.dispatch(request)
+        try:
+            self.wfile.write((json.dumps(response, default=str) + "\n").encode())
+        except OSError:
+            # Client went away before the job finished
+            pass
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, daemon: "UpdateDaemon"):
+        self.daemon = daemon
+        super().__init__(socket_path, _RequestHandler)
+
+
+class UpdateDaemon:
+    """Timer plus UNIX-socket control API around a set of job handlers."""
+
+    def __init__(self, socket_path: str, handlers: Dict[str, JobHandler],
+                 interval: float = DEFAULT_INTERVAL, scheduled_command: str = "run"):
+        """
+        Args:
+            socket_path: Path of the control socket
+            handlers: Command name -> function(request) returning a JSON-serialisable dict
+            interval: Seconds between scheduled jobs; 0 disables the timer
+            scheduled_command: Handler the timer runs
+        """
+        self.socket_path = socket_path
+        self.handlers = handlers
+        self.interval = interval
+        self.scheduled_command = scheduled_command
+        self.started_at = time.time()
+        self.next_run: Optional[float] = None
+        self.current_job: Optional[Dict[str, Any]] = None
+        self.last_results: Dict[str, Dict[str, Any]] = {}
+        self._job_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server: Optional[_UnixServer] = None
+
+    def status(self) -> Dict[str, Any]:
+        """Daemon state: uptime, active job, last result of each command and next scheduled run."""
+        with self._state_lock:
+            return {
+                "success": True,
+                "pid": os.getpid(),
+                "uptime": round(time.time() - self.started_at, 1),
+                "running": dict(self.current_job) if self.current_job else None,
+                "next_run": self.next_run,
+                "interval": self.interval,
+                "last_results": dict(self.last_results),
+            }
+
+    def _execute(self, command: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Run one handler. Caller holds the job lock."""
+        started = time.time()
+        with self._state_lock:
+            self.current_job = {"command": command, "started_at": started}
+        log_message(f"Daemon: starting '{command}'")
+        try:
+            result = self.handlers[command](request)
+        except Exception as e:
+            log_message(f"Daemon: '{command}' failed: {e}", "ERROR")
+            result = {"success": False, "error": str(e)}
+        finally:
+            self._job_lock.release()
+        duration = round(time.time() - started, 2)
+        log_message(f"Daemon: '{command}' finished in {duration}s")
+        with self._state_lock:
+            self.current_job = None
+            self.last_results[command] = {
+                "finished_at": time.time(),
+                "duration": duration,
+                "success": bool(result.get("success")),
+            }
+        return result
+
+    def submit(self, command: str, request: Optional[Dict[str, Any]] = None, wait: bool = True) -> Dict[str, Any]:
+        """
+        Start a job unless another one is active.
+
+        Args:
+            command: Handler name
+            request: Request dict passed to the handler
+            wait: Block until the job finished and return its result
+
+        Returns:
+            dict: Handler result, {"accepted": True} for wait=False, or a busy/error response
+        """
+        if command not in self.handlers:
+            return {"success": False, "error": f"Unknown command: {command}"}
+        if not self._job_lock.acquire(blocking=False):
+            with self._state_lock:
+                running = dict(self.current_job) if self.current_job else None
+            return {"success": False, "busy": True, "running": running}
+        request = request or {}
+        if wait:
+            return self._execute(command, request)
+        threading.Thread(target=self._execute, args=(command, request),
+                         name=f"daemon-{command}", daemon=True).start()
+        return {"success": True, "accepted": True}
+
+    def dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer one control request."""
+        command = request.get("command")
+        if command == "status":
+            return self.status()
+        return self.submit(command, request, wait=request.get("wait", True))
+
+    def _timer_loop(self, run_at_start: bool) -> None:
+        delay = 0 if run_at_start else self.interval
+        while True:
+            with self._state_lock:
+                self.next_run = time.time() + delay
+            if self._stop.wait(delay):
+                return
+            result = self.submit(self.scheduled_command)
+            if result.get("busy"):
+                log_message(f"Daemon: skipping scheduled '{self.scheduled_command}', a job is already running")
+            if self.interval <= 0:
+                with self._state_lock:
+                    self.next_run = None
+                return
+            delay = self.interval
+
+    def _bind(self) -> None:
+        """Create the control socket, replacing a stale one left by a dead daemon."""
+        if os.path.exists(self.socket_path):
+            try:
+                send_daemon_command(self.socket_path, "status", timeout=5)
+            except OSError:
+                os.unlink(self.socket_path)
+            else:
+                raise RuntimeError(f"Another updater daemon is listening on {self.socket_path}")
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        old_umask = os.umask(0o177)
+        try:
+            self._server = _UnixServer(self.socket_path, self)
+        finally:
+            os.umask(old_umask)
+
+    def stop(self) -> None:
+        """Ask serve_forever() to return."""
+        self._stop.set()
+
+    def serve_forever(self, run_at_start: bool = False) -> bool:
+        """
+        Serve the control socket and run the timer until SIGTERM/SIGINT or stop().
+
+        Args:
+            run_at_start: Run the scheduled command immediately instead of after one interval
+
+        Returns:
+            bool: True on a clean shutdown, False if the socket could not be bound
+        """
+        try:
+            self._bind()
+        except Exception as e:
+            log_message(f"Failed to start updater daemon: {e}", "ERROR")
+            return False
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: self.stop())
+
+        server_thread = threading.Thread(target=self._server.serve_forever, name="daemon-socket", daemon=True)
+        server_thread.start()
+        if self.interval > 0 or run_at_start:
+            threading.Thread(target=self._timer_loop, args=(run_at_start,), name="daemon-timer", daemon=True).start()
+        schedule = f"every {self.interval:g}s" if self.interval > 0 else "timer off"
+        log_message(f"Updater daemon listening on {self.socket_path} ({schedule})")
+
+        try:
+            while not self._stop.wait(1):
+                pass
+        finally:
+            log_message("Updater daemon stopping...")
+            self._server.shutdown()
+            self._server.server_close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+            # Let an active update finish rather than leaving modules half-applied
+            if self._job_lock.locked():
+                log_message("Waiting for the active job to finish...")
+                with self._job_lock:
+                    pass
+        log_message("Updater daemon stopped")
+        return True
+
+
+def send_daemon_command(socket_path: str, command: str, timeout: Optional[float] = None, **fields) -> Dict[str, Any]:
+    """
+    Send one request to a running daemon and return its response.
+
+    Args:
+        socket_path: Path of the daemon's control socket
+        command: status, check or run
+        timeout: Socket timeout in seconds; None waits for the job to finish
+        **fields: Extra request fields (e.g. wait=False)
+
+    Returns:
+        dict: The daemon's response
+
+    Raises:
+        OSError: If the daemon is not reachable
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(dict(fields, command=command)) + "\n").encode())
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError("Daemon closed the connection without a response")
+    return json.loads(line)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Shared HTTP Session
+
+One process-wide requests.Session with a keep-alive connection pool, so modules
+downloading from the same hosts reuse TCP/TLS connections within a run and, in
+daemon mode, across runs.
+
+Usage:
+    from updates.utils.http_session import get_http_session
+
+    response = get_http_session().get(url, timeout=30)
+"""
+
+import threading
+
+POOL_CONNECTIONS = 8
+POOL_MAXSIZE = 8
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Process-wide requests.Session, created on first use.
+
+    Returns:
+        requests.Session: Shared session with a pooled HTTP(S) adapter
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            # Imported lazily so the orchestrator does not load requests unless a module downloads something
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def close_http_session() -> None:
+    """Close pooled connections; the next get_http_session() call starts a new session."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
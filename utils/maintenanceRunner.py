@@ -15,6 +15,7 @@ import importlib
 from typing import Dict, Any, List, Optional
 from pathlib import Path
 from .index import log_message
+from .module_registry import get_module_registry
 
 
 class MaintenanceRunner:
@@ -33,44 +34,25 @@ class MaintenanceRunner:
         """Discover all available maintenance modules."""
         log_message("Discovering maintenance modules...")
         
-        # Check both possible module locations
-        modules_search_path = self.modules_path / "modules"
-        if not modules_search_path.exists():
-            modules_search_path = self.modules_path
-        
-        if not modules_search_path.exists():
+        registry = get_module_registry(str(self.modules_path))
+        if not os.path.exists(registry.search_path):
             log_message("No modules directory found", "WARNING")
             return
         
         discovered_count = 0
         
-        for item in os.listdir(modules_search_path):
-            item_path = modules_search_path / item
-            
-            # Skip non-directories and backup directories
-            if not item_path.is_dir() or item.endswith('.backup'):
-                continue
+        for record in registry.records():
+            item = record.name
+            item_path = Path(record.path)
             
-            # Check if module has maintenance.py
-            maintenance_file = item_path / "maintenance.py"
-            if not maintenance_file.exists():
+            # Only modules with maintenance.py
+            if not record.has_maintenance:
                 continue
             
             # Check if module is enabled
-            index_file = item_path / "index.json"
-            if index_file.exists():
-                try:
-                    with open(index_file, 'r') as f:
-                        config = json.load(f)
-                    
-                    enabled = config.get("metadata", {}).get("enabled", True)
-                    if not enabled:
-                        log_message(f"Module {item} is disabled, skipping maintenance", "DEBUG")
-                        continue
-                        
-                except Exception as e:
-                    log_message(f"Error reading config for {item}: {e}", "WARNING")
-                    continue
+            if not record.enabled:
+                log_message(f"Module {item} is disabled, skipping maintenance", "DEBUG")
+                continue
             
             # Try to import the maintenance module
             try:
@@ -24,7 +24,7 @@ This module provides shared functionality used across multiple update modules.
 
 import os
 import json
-from updates.index import log_message
+from .index import log_message
 
 
 def load_root_config():
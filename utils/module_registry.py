@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Module Registry
+
+Scans a modules directory once and keeps a compact record per module with the
+index.json fields the orchestrator, maintenance runner and CLI need. Records are
+revalidated by mtime on every query: a module's index.json is only re-parsed
+when the module directory or its index.json changed, and the modules directory
+is only re-listed when its own mtime changed.
+
+import_module_if_changed() applies the same idea to module code: an imported
+module is reused until a file in its package changes.
+"""
+
+import os
+import sys
+import json
+import threading
+from typing import Any, Dict, List, Optional
+from .index import log_message
+
+# Directories left behind by update_modules; never modules
+SKIPPED_SUFFIXES = ('.backup', '.staging')
+
+
+class ModuleRecord:
+    """Summary of one module's index.json."""
+
+    __slots__ = (
+        "name", "path", "enabled", "priority", "group", "group_order",
+        "service_name", "schema_version", "description", "branch",
+        "default_branch", "has_maintenance", "depends_on", "conflicts_with",
+        "_stamp",
+    )
+
+    def __init__(self, name: str, path: str, config: Dict[str, Any], has_maintenance: bool, stamp: tuple):
+        metadata = config.get("metadata", {})
+        self.name = name
+        self.path = path
+        self.enabled = metadata.get("enabled", True)
+        self.priority = metadata.get("priority", 100)
+        self.group = metadata.get("group")
+        self.group_order = metadata.get("group_order", 99)
+        self.service_name = metadata.get("service_name", name)
+        self.schema_version = metadata.get("schema_version")
+        self.description = metadata.get("description", "No description")
+        self.depends_on = metadata.get("depends_on")
+        self.conflicts_with = metadata.get("conflicts_with")
+        self.branch, self.default_branch = _branch_from_config(config)
+        self.has_maintenance = has_maintenance
+        self._stamp = stamp
+
+    def __repr__(self):
+        return f"ModuleRecord({self.name!r}, enabled={self.enabled}, schema_version={self.schema_version!r})"
+
+
+def _branch_from_config(config: Dict[str, Any]) -> tuple:
+    """Return (branch, default_branch) from repo.* (sbin, vault, ...) or config.repository.* (website, linker)."""
+    repo = config.get("repo")
+    if isinstance(repo, dict) and "branch" in repo:
+        return repo["branch"], repo.get("default_branch")
+    repository = config.get("config", {}).get("repository")
+    if isinstance(repository, dict) and "branch" in repository:
+        return repository["branch"], repository.get("default_branch")
+    return None, None
+
+
+def resolve_modules_search_path(modules_path: str) -> str:
+    """Modules live in <modules_path>/modules when that exists, otherwise in modules_path itself."""
+    candidate = os.path.join(modules_path, "modules")
+    return candidate if os.path.isdir(candidate) else modules_path
+
+
+class ModuleRegistry:
+    """Cached view of all modules under a modules directory."""
+
+    def __init__(self, modules_path: str):
+        self.modules_path = modules_path
+        self.search_path = resolve_modules_search_path(modules_path)
+        self._lock = threading.Lock()
+        self._dir_mtime = None
+        self._names: List[str] = []
+        self._records: Dict[str, ModuleRecord] = {}
+
+    def _refresh_names(self) -> None:
+        """Re-list the modules directory if its mtime changed. Caller holds the lock."""
+        self.search_path = resolve_modules_search_path(self.modules_path)
+        try:
+            dir_mtime = (self.search_path, os.stat(self.search_path).st_mtime_ns)
+        except OSError:
+            self._dir_mtime = None
+            self._names = []
+            self._records = {}
+            return
+
+        if dir_mtime != self._dir_mtime:
+            self._names = sorted(
+                entry.name for entry in os.scandir(self.search_path)
+                if entry.is_dir() and not entry.name.endswith(SKIPPED_SUFFIXES)
+                and not entry.name.startswith(('.', '__'))
+            )
+            self._records = {name: r for name, r in self._records.items() if name in self._names}
+            self._dir_mtime = dir_mtime
+
+    def _current(self, name: str) -> Optional[ModuleRecord]:
+        """Validate (and if needed re-parse) one record. Caller holds the lock."""
+        record = self._load_record(name)
+        if record:
+            self._records[name] = record
+        else:
+            self._records.pop(name, None)
+        return record
+
+    def refresh(self) -> List[ModuleRecord]:
+        """Bring all records up to date with the filesystem and return them sorted by name."""
+        with self._lock:
+            self._refresh_names()
+            return [r for r in (self._current(name) for name in self._names) if r]
+
+    def _load_record(self, name: str) -> Optional[ModuleRecord]:
+        """Reuse the cached record for name unless its directory or index.json changed."""
+        module_path = os.path.join(self.search_path, name)
+        index_file = os.path.join(module_path, "index.json")
+        try:
+            dir_stat = os.stat(module_path)
+            index_stat = os.stat(index_file)
+        except OSError:
+            return None
+        stamp = (dir_stat.st_mtime_ns, index_stat.st_mtime_ns, index_stat.st_size)
+
+        cached = self._records.get(name)
+        if cached is not None and cached._stamp == stamp:
+            return cached
+
+        try:
+            with open(index_file, 'r') as f:
+                config = json.load(f)
+        except Exception as e:
+            log_message(f"Error reading module '{name}': {e}", "WARNING")
+            return None
+        has_maintenance = os.path.exists(os.path.join(module_path, "maintenance.py"))
+        return ModuleRecord(name, module_path, config, has_maintenance, stamp)
+
+    def records(self) -> List[ModuleRecord]:
+        """All modules with a readable index.json, sorted by name."""
+        return self.refresh()
+
+    def names(self) -> List[str]:
+        """Names of all module directories, sorted, without reading any index.json."""
+        with self._lock:
+            self._refresh_names()
+            return list(self._names)
+
+    def get(self, name: str) -> Optional[ModuleRecord]:
+        """Record for a single module, or None if it does not exist or has no readable index.json."""
+        with self._lock:
+            self._refresh_names()
+            if name not in self._names:
+                return None
+            return self._current(name)
+
+    def enabled(self) -> List[ModuleRecord]:
+        """Enabled modules in execution order (ascending priority, then name)."""
+        return sorted((r for r in self.records() if r.enabled), key=lambda r: (r.priority, r.name))
+
+    def load_config(self, name: str) -> Dict[str, Any]:
+        """Full index.json of a module, for callers that need more than the record holds. Returns {} on failure."""
+        try:
+            with open(os.path.join(self.search_path, name, "index.json"), 'r') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+
+_registries: Dict[str, ModuleRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_module_registry(modules_path: str) -> ModuleRegistry:
+    """
+    Shared registry for a modules directory.
+
+    Args:
+        modules_path: Path to the modules directory (or its parent holding modules/)
+
+    Returns:
+        ModuleRegistry: The registry instance for that path, created on first use
+    """
+    key = os.path.abspath(modules_path)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = _registries[key] = ModuleRegistry(key)
+        return registry
+
+
+# Source fingerprint of each module package at the time it was imported
+_module_fingerprints: Dict[str, Optional[tuple]] = {}
+
+
+def _module_fingerprint(module) -> Optional[tuple]:
+    """(relpath, inode, mtime_ns, size) of every file in a module's package directory, or None."""
+    module_file = getattr(module, "__file__", None)
+    if not module_file:
+        return None
+    if os.path.basename(module_file) != "__init__.py":
+        try:
+            st = os.stat(module_file)
+        except OSError:
+            return None
+        return ((os.path.basename(module_file), st.st_ino, st.st_mtime_ns, st.st_size),)
+
+    root = os.path.dirname(module_file)
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != "__pycache__"]
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((os.path.relpath(path, root), st.st_ino, st.st_mtime_ns, st.st_size))
+    return tuple(sorted(entries))
+
+
+def import_module_if_changed(module_path: str):
+    """
+    Import a module, reusing the loaded copy while none of its package's files changed.
+
+    A one-shot run imports each module once. A daemon (--daemon) keeps modules
+    loaded between runs and only re-imports a module, with all of its
+    submodules, after update_modules() or an edit replaced its files.
+    """
+    cached = sys.modules.get(module_path)
+    if cached is not None:
+        fingerprint = _module_fingerprint(cached)
+        if fingerprint is not None and _module_fingerprints.get(module_path) == fingerprint:
+            return cached
+        # Drop the package and its submodules so they are all re-read from disk
+        prefix = module_path + "."
+        for name in [n for n in sys.modules if n == module_path or n.startswith(prefix)]:
+            del sys.modules[name]
+        if module_path in _module_fingerprints:
+            log_message(f"Reloading {module_path}: files changed since it was imported")
+
+    module = __import__(module_path, fromlist=[module_path.split('.')[-1]])
+    _module_fingerprints[module_path] = _module_fingerprint(module)
+    return module
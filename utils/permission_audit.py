@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Permission Audit
+
+Read-only check of every path modules manage against the owner, group and mode
+they expect, for `index.py --audit-permissions`.
+
+PermissionManager records every PermissionTarget it is given in a persisted
+index (path -> module, owner, group, mode, recursive). The audit merges the
+index the way a PermissionPlan does (each path checked against its most
+specific target) and stats directories in parallel on a thread pool. Nothing
+on the system is changed.
+
+Each audit also stores, per directory below recursive targets, its mtime, its
+subdirectories and the drift found among its files. An incremental audit stats
+only directories and re-lists only those whose mtime changed; the other
+directories' files keep their previous result. A directory's mtime changes when
+entries are added, removed or renamed, not when a file in it is chmod'ed or
+chown'ed, so a full audit (the default) is the authoritative one.
+
+Indexed paths that no longer exist (e.g. temp files that modules set
+permissions on before renaming them into place) are reported as missing. They
+stay in the index unless the audit is asked to prune them.
+"""
+
+import os
+import stat
+import time
+import json
+import atexit
+import threading
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from .index import log_message
+from .backup_index import write_json_atomic
+from .permission_engine import PermissionPlan, PlannedTarget, effective_mode, resolve_owner
+from .permission_snapshot import user_name, group_name
+
+DEFAULT_INDEX_PATH = "/var/lib/homeserver/updates/permission_index.json"
+DEFAULT_SCAN_STATE_PATH = "/var/cache/homeserver/updates/permission_scan.json"
+DEFAULT_AUDIT_WORKERS = min(16, (os.cpu_count() or 1) * 4)
+
+
+class PermissionIndex:
+    """Expected owner/group/mode per managed path, as last set by a module."""
+
+    def __init__(self, path: Optional[str] = DEFAULT_INDEX_PATH):
+        self.path = path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._loaded = path is None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        """Read the index file on first use. Caller holds the lock."""
+        self._loaded = True
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            # Entries recorded in this process before the first load win
+            self._entries = {**data.get("targets", {}), **self._entries}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log_message(f"Ignoring unreadable permission index {self.path}: {e}", "WARNING")
+
+    def record(self, module: str, path: str, owner: str, group: str, mode: int, recursive: bool = False) -> None:
+        """Remember the permissions a module set (or deferred) for path."""
+        path = os.path.normpath(os.path.abspath(path))
+        entry = {"module": module, "owner": str(owner), "group": str(group),
+                 "mode": format(stat.S_IMODE(mode), "04o"), "recursive": bool(recursive)}
+        with self._lock:
+            if self._entries.get(path) != entry:
+                self._entries[path] = entry
+                self._dirty = True
+
+    def forget(self, paths: List[str]) -> None:
+        """Drop paths from the index."""
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            for path in paths:
+                if self._entries.pop(path, None) is not None:
+                    self._dirty = True
+
+    def entries(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            return dict(self._entries)
+
+    def save(self) -> bool:
+        """
+        Write the index file if anything changed.
+
+        Returns:
+            bool: True if the index is persisted (or there was nothing to write)
+        """
+        with self._lock:
+            if not self._dirty or self.path is None:
+                return True
+            if not self._loaded:
+                self._load()
+            entries = dict(self._entries)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            write_json_atomic(Path(self.path), {"version": 1, "targets": entries})
+            return True
+        except OSError as e:
+            log_message(f"Could not save permission index {self.path}: {e}", "WARNING")
+            return False
+
+
+_index = PermissionIndex()
+atexit.register(_index.save)
+
+
+def get_permission_index() -> PermissionIndex:
+    """Process-wide PermissionIndex that PermissionManager records into."""
+    return _index
+
+
+@dataclass
+class PermissionDrift:
+    """A path whose owner, group or mode differs from what its module expects."""
+    path: str
+    module: str
+    expected: Tuple[int, int, int]
+    actual: Tuple[int, int, int]
+
+    def __str__(self) -> str:
+        def describe(ids: Tuple[int, int, int]) -> str:
+            uid, gid, mode = ids
+            return f"{user_name(uid)}:{group_name(gid)} {mode:04o}"
+        return f"{self.path}: {describe(self.actual)}, expected {describe(self.expected)} ({self.module})"
+
+
+@dataclass
+class AuditResult:
+    """Outcome of audit_permissions()."""
+    targets: int = 0
+    checked: int = 0
+    drift: List[PermissionDrift] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    directories_reused: int = 0
+    seconds: float = 0.0
+
+
+class _TargetScan:
+    """One target being audited: what it expects and what it leaves to other targets."""
+
+    def __init__(self, target: PlannedTarget, skip: frozenset, prune: frozenset, previous: Optional[Dict]):
+        self.target = target
+        self.skip = skip
+        self.prune = prune
+        self.signature = [target.uid, target.gid, target.mode, sorted(skip), sorted(prune)]
+        # Previous per-directory results are only valid for the same expectation
+        self.previous = previous["dirs"] if previous and previous.get("signature") == self.signature else {}
+        self.directories: Dict[str, Dict[str, Any]] = {}
+
+    def drift(self, path: str, st: os.stat_result) -> Optional[PermissionDrift]:
+        t = self.target
+        mode = stat.S_IMODE(st.st_mode)
+        # Symlinks keep their own mode (chmod -R skips them), so only ownership counts
+        if (st.st_uid == t.uid and st.st_gid == t.gid
+                and (mode == effective_mode(st.st_mode, t.mode) or stat.S_ISLNK(st.st_mode))):
+            return None
+        return PermissionDrift(path, t.module, (t.uid, t.gid, t.mode), (st.st_uid, st.st_gid, mode))
+
+
+def _visit(scan: _TargetScan, rel: str, incremental: bool) -> Tuple[List[str], int, List[PermissionDrift], str]:
+    """
+    Check one directory below a target ("" = the target itself) and, for recursive
+    targets, its non-directory entries.
+
+    Returns:
+        tuple: (subdirectories to visit, entries checked, drift, status "", "missing", "reused" or an error)
+    """
+    root = scan.target.path
+    path = os.path.join(root, rel) if rel else root
+    try:
+        # The target itself is followed if it is a symlink, entries below it are not
+        st = os.lstat(path) if rel else os.stat(path)
+    except FileNotFoundError:
+        return [], 0, [], "missing" if not rel else ""
+    except OSError as e:
+        return [], 0, [], f"{path}: {e}"
+
+    checked, drift = 0, []
+    if not rel or path not in scan.skip:
+        checked += 1
+        entry_drift = scan.drift(path, st)
+        if entry_drift:
+            drift.append(entry_drift)
+    if not (scan.target.recursive and stat.S_ISDIR(st.st_mode)) or (not rel and os.path.islink(root)):
+        return [], checked, drift, ""
+
+    previous = scan.previous.get(rel) if incremental else None
+    if previous is not None and previous["mtime_ns"] == st.st_mtime_ns:
+        scan.directories[rel] = previous
+        t = scan.target
+        drift.extend(PermissionDrift(os.path.join(path, name), t.module, (t.uid, t.gid, t.mode), (uid, gid, mode))
+                     for name, uid, gid, mode in previous["drift"])
+        return ([os.path.join(rel, name) for name in previous["subdirs"]],
+                checked + previous["entries"], drift, "reused")
+
+    subdirs, file_drift, entries = [], [], 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.path in scan.prune:
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                        continue
+                    if entry.path in scan.skip:
+                        continue
+                    entry_st = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                entries += 1
+                entry_drift = scan.drift(entry.path, entry_st)
+                if entry_drift:
+                    drift.append(entry_drift)
+                    file_drift.append([entry.name, *entry_drift.actual])
+    except OSError as e:
+        return [], checked, drift, f"{path}: {e}"
+
+    scan.directories[rel] = {"mtime_ns": st.st_mtime_ns, "subdirs": subdirs, "drift": file_drift, "entries": entries}
+    return [os.path.join(rel, name) for name in subdirs], checked + entries, drift, ""
+
+
+def _load_scan_state(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        log_message(f"Ignoring unreadable permission scan state {path}: {e}", "WARNING")
+        return {}
+
+
+def audit_permissions(incremental: bool = False, workers: int = DEFAULT_AUDIT_WORKERS,
+                      index: Optional[PermissionIndex] = None,
+                      scan_state_path: Optional[str] = DEFAULT_SCAN_STATE_PATH,
+                      prune_missing: bool = False) -> AuditResult:
+    """
+    Compare every indexed path with the owner, group and mode its module expects.
+
+    Args:
+        incremental: Re-list only directories whose mtime changed since the last audit
+        workers: Threads statting directories in parallel
+        index: PermissionIndex to audit (default: the process-wide one)
+        scan_state_path: Where per-directory results are kept between audits (None: not kept)
+        prune_missing: Drop indexed paths that no longer exist from the index
+
+    Returns:
+        AuditResult: Drift, missing paths and counts; nothing on the system is modified
+    """
+    started = time.monotonic()
+    index = index or get_permission_index()
+    result = AuditResult()
+
+    plan = PermissionPlan()
+    for path, entry in index.entries().items():
+        try:
+            uid, gid = resolve_owner(entry["owner"], entry["group"])
+            plan.register(entry["module"], path, uid, gid, int(entry["mode"], 8), entry.get("recursive", False))
+        except (KeyError, ValueError) as e:
+            result.errors.append(f"{path}: {e.args[0] if e.args else e}")
+
+    previous_state = _load_scan_state(scan_state_path) if incremental and scan_state_path else {}
+    scans = [_TargetScan(target, *plan.nested(target), previous_state.get(target.path))
+             for target in plan.targets()]
+    result.targets = len(scans)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = {executor.submit(_visit, scan, "", incremental): (scan, "") for scan in scans}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                scan, rel = pending.pop(future)
+                subdirs, checked, drift, status = future.result()
+                result.checked += checked
+                result.drift.extend(drift)
+                if status == "missing":
+                    result.missing.append(scan.target.path)
+                elif status == "reused":
+                    result.directories_reused += 1
+                elif status:
+                    result.errors.append(status)
+                for sub in subdirs:
+                    pending[executor.submit(_visit, scan, sub, incremental)] = (scan, sub)
+
+    if prune_missing and result.missing:
+        index.forget(result.missing)
+        index.save()
+    if scan_state_path:
+        try:
+            os.makedirs(os.path.dirname(scan_state_path), exist_ok=True)
+            write_json_atomic(Path(scan_state_path), {
+                scan.target.path: {"signature": scan.signature, "dirs": scan.directories}
+                for scan in scans if scan.directories
+            })
+        except OSError as e:
+            log_message(f"Could not save permission scan state {scan_state_path}: {e}", "WARNING")
+
+    result.drift.sort(key=lambda d: d.path)
+    result.seconds = time.monotonic() - started
+    return result
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Permission Engine
+
+In-process replacement for `chown [-R] owner:group path` + `chmod [-R] mode path`
+used by PermissionManager. Every entry is stat'ed first and only entries whose
+owner, group or mode differ are changed, so applying permissions that are already
+correct costs one stat per entry and no writes.
+
+Semantics follow GNU chown/chmod with a numeric mode:
+- the target path itself is followed if it is a symlink
+- below it, trees are walked with os.fwalk without following symlinks; symlinks
+  get their own ownership changed (like chown -R) and keep their mode (like chmod -R)
+- files and directories below a recursive target get the same mode
+- directories keep setuid/setgid bits the mode does not set (like chmod 755 on a
+  setgid directory); a directory differing only in those bits is left unchanged
+
+During an orchestrator run, modules can defer targets into a run-wide
+PermissionPlan (PermissionManager.set_permissions(targets, defer=True)). The
+plan merges everything registered, gives every path to its most specific
+target (the target for the path itself, else the nearest recursive target
+above it) and applies all targets in one parallel pass after the last module,
+so each path is stat'ed and changed at most once per run.
+"""
+
+import os
+import pwd
+import grp
+import stat
+import functools
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from typing import AbstractSet, Dict, List, Optional, Tuple
+from .index import log_message
+
+
+@dataclass
+class PermissionCounts:
+    """Entries changed, already correct and failed while applying permissions."""
+    changed: int = 0
+    unchanged: int = 0
+    failed: int = 0
+
+    def __iadd__(self, other: "PermissionCounts") -> "PermissionCounts":
+        self.changed += other.changed
+        self.unchanged += other.unchanged
+        self.failed += other.failed
+        return self
+
+    def __str__(self) -> str:
+        text = f"{self.changed} changed, {self.unchanged} unchanged"
+        return f"{text}, {self.failed} failed" if self.failed else text
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_uid(owner: str) -> int:
+    """uid of a user name or numeric id. Raises KeyError for unknown users."""
+    owner = str(owner)
+    if owner.isdigit():
+        return int(owner)
+    return pwd.getpwnam(owner).pw_uid
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_gid(group: str) -> int:
+    """gid of a group name or numeric id. Raises KeyError for unknown groups."""
+    group = str(group)
+    if group.isdigit():
+        return int(group)
+    return grp.getgrnam(group).gr_gid
+
+
+def effective_mode(st_mode: int, mode: int) -> int:
+    """Mode an entry ends up with: mode, plus a directory's existing setuid/setgid bits."""
+    if stat.S_ISDIR(st_mode):
+        return mode | (stat.S_IMODE(st_mode) & (stat.S_ISUID | stat.S_ISGID))
+    return mode
+
+
+def _apply_entry(name: str, st: os.stat_result, uid: int, gid: int, mode: int,
+                 counts: PermissionCounts, dir_fd: Optional[int] = None, display: str = "") -> None:
+    """Bring one entry to uid/gid/mode if it differs. name is relative to dir_fd when given."""
+    is_link = stat.S_ISLNK(st.st_mode)
+    mode = effective_mode(st.st_mode, mode)
+    touched = False
+    try:
+        if st.st_uid != uid or st.st_gid != gid:
+            os.chown(name, uid, gid, dir_fd=dir_fd, follow_symlinks=not is_link)
+            touched = True
+        # chown clears setuid/setgid bits, so the mode is re-applied after an ownership change
+        if not is_link and (touched or stat.S_IMODE(st.st_mode) != mode):
+            os.chmod(name, mode, dir_fd=dir_fd)
+            touched = True
+    except OSError as e:
+        log_message(f"Failed to set permissions for {display or name}: {e}", "ERROR")
+        counts.failed += 1
+        return
+    if touched:
+        counts.changed += 1
+    else:
+        counts.unchanged += 1
+
+
+def apply_tree_permissions(path: str, uid: int, gid: int, mode: int, recursive: bool = False,
+                           skip: AbstractSet[str] = frozenset(), prune: AbstractSet[str] = frozenset()) -> PermissionCounts:
+    """
+    Set owner, group and mode of path (and everything below it if recursive), changing only what differs.
+
+    Args:
+        path: File or directory; followed if it is a symlink
+        uid: Owner uid
+        gid: Group gid
+        mode: Permission bits (e.g. 0o755), applied to files and directories alike
+        recursive: Also apply to everything below a directory
+        skip: Paths below path to leave alone (still descended into)
+        prune: Directories below path to leave alone together with their contents
+
+    Returns:
+        PermissionCounts: Entries changed, unchanged and failed
+    """
+    counts = PermissionCounts()
+    mode = stat.S_IMODE(mode)
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        log_message(f"Failed to set permissions for {path}: {e}", "ERROR")
+        counts.failed += 1
+        return counts
+    _apply_entry(path, st, uid, gid, mode, counts)
+
+    if not (recursive and stat.S_ISDIR(st.st_mode)):
+        return counts
+
+    for dirpath, dirnames, filenames, dirfd in os.fwalk(path, follow_symlinks=False):
+        if prune:
+            dirnames[:] = [name for name in dirnames if os.path.join(dirpath, name) not in prune]
+        for name in dirnames + filenames:
+            if skip and os.path.join(dirpath, name) in skip:
+                continue
+            try:
+                entry_st = os.stat(name, dir_fd=dirfd, follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                log_message(f"Failed to stat {os.path.join(dirpath, name)}: {e}", "ERROR")
+                counts.failed += 1
+                continue
+            _apply_entry(name, entry_st, uid, gid, mode, counts, dir_fd=dirfd,
+                         display=os.path.join(dirpath, name))
+    return counts
+
+
+def resolve_owner(owner: str, group: str) -> Tuple[int, int]:
+    """(uid, gid) for owner and group. Raises KeyError naming the unknown user or group."""
+    try:
+        uid = resolve_uid(owner)
+    except KeyError:
+        raise KeyError(f"invalid user: '{owner}'")
+    try:
+        gid = resolve_gid(group)
+    except KeyError:
+        raise KeyError(f"invalid group: '{group}'")
+    return uid, gid
+
+
+DEFAULT_PLAN_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+
+@dataclass
+class PlannedTarget:
+    """A permission target registered into a PermissionPlan, with resolved ids."""
+    path: str
+    uid: int
+    gid: int
+    mode: int
+    recursive: bool
+    module: str
+
+    def same_permissions(self, other: "PlannedTarget") -> bool:
+        return (self.uid, self.gid, self.mode) == (other.uid, other.gid, other.mode)
+
+
+class PermissionPlan:
+    """Run-wide set of permission targets, applied once after all modules ran."""
+
+    def __init__(self):
+        self._targets: Dict[str, PlannedTarget] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._targets)
+
+    def register(self, module: str, path: str, uid: int, gid: int, mode: int, recursive: bool = False) -> None:
+        """Add a target. A later target for the same path replaces an earlier one (logged if they differ)."""
+        path = os.path.normpath(os.path.abspath(path))
+        target = PlannedTarget(path, uid, gid, stat.S_IMODE(mode), recursive, module)
+        with self._lock:
+            existing = self._targets.get(path)
+            if existing is not None:
+                if not existing.same_permissions(target):
+                    log_message(f"Permission conflict for {path}: {module} ({uid}:{gid} {oct(target.mode)}) "
+                                f"overrides {existing.module} ({existing.uid}:{existing.gid} {oct(existing.mode)})",
+                                "WARNING")
+                elif existing.recursive and not recursive:
+                    return
+            self._targets[path] = target
+
+    def targets(self) -> List[PlannedTarget]:
+        with self._lock:
+            return sorted(self._targets.values(), key=lambda t: t.path)
+
+    def nested(self, target: PlannedTarget) -> Tuple[frozenset, frozenset]:
+        """
+        Paths below a recursive target that other targets own.
+
+        Returns:
+            tuple: (paths to skip, directories to prune) for apply_tree_permissions()
+        """
+        if not target.recursive:
+            return frozenset(), frozenset()
+        prefix = target.path.rstrip("/") + "/"
+        inner = [t for t in self.targets() if t.path.startswith(prefix)]
+        return frozenset(t.path for t in inner), frozenset(t.path for t in inner if t.recursive)
+
+    def apply(self, workers: int = DEFAULT_PLAN_WORKERS) -> PermissionCounts:
+        """
+        Apply every target in parallel, each path by its most specific target only.
+
+        Returns:
+            PermissionCounts: Totals over all targets
+        """
+        targets = self.targets()
+        total = PermissionCounts()
+        if not targets:
+            return total
+
+        def apply_one(target: PlannedTarget) -> PermissionCounts:
+            if not os.path.exists(target.path):
+                return PermissionCounts()
+            skip, prune = self.nested(target)
+            return apply_tree_permissions(target.path, target.uid, target.gid, target.mode,
+                                          target.recursive, skip=skip, prune=prune)
+
+        log_message(f"Applying permission plan: {len(targets)} targets from "
+                    f"{len({t.module for t in targets})} modules")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for counts in executor.map(apply_one, targets):
+                total += counts
+        log_message(f"Permission plan applied: {total}")
+        return total
+
+
+_plan: Optional[PermissionPlan] = None
+_plan_lock = threading.Lock()
+
+
+def begin_permission_plan() -> PermissionPlan:
+    """Start collecting deferred permission targets for this run."""
+    global _plan
+    with _plan_lock:
+        _plan = PermissionPlan()
+        return _plan
+
+
+def get_permission_plan() -> Optional[PermissionPlan]:
+    """The plan of the current run, or None outside an orchestrator run."""
+    return _plan
+
+
+def apply_permission_plan(workers: int = DEFAULT_PLAN_WORKERS) -> Optional[PermissionCounts]:
+    """
+    Apply and close the current plan.
+
+    Returns:
+        PermissionCounts: Totals, or None if no plan was active
+    """
+    global _plan
+    with _plan_lock:
+        plan, _plan = _plan, None
+    if plan is None:
+        return None
+    return plan.apply(workers)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Permission Snapshots
+
+Compact record of mode/uid/gid for every path below a set of roots, used by
+StateManager instead of one JSON dict per file. On disk (permissions.bin):
+
+    b"HSPERM1\\n" + zlib(
+        uint32 count, uint32 names_length,
+        uint32[count] mode, uint32[count] uid, uint32[count] gid,   (little endian)
+        names JSON {"users": {uid: name}, "groups": {gid: name}},
+        paths joined by NUL (utf-8, surrogateescape)
+    )
+
+User and group names are looked up once per distinct id. Applying a snapshot
+stats every path and only calls chown/chmod where the current value differs.
+"""
+
+import os
+import sys
+import grp
+import pwd
+import json
+import stat
+import zlib
+import struct
+import functools
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+from .index import log_message
+
+MAGIC = b"HSPERM1\n"
+_HEADER = struct.Struct("<II")
+
+
+@functools.lru_cache(maxsize=None)
+def user_name(uid: int) -> str:
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return str(uid)
+
+
+@functools.lru_cache(maxsize=None)
+def group_name(gid: int) -> str:
+    try:
+        return grp.getgrgid(gid).gr_name
+    except KeyError:
+        return str(gid)
+
+
+def _uint32_bytes(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array("I", values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _uint32_array(data: bytes) -> array:
+    values = array("I")
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class PermissionSnapshot:
+    """Columnar mode/uid/gid table."""
+
+    def __init__(self):
+        self.paths: List[str] = []
+        self.modes = array("I")
+        self.uids = array("I")
+        self.gids = array("I")
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, path: str, st: os.stat_result) -> None:
+        self.paths.append(path)
+        self.modes.append(st.st_mode)
+        self.uids.append(st.st_uid)
+        self.gids.append(st.st_gid)
+
+    def entries(self) -> Iterable[Tuple[str, int, int, int]]:
+        return zip(self.paths, self.modes, self.uids, self.gids)
+
+    def to_bytes(self) -> bytes:
+        names = json.dumps({
+            "users": {uid: user_name(uid) for uid in set(self.uids)},
+            "groups": {gid: group_name(gid) for gid in set(self.gids)},
+        }).encode()
+        body = b"".join([
+            _HEADER.pack(len(self.paths), len(names)),
+            _uint32_bytes(self.modes), _uint32_bytes(self.uids), _uint32_bytes(self.gids),
+            names,
+            "\0".join(self.paths).encode("utf-8", "surrogateescape"),
+        ])
+        return MAGIC + zlib.compress(body, 6)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PermissionSnapshot":
+        if not data.startswith(MAGIC):
+            raise ValueError("not a permission snapshot")
+        body = zlib.decompress(data[len(MAGIC):])
+        count, names_length = _HEADER.unpack_from(body)
+        offset = _HEADER.size
+        snapshot = cls()
+        for column in ("modes", "uids", "gids"):
+            setattr(snapshot, column, _uint32_array(body[offset:offset + 4 * count]))
+            offset += 4 * count
+        offset += names_length
+        paths = body[offset:].decode("utf-8", "surrogateescape")
+        snapshot.paths = paths.split("\0") if count else []
+        if len(snapshot.paths) != count:
+            raise ValueError("corrupt permission snapshot")
+        return snapshot
+
+    def write(self, path: Path) -> None:
+        """Write atomically (temp file + rename)."""
+        tmp_path = Path(f"{path}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "PermissionSnapshot":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    @classmethod
+    def from_legacy(cls, permissions: List[Dict]) -> "PermissionSnapshot":
+        """Build from the per-file dicts older backups stored inline in module_backups.json."""
+        snapshot = cls()
+        for entry in permissions:
+            snapshot.paths.append(entry["path"])
+            snapshot.modes.append(entry["mode"])
+            snapshot.uids.append(entry["uid"])
+            snapshot.gids.append(entry["gid"])
+        return snapshot
+
+
+def capture_permissions(roots: Iterable[str]) -> PermissionSnapshot:
+    """
+    Record mode/uid/gid of every root and everything below it (following symlinks like os.stat).
+
+    Args:
+        roots: Files or directories; missing ones are skipped
+
+    Returns:
+        PermissionSnapshot: One entry per readable path
+    """
+    snapshot = PermissionSnapshot()
+    for root in roots:
+        try:
+            st = os.stat(root)
+        except OSError:
+            continue
+        snapshot.add(root, st)
+        if not stat.S_ISDIR(st.st_mode):
+            continue
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError as e:
+                log_message(f"Failed to get permissions below {directory}: {e}", "WARNING")
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_symlink() and entry.is_dir():
+                        # Symlinked directories are neither descended into nor recorded
+                        continue
+                    snapshot.add(entry.path, entry.stat())
+                except OSError:
+                    continue
+    return snapshot
+
+
+def apply_permissions(snapshot: PermissionSnapshot) -> Tuple[int, int, int]:
+    """
+    Restore ownership and mode of every entry whose current value differs.
+
+    Returns:
+        tuple: (entries changed, entries already correct, entries missing or failed)
+    """
+    changed = unchanged = failed = 0
+    for path, mode, uid, gid in snapshot.entries():
+        try:
+            st = os.stat(path)
+        except OSError:
+            failed += 1
+            continue
+        touched = False
+        if st.st_uid != uid or st.st_gid != gid:
+            try:
+                os.chown(path, uid, gid)
+                touched = True
+            except OSError as e:
+                log_message(f"Failed to restore ownership for {path}: {e}", "WARNING")
+        # chown clears setuid/setgid bits, so re-apply the mode after an ownership change
+        if touched or stat.S_IMODE(st.st_mode) != stat.S_IMODE(mode):
+            try:
+                os.chmod(path, stat.S_IMODE(mode))
+                touched = True
+            except OSError as e:
+                log_message(f"Failed to restore permissions for {path}: {e}", "WARNING")
+        if touched:
+            changed += 1
+        else:
+            unchanged += 1
+    return changed, unchanged, failed
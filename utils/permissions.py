@@ -22,17 +22,19 @@ Permission Management Utilities
 
 This module provides utilities for managing file and directory permissions
 across all update modules. It handles common permission scenarios and
-provides consistent error handling and logging.
+provides consistent error handling and logging. Permissions are applied in
+process by permission_engine.py, which only changes entries that differ.
 """
 
 import os
 import pwd
 import grp
-import subprocess
 import stat
 from typing import List, Dict, Any, Optional, Union
 from dataclasses import dataclass
 from .index import log_message
+from .permission_engine import PermissionCounts, PermissionPlan, apply_tree_permissions, resolve_owner, get_permission_plan
+from .permission_audit import get_permission_index
 
 
 @dataclass
@@ -60,23 +62,37 @@ class PermissionManager:
     
     def __init__(self, module_name: str = "unknown"):
         self.module_name = module_name
+        self.counts = PermissionCounts()  # Entries changed/unchanged/failed by this manager so far
     
-    def set_permissions(self, targets: List[PermissionTarget]) -> bool:
+    def set_permissions(self, targets: List[PermissionTarget], defer: bool = False, record: bool = True) -> bool:
         """
         Set permissions for multiple targets.
         
         Args:
             targets: List of PermissionTarget objects
+            defer: During an orchestrator run, register the targets in the run-wide
+                   permission plan instead of applying them now (applied immediately
+                   when no plan is active)
+            record: Remember the targets for --audit-permissions; pass False for temp files
+                    that are renamed into place and record the final path with record_permissions()
             
         Returns:
-            bool: True if all permissions were set successfully, False otherwise
+            bool: True if all permissions were set (or registered) successfully, False otherwise
         """
         if not targets:
             log_message("No permission targets specified", "WARNING")
             return True
         
+        if record:
+            self.record_permissions(targets)
+        
+        plan = get_permission_plan() if defer else None
+        if plan is not None:
+            return self._register_permissions(plan, targets)
+        
         success_count = 0
         total_targets = len(targets)
+        counts_before = PermissionCounts(self.counts.changed, self.counts.unchanged, self.counts.failed)
         
         log_message(f"Setting permissions for {total_targets} targets...")
         
@@ -86,6 +102,10 @@ class PermissionManager:
             else:
                 log_message(f"Failed to set permissions for {target.path}", "ERROR")
         
+        changed = self.counts.changed - counts_before.changed
+        unchanged = self.counts.unchanged - counts_before.unchanged
+        log_message(f"Permission entries: {changed} changed, {unchanged} already correct")
+        
         if success_count == total_targets:
             log_message(f"Successfully set permissions for all {total_targets} targets")
             return True
@@ -93,8 +113,28 @@ class PermissionManager:
             log_message(f"Set permissions for {success_count}/{total_targets} targets", "WARNING")
             return success_count > 0  # Partial success is still useful
     
+    def record_permissions(self, targets: List[PermissionTarget]) -> None:
+        """Remember what this module expects for targets, for --audit-permissions, without applying anything."""
+        index = get_permission_index()
+        for target in targets:
+            index.record(self.module_name, target.path, target.owner, target.group, target.mode, target.recursive)
+    
+    def _register_permissions(self, plan: PermissionPlan, targets: List[PermissionTarget]) -> bool:
+        """Add targets to the run-wide permission plan."""
+        registered = 0
+        for target in targets:
+            try:
+                uid, gid = resolve_owner(target.owner, target.group)
+            except KeyError as e:
+                log_message(f"Failed to set ownership for {target.path}: {e.args[0]}", "ERROR")
+                continue
+            plan.register(self.module_name, target.path, uid, gid, target.mode, target.recursive)
+            registered += 1
+        log_message(f"Deferred {registered}/{len(targets)} permission targets to the end of the run")
+        return registered > 0  # Partial success is still useful
+    
     def _set_single_permission(self, target: PermissionTarget) -> bool:
-        """Set permissions for a single target."""
+        """Set permissions for a single target, changing only entries that differ."""
         path = target.path
         
         # Check if path exists
@@ -103,55 +143,18 @@ class PermissionManager:
             return True  # Not an error if path doesn't exist
         
         try:
-            # Set ownership
-            if not self._set_ownership(path, target.owner, target.group, target.recursive):
-                return False
-            
-            # Set permissions
-            if not self._set_mode(path, target.mode, target.recursive):
-                return False
-            
-            log_message(f"✓ Set permissions for {path} ({target.owner}:{target.group} {oct(target.mode)})")
-            return True
-            
-        except Exception as e:
-            log_message(f"Error setting permissions for {path}: {e}", "ERROR")
+            uid, gid = resolve_owner(target.owner, target.group)
+        except KeyError as e:
+            log_message(f"Failed to set ownership for {path}: {e.args[0]}", "ERROR")
             return False
-    
-    def _set_ownership(self, path: str, owner: str, group: str, recursive: bool = False) -> bool:
-        """Set file/directory ownership."""
-        try:
-            cmd = ["chown"]
-            if recursive and os.path.isdir(path):
-                cmd.append("-R")
-            cmd.extend([f"{owner}:{group}", path])
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-            
-            if result.returncode != 0:
-                log_message(f"Failed to set ownership for {path}: {result.stderr}", "ERROR")
-                return False
-            
-            return True
-            
-        except Exception as e:
-            log_message(f"Error setting ownership for {path}: {e}", "ERROR")
-            return False
-    
-    def _set_mode(self, path: str, mode: int, recursive: bool = False) -> bool:
-        """Set file/directory permissions."""
+        
         try:
-            cmd = ["chmod"]
-            if recursive and os.path.isdir(path):
-                cmd.append("-R")
-            cmd.extend([oct(mode)[2:], path])  # Convert 0o755 to "755"
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-            
-            if result.returncode != 0:
-                log_message(f"Failed to set permissions for {path}: {result.stderr}", "ERROR")
+            counts = apply_tree_permissions(path, uid, gid, target.mode, target.recursive)
+            self.counts += counts
+            if counts.failed:
                 return False
             
+            log_message(f"✓ Set permissions for {path} ({target.owner}:{target.group} {oct(target.mode)}): {counts}")
             return True
             
         except Exception as e:
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Service State Cache
+
+Shared cache of systemd unit states. Any number of units are fetched with a
+single `systemctl show -p ActiveState,SubState,UnitFileState unit1 unit2 ...`
+call instead of one or two `systemctl is-active`/`is-enabled` processes per unit.
+
+Entries are dropped whenever a unit is started, stopped, restarted, enabled or
+disabled through run_systemctl(), and expire after a short max age so changes
+made behind the cache's back (plain subprocess calls) are picked up as well.
+
+Usage:
+    from updates.utils.service_state import prefetch_service_states, is_service_active, run_systemctl
+
+    prefetch_service_states(["gogs", "forgejo"])   # one systemctl call
+    if is_service_active("gogs"):                   # served from the cache
+        run_systemctl("restart", "gogs")            # invalidates gogs
+    is_service_active("gogs", fresh=True)           # polling: always asks systemd
+    run_systemctl_each("start", ["gogs", "nginx"])  # one call, {"gogs": True, "nginx": False}
+"""
+
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+from .index import log_message
+
+DEFAULT_MAX_AGE = 10.0
+DEFAULT_JOB_TIMEOUT = 300.0
+SHOW_PROPERTIES = ("ActiveState", "SubState", "UnitFileState")
+
+# systemctl verbs that only read state and never need to invalidate anything
+_QUERY_ACTIONS = {"show", "status", "cat", "is-active", "is-enabled", "is-failed", "list-units", "list-unit-files"}
+
+
+def _unit_key(unit: str) -> str:
+    """Canonical unit name; systemctl treats a name without a suffix as a .service unit."""
+    return unit if "." in unit else f"{unit}.service"
+
+
+@dataclass
+class ServiceState:
+    """ActiveState/SubState/UnitFileState of one unit as reported by systemctl show."""
+    unit: str
+    active_state: str = "unknown"
+    sub_state: str = "unknown"
+    unit_file_state: str = ""
+    fetched_at: float = 0.0
+
+    @property
+    def active(self) -> bool:
+        """Same answer as `systemctl is-active --quiet`."""
+        return self.active_state in ("active", "reloading")
+
+    @property
+    def enabled(self) -> bool:
+        """Same answer as `systemctl is-enabled` printing "enabled"."""
+        return self.unit_file_state == "enabled"
+
+
+class ServiceStateCache:
+    """Batched, invalidating cache of systemd unit states."""
+
+    def __init__(self, max_age: float = DEFAULT_MAX_AGE):
+        self.max_age = max_age
+        self._states: Dict[str, ServiceState] = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, unit: str, now: float) -> Optional[ServiceState]:
+        state = self._states.get(unit)
+        if state is not None and now - state.fetched_at <= self.max_age:
+            return state
+        return None
+
+    def _show(self, units: List[str]) -> Dict[str, ServiceState]:
+        """Run one systemctl show for units. Returns {} if systemctl could not be run."""
+        try:
+            result = subprocess.run(
+                ["systemctl", "show", "-p", ",".join(SHOW_PROPERTIES), "--", *units],
+                capture_output=True, text=True, timeout=15
+            )
+        except Exception as e:
+            log_message(f"systemctl show failed: {e}", "WARNING")
+            return {}
+        if result.returncode != 0:
+            return {}
+
+        # One block of Key=Value lines per unit, in argument order, separated by blank lines
+        blocks = result.stdout.strip().split("\n\n")
+        if len(blocks) != len(units):
+            return {}
+
+        now = time.monotonic()
+        states = {}
+        for unit, block in zip(units, blocks):
+            props = dict(line.split("=", 1) for line in block.splitlines() if "=" in line)
+            states[unit] = ServiceState(
+                unit=unit,
+                active_state=props.get("ActiveState") or "unknown",
+                sub_state=props.get("SubState") or "unknown",
+                unit_file_state=props.get("UnitFileState", ""),
+                fetched_at=now,
+            )
+        return states
+
+    def prefetch(self, units: Iterable[str]) -> None:
+        """Fetch every unit in units that is not cached yet with a single systemctl call."""
+        now = time.monotonic()
+        with self._lock:
+            keys = (_unit_key(u) for u in units if u)
+            missing = list(dict.fromkeys(k for k in keys if self._fresh(k, now) is None))
+        if not missing:
+            return
+
+        states = self._show(missing)
+        if not states and len(missing) > 1:
+            # A single bad unit name fails the whole batch; fall back to one call per unit
+            for unit in missing:
+                states.update(self._show([unit]))
+        with self._lock:
+            self._states.update(states)
+
+    def get(self, unit: str) -> ServiceState:
+        """State of unit, fetched on a cache miss. Unknown if systemctl could not report it."""
+        key = _unit_key(unit)
+        with self._lock:
+            state = self._fresh(key, time.monotonic())
+        if state is None:
+            self.prefetch([key])
+            with self._lock:
+                state = self._states.get(key)
+        return state or ServiceState(unit=key)
+
+    def invalidate(self, units: Optional[Iterable[str]] = None) -> None:
+        """Drop cached state for units, or for everything when units is None."""
+        with self._lock:
+            if units is None:
+                self._states.clear()
+            else:
+                for unit in units:
+                    self._states.pop(_unit_key(unit), None)
+
+
+_cache = ServiceStateCache()
+
+
+def get_service_state_cache() -> ServiceStateCache:
+    """Process-wide ServiceStateCache shared by the orchestrator, StateManager and modules."""
+    return _cache
+
+
+def prefetch_service_states(units: Iterable[str]) -> None:
+    """Load the state of all units with one systemctl call."""
+    _cache.prefetch(units)
+
+
+def get_service_state(unit: str) -> ServiceState:
+    """Cached ServiceState for unit."""
+    return _cache.get(unit)
+
+
+def is_service_active(unit: str, fresh: bool = False) -> bool:
+    """
+    Return True if the unit is active (cached equivalent of `systemctl is-active --quiet`).
+
+    Args:
+        unit: Unit name
+        fresh: Ask systemd again instead of using a cached state; loops waiting for a
+               unit to stop or start must pass True, or they keep seeing the first answer
+    """
+    if fresh:
+        _cache.invalidate([unit])
+    return _cache.get(unit).active
+
+
+def is_service_enabled(unit: str) -> bool:
+    """Return True if the unit is enabled (cached equivalent of `systemctl is-enabled`)."""
+    return _cache.get(unit).enabled
+
+
+def run_systemctl(action: str, *units: str, check: bool = False, timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+    """
+    Run `systemctl <action> <units...>` and drop the cached state of the units it touches.
+
+    Args:
+        action: systemctl verb (start, stop, restart, enable, disable, daemon-reload, ...)
+        *units: Unit names the action applies to
+        check: Raise subprocess.CalledProcessError on a non-zero exit status
+        timeout: Optional timeout in seconds
+
+    Returns:
+        subprocess.CompletedProcess: The finished systemctl process (text output captured)
+    """
+    try:
+        return subprocess.run(
+            ["systemctl", action, *units],
+            capture_output=True, text=True, check=check, timeout=timeout
+        )
+    finally:
+        if action not in _QUERY_ACTIONS:
+            _cache.invalidate(units or None)
+
+
+# What a unit's state must look like after each action for that unit to count as done
+_ACTION_RESULTS = {
+    "start": lambda state: state.active,
+    "restart": lambda state: state.active,
+    "stop": lambda state: not state.active,
+    "enable": lambda state: state.enabled,
+    "disable": lambda state: not state.enabled,
+}
+
+
+def run_systemctl_each(action: str, units: Iterable[str], timeout: Optional[float] = DEFAULT_JOB_TIMEOUT) -> Dict[str, bool]:
+    """
+    Apply action to all units with one systemctl call and report the outcome per unit.
+
+    systemd queues one job per unit and runs them concurrently, so the call takes about
+    as long as the slowest unit. If it fails or times out, each unit's state is read back
+    to tell which units actually reached the target state.
+
+    Args:
+        action: start, stop, restart, enable or disable
+        units: Unit names
+        timeout: Seconds to wait for all jobs
+
+    Returns:
+        dict: unit -> True if the action succeeded for it
+    """
+    units = list(dict.fromkeys(u for u in units if u))
+    if not units:
+        return {}
+    try:
+        result = run_systemctl(action, *units, timeout=timeout)
+        if result.returncode == 0:
+            return {unit: True for unit in units}
+        error = result.stderr.strip()
+    except subprocess.TimeoutExpired:
+        error = f"timed out after {timeout:g}s"
+    except OSError as e:
+        log_message(f"systemctl {action} failed: {e}", "WARNING")
+        return {unit: False for unit in units}
+
+    log_message(f"systemctl {action} {' '.join(units)}: {error}", "WARNING")
+    reached = _ACTION_RESULTS.get(action)
+    if reached is None or len(units) == 1:
+        return {unit: False for unit in units}
+    _cache.invalidate(units)
+    _cache.prefetch(units)
+    return {unit: reached(_cache.get(unit)) for unit in units}
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+SQLite Backups
+
+Consistent copies of live SQLite databases for StateManager, made with SQLite's
+online backup API instead of copying the file. The copy advances a fixed number
+of pages per step and releases the database lock between steps, so the service
+keeps writing while it is backed up, and WAL-mode databases include committed
+transactions that are still only in the -wal file.
+
+Incremental mode stores the copy in the backup object store in chunks of
+CHUNK_PAGES pages, so pages unchanged since an earlier backup (of any module)
+are stored once. A chunk list replaces the .sqlite file:
+
+    {"version": 1, "page_size": 4096, "size": 1048576, "chunks": [sha256, ...]}
+"""
+
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Tuple
+from .index import log_message
+from .backup_store import BlobStore
+
+SQLITE_BACKUP_PAGES = 1024
+SQLITE_BACKUP_SLEEP = 0.005
+CHUNK_PAGES = 16
+CHUNKS_VERSION = 1
+
+
+def _readonly_uri(path: str) -> str:
+    return f"{Path(path).absolute().as_uri()}?mode=ro"
+
+
+def online_backup(source: str, target: str, pages: int = SQLITE_BACKUP_PAGES) -> int:
+    """
+    Copy a (possibly live) SQLite database with the online backup API.
+
+    Args:
+        source: Database to read
+        target: File to write; replaced if it exists
+        pages: Pages copied per step; writers can commit between steps
+
+    Returns:
+        int: Number of pages copied
+    """
+    if not os.path.exists(source):
+        raise FileNotFoundError(source)
+    if os.path.exists(target):
+        os.unlink(target)
+    steps = 0
+    total = 0
+
+    def progress(status: int, remaining: int, page_count: int) -> None:
+        nonlocal steps, total
+        steps += 1
+        total = page_count
+
+    src = sqlite3.connect(_readonly_uri(source), uri=True)
+    try:
+        dst = sqlite3.connect(target)
+        try:
+            src.backup(dst, pages=pages, progress=progress, sleep=SQLITE_BACKUP_SLEEP)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    log_message(f"SQLite online backup of {source}: {total} pages in {steps} step(s)")
+    return total
+
+
+def online_restore(backup: str, target: str, pages: int = SQLITE_BACKUP_PAGES) -> None:
+    """
+    Write a backed-up database into target through SQLite, so target's journal/WAL stay consistent.
+
+    Args:
+        backup: Backup copy to read
+        target: Database to overwrite (created if missing)
+        pages: Pages copied per step
+    """
+    Path(target).parent.mkdir(parents=True, exist_ok=True)
+    src = sqlite3.connect(_readonly_uri(backup), uri=True)
+    try:
+        dst = sqlite3.connect(target)
+        try:
+            src.backup(dst, pages=pages, sleep=SQLITE_BACKUP_SLEEP)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+
+def store_database(store: BlobStore, source: str, chunks_file: Path) -> Tuple[int, int]:
+    """
+    Back up a database into the object store as deduplicated page chunks.
+
+    The caller holds the store lock (shared).
+
+    Args:
+        store: Object store receiving the chunks
+        source: Database to back up
+        chunks_file: Where to write the chunk list
+
+    Returns:
+        tuple: (database size, bytes newly stored)
+    """
+    store.tmp_dir.mkdir(parents=True, exist_ok=True)
+    fd, snapshot = tempfile.mkstemp(dir=store.tmp_dir, suffix=".sqlite")
+    os.close(fd)
+    try:
+        online_backup(source, snapshot)
+        conn = sqlite3.connect(_readonly_uri(snapshot), uri=True)
+        try:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        finally:
+            conn.close()
+        chunk_size = page_size * CHUNK_PAGES
+        chunks = []
+        stored = 0
+        with open(snapshot, "rb") as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                digest, new_bytes = store.put_bytes(data)
+                chunks.append(digest)
+                stored += new_bytes
+        size = os.path.getsize(snapshot)
+    finally:
+        os.unlink(snapshot)
+
+    tmp_file = chunks_file.with_name(chunks_file.name + ".tmp")
+    with open(tmp_file, "w") as f:
+        json.dump({"version": CHUNKS_VERSION, "page_size": page_size, "size": size, "chunks": chunks}, f)
+    os.replace(tmp_file, chunks_file)
+    return size, stored
+
+
+def load_chunks(chunks_file: Path) -> Dict[str, Any]:
+    """Parsed chunk list written by store_database()."""
+    with open(chunks_file, "r") as f:
+        chunk_list = json.load(f)
+    if chunk_list.get("version") != CHUNKS_VERSION:
+        raise ValueError(f"Unsupported chunk list version in {chunks_file}")
+    return chunk_list
+
+
+def restore_database(store: BlobStore, chunks_file: Path, target: str) -> None:
+    """Reassemble a chunked backup and write it into target with replace_database()."""
+    chunk_list = load_chunks(chunks_file)
+    # Not in the store's tmp dir: garbage collection clears that without waiting for restores
+    fd, snapshot = tempfile.mkstemp(dir=chunks_file.parent, suffix=".sqlite")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for digest in chunk_list["chunks"]:
+                f.write(store.read_bytes(digest))
+        if os.path.getsize(snapshot) != chunk_list["size"]:
+            raise ValueError(f"Reassembled database size does not match {chunks_file}")
+        replace_database(snapshot, target)
+    finally:
+        os.unlink(snapshot)
+
+
+def replace_database(backup: str, target: str) -> None:
+    """
+    Overwrite target with a backup copy: through SQLite when target is a readable
+    database, otherwise by replacing the file (dropping any stale -wal/-shm).
+    """
+    try:
+        online_restore(backup, target)
+        return
+    except sqlite3.DatabaseError as e:
+        log_message(f"Cannot restore {target} through SQLite ({e}); replacing the file", "WARNING")
+    for suffix in ("-wal", "-shm"):
+        try:
+            os.unlink(target + suffix)
+        except FileNotFoundError:
+            pass
+    tmp_target = f"{target}.restore.tmp"
+    shutil.copyfile(backup, tmp_target)
+    os.replace(tmp_target, target)
@@ -23,10 +23,15 @@ State Manager for Updates System
 Simple single-backup-per-module state management system. Each module gets exactly one 
 backup slot that is clobbered on each update cycle. No timelines, no cleanup needed.
 
+File contents are kept in a content-addressed store shared by all modules under the
+backup root (see backup_store.py): a backup writes only files that changed since the
+previous one, and the file manifests of the last few backups are kept as generations.
+
 Key Features:
 - Single backup per module (no timeline management)
 - Automatic previous backup clobbering
 - File, service, and database state capture
+- Deduplicated file storage with cheap older generations
 - Simple restore by module name
 - Predictable backup locations
 
@@ -47,37 +52,31 @@ import json
 import shutil
 import subprocess
 import time
-import hashlib
 import tempfile
-import stat
-import pwd
-import grp
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Union, Tuple
-from dataclasses import dataclass, asdict
+from typing import Dict, List, Any, Mapping, Optional, Union, Tuple
+from dataclasses import dataclass, asdict, field
 from .index import log_message
+from .service_state import prefetch_service_states, get_service_state, run_systemctl_each
+from .checksum import file_sha256, tree_digest
+from .permission_snapshot import PermissionSnapshot, capture_permissions, apply_permissions
+from .backup_index import BackupIndex, LazyRecords
+from .backup_archive import write_archive, extract_archive, find_archive
+from .sqlite_backup import online_backup, replace_database, store_database, restore_database, load_chunks
+from .backup_store import (
+    BlobStore, ManifestBuilder, SNAPSHOT_MODES,
+    restore_path, delta_restore_path, verify_path, load_manifest, write_manifest, manifest_digests
+)
+
+DEFAULT_KEEP_GENERATIONS = 3
+DEFAULT_SNAPSHOT_MODE = "auto"
+DEFAULT_DB_JOBS = max(1, os.cpu_count() or 1)
+PG_DUMP_COMPRESSION = "6"
 
 class StateManagerError(Exception):
     """Custom exception for state manager operation failures."""
     pass
 
-@dataclass
-class FilePermissionInfo:
-    """Information about file permissions and ownership."""
-    path: str
-    mode: int
-    uid: int
-    gid: int
-    owner: str
-    group: str
-    
-    def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
-    
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> 'FilePermissionInfo':
-        return cls(**data)
-
 @dataclass
 class ModuleBackupInfo:
     """Information about a module's backup state."""
@@ -89,7 +88,8 @@ class ModuleBackupInfo:
     services: List[str]  
     databases: List[Dict[str, str]]
     checksum: str
-    file_permissions: List[Dict[str, Any]]  # Store permission info
+    file_permissions: List[Dict[str, Any]]  # Inline permission info of older backups; now in permissions.bin
+    database_stats: List[Dict[str, Any]] = field(default_factory=list)  # Per database: format, jobs, seconds, bytes
     
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
@@ -109,217 +109,219 @@ class StateManager:
     clobbers the previous backup for that module.
     """
     
-    def __init__(self, backup_dir: str = "/var/backups/updates"):
+    def __init__(self, backup_dir: str = "/var/backups/updates", keep_generations: int = DEFAULT_KEEP_GENERATIONS,
+                 snapshot_mode: str = DEFAULT_SNAPSHOT_MODE):
+        """
+        Args:
+            backup_dir: Backup root holding the index, the object store and one directory per module
+            keep_generations: Number of file manifests kept per module (latest included)
+            snapshot_mode: copy | hardlink | reflink | auto | archive (see backup_store.py)
+        """
+        if snapshot_mode not in SNAPSHOT_MODES:
+            raise StateManagerError(f"Invalid snapshot_mode '{snapshot_mode}', expected one of {', '.join(SNAPSHOT_MODES)}")
         self.backup_root = Path(backup_dir)
         self.backup_root.mkdir(parents=True, exist_ok=True)
-        self.index_file = self.backup_root / "module_backups.json"
+        self.index = BackupIndex(self.backup_root)
+        self.keep_generations = max(1, keep_generations)
+        self.snapshot_mode = snapshot_mode
+        self.store = BlobStore(self.backup_root, reflink=snapshot_mode in ("reflink", "auto"))
+        if snapshot_mode == "auto" and self.store.reflink and not self.store.supports_reflink():
+            self.store.reflink = False
         
     def _get_module_backup_dir(self, module_name: str) -> Path:
         """Get the backup directory for a specific module."""
         return self.backup_root / f"{module_name}_backup"
     
-    def _get_file_permissions(self, file_path: str) -> Optional[FilePermissionInfo]:
-        """Get file permissions and ownership information."""
-        try:
-            if not os.path.exists(file_path):
-                return None
-            
-            stat_info = os.stat(file_path)
-            
-            # Get owner and group names
-            try:
-                owner = pwd.getpwuid(stat_info.st_uid).pw_name
-            except KeyError:
-                owner = str(stat_info.st_uid)
-            
-            try:
-                group = grp.getgrgid(stat_info.st_gid).gr_name
-            except KeyError:
-                group = str(stat_info.st_gid)
-            
-            return FilePermissionInfo(
-                path=file_path,
-                mode=stat_info.st_mode,
-                uid=stat_info.st_uid,
-                gid=stat_info.st_gid,
-                owner=owner,
-                group=group
-            )
-        except Exception as e:
-            log_message(f"Failed to get permissions for {file_path}: {e}", "WARNING")
-            return None
-    
-    def _capture_permissions(self, files: List[str]) -> List[Dict[str, Any]]:
-        """Capture permissions for all files and directories."""
-        permissions = []
+    def _rotate_module_backup_dir(self, module_backup_dir: Path) -> None:
+        """
+        Clobber a module's previous backup, keeping its file manifest as a generation.
         
-        for file_path in files:
-            if not os.path.exists(file_path):
-                continue
-            
-            # Get permissions for the main path
-            perm_info = self._get_file_permissions(file_path)
-            if perm_info:
-                permissions.append(perm_info.to_dict())
-            
-            # If it's a directory, capture permissions for all contents recursively
-            if os.path.isdir(file_path):
-                for root, dirs, files_in_dir in os.walk(file_path):
-                    # Capture directory permissions
-                    if root != file_path:  # Don't duplicate the main directory
-                        perm_info = self._get_file_permissions(root)
-                        if perm_info:
-                            permissions.append(perm_info.to_dict())
-                    
-                    # Capture file permissions
-                    for file_name in files_in_dir:
-                        full_path = os.path.join(root, file_name)
-                        perm_info = self._get_file_permissions(full_path)
-                        if perm_info:
-                            permissions.append(perm_info.to_dict())
-        
-        log_message(f"Captured permissions for {len(permissions)} files/directories")
-        return permissions
-    
-    def _restore_permissions(self, permissions: List[Dict[str, Any]]) -> bool:
-        """Restore file permissions and ownership."""
-        if not permissions:
-            return True
+        The current manifest moves to generations/<created>.json and its permission
+        snapshot to generations/<created>.permissions.bin; only the newest
+        keep_generations - 1 generations are kept. Everything else is deleted.
+        """
+        generations_dir = module_backup_dir / "generations"
+        manifest_file = module_backup_dir / "manifest.json"
+        previous = load_manifest(manifest_file)
+        if previous is not None and self.keep_generations > 1:
+            generations_dir.mkdir(parents=True, exist_ok=True)
+            permissions_file = module_backup_dir / "permissions.bin"
+            if permissions_file.exists():
+                os.replace(permissions_file, generations_dir / f"{previous['created']}.permissions.bin")
+            os.replace(manifest_file, generations_dir / f"{previous['created']}.json")
         
-        success_count = 0
+        if generations_dir.exists():
+            generations = sorted(generations_dir.glob("*.json"), key=lambda p: int(p.stem), reverse=True)
+            for old_generation in generations[self.keep_generations - 1:]:
+                old_generation.with_suffix(".permissions.bin").unlink(missing_ok=True)
+                old_generation.unlink()
         
-        for perm_data in permissions:
-            try:
-                perm_info = FilePermissionInfo.from_dict(perm_data)
-                
-                if not os.path.exists(perm_info.path):
-                    log_message(f"Cannot restore permissions for non-existent path: {perm_info.path}", "WARNING")
-                    continue
-                
-                # Restore ownership
-                try:
-                    os.chown(perm_info.path, perm_info.uid, perm_info.gid)
-                except OSError as e:
-                    log_message(f"Failed to restore ownership for {perm_info.path}: {e}", "WARNING")
-                
-                # Restore permissions
+        for entry in module_backup_dir.iterdir():
+            if entry == generations_dir:
+                continue
+            if entry.is_dir() and not entry.is_symlink():
+                shutil.rmtree(entry)
+            else:
+                entry.unlink()
+    
+    def _collect_garbage(self) -> None:
+        """Delete blobs no longer referenced by any module's manifest, generation or SQLite chunk list."""
+        with self.store.lock(exclusive=True, blocking=False) as locked:
+            if not locked:
+                # Another backup is writing blobs; the next backup collects them
+                return
+            manifests = []
+            for module_backup_dir in self.backup_root.glob("*_backup"):
+                manifest_files = [*module_backup_dir.glob("manifest.json"), *module_backup_dir.glob("generations/*.json")]
+                for manifest_file in manifest_files:
+                    manifest = load_manifest(manifest_file)
+                    if manifest is None:
+                        # Keep everything rather than lose the blobs of an unreadable manifest
+                        log_message(f"Skipping garbage collection, cannot read {manifest_file}", "WARNING")
+                        return
+                    manifests.append(manifest)
+            referenced = manifest_digests(manifests)
+            for chunks_file in self.backup_root.glob("*_backup/databases/*.chunks.json"):
                 try:
-                    os.chmod(perm_info.path, stat.S_IMODE(perm_info.mode))
-                except OSError as e:
-                    log_message(f"Failed to restore permissions for {perm_info.path}: {e}", "WARNING")
-                
-                success_count += 1
-                
-            except Exception as e:
-                log_message(f"Failed to restore permissions for entry: {e}", "WARNING")
+                    referenced.update(load_chunks(chunks_file)["chunks"])
+                except Exception as e:
+                    # Keep everything rather than lose chunks of an unreadable list
+                    log_message(f"Skipping garbage collection, cannot read {chunks_file}: {e}", "WARNING")
+                    return
+            removed, freed = self.store.collect_garbage(referenced)
+            if removed:
+                log_message(f"Removed {removed} unreferenced backup objects ({freed} bytes)")
+    
+    def list_backup_generations(self, module_name: str) -> List[int]:
+        """
+        Creation timestamps (nanoseconds) of a module's older file backups, newest first.
         
-        log_message(f"Restored permissions for {success_count}/{len(permissions)} files/directories")
-        return success_count > 0
+        Args:
+            module_name: Name of the module
+            
+        Returns:
+            List[int]: Generations that restore_module_state(module_name, generation=...) accepts
+        """
+        generations_dir = self._get_module_backup_dir(module_name) / "generations"
+        if not generations_dir.exists():
+            return []
+        return sorted((int(p.stem) for p in generations_dir.glob("*.json")), reverse=True)
+    
+    def _capture_permissions(self, module_backup_dir: Path, files: List[str]) -> bool:
+        """Capture mode/uid/gid of all files and directories into the module's permissions.bin."""
+        try:
+            snapshot = capture_permissions(files)
+            snapshot.write(module_backup_dir / "permissions.bin")
+            log_message(f"Captured permissions for {len(snapshot)} files/directories")
+            return True
+        except Exception as e:
+            log_message(f"Failed to capture permissions: {e}", "WARNING")
+            return False
+    
+    def _restore_permissions(self, module_backup_dir: Path, backup_info: ModuleBackupInfo,
+                             generation: Optional[int] = None) -> bool:
+        """Restore ownership and mode of every backed-up path whose current value differs."""
+        permissions_file = module_backup_dir / "permissions.bin"
+        if generation is not None:
+            generation_file = module_backup_dir / "generations" / f"{generation}.permissions.bin"
+            if generation_file.exists():
+                permissions_file = generation_file
+            else:
+                # Generations rotated before permission snapshots were kept per generation
+                log_message(f"Backup generation {generation} has no permission snapshot, using the latest", "WARNING")
+        try:
+            if permissions_file.exists():
+                snapshot = PermissionSnapshot.load(permissions_file)
+            elif backup_info.file_permissions:
+                # Backups made before permissions.bin stored one dict per path in the index
+                snapshot = PermissionSnapshot.from_legacy(backup_info.file_permissions)
+            else:
+                log_message("No file permissions to restore (legacy backup or no permissions captured)")
+                return True
+        except Exception as e:
+            log_message(f"Failed to load permission snapshot: {e}", "WARNING")
+            return False
+        
+        log_message("Restoring file permissions...")
+        changed, unchanged, failed = apply_permissions(snapshot)
+        log_message(f"Restored permissions for {changed + unchanged}/{len(snapshot)} files/directories "
+                    f"({changed} changed, {unchanged} already correct)")
+        return changed + unchanged > 0 or len(snapshot) == 0
     
     def _calculate_checksum(self, file_path: str) -> str:
-        """Calculate SHA-256 checksum of a file or directory."""
+        """Calculate SHA-256 checksum of a file, or the Merkle digest of a directory."""
         if not os.path.exists(file_path):
             return ""
         
-        sha256_hash = hashlib.sha256()
-        
         if os.path.isdir(file_path):
-            # For directories, hash all files recursively
-            for root, dirs, files in os.walk(file_path):
-                # Sort for consistent ordering
-                dirs.sort()
-                files.sort()
-                
-                for file in files:
-                    file_path_full = os.path.join(root, file)
-                    rel_path = os.path.relpath(file_path_full, file_path)
-                    sha256_hash.update(rel_path.encode())
-                    
-                    try:
-                        with open(file_path_full, 'rb') as f:
-                            for chunk in iter(lambda: f.read(4096), b""):
-                                sha256_hash.update(chunk)
-                    except (IOError, OSError):
-                        # Skip files we can't read
-                        continue
-        else:
-            # For files, hash the content
-            try:
-                with open(file_path, "rb") as f:
-                    for chunk in iter(lambda: f.read(4096), b""):
-                        sha256_hash.update(chunk)
-            except (IOError, OSError):
-                return ""
-        
-        return sha256_hash.hexdigest()
+            return tree_digest(file_path).root
+        return file_sha256(file_path)
     
-    def _load_module_index(self) -> Dict[str, ModuleBackupInfo]:
-        """Load the module backup index."""
-        if not self.index_file.exists():
-            return {}
-        
-        try:
-            with open(self.index_file, 'r') as f:
-                data = json.load(f)
-                return {
-                    module_name: ModuleBackupInfo.from_dict(backup_data)
-                    for module_name, backup_data in data.items()
-                }
-        except Exception as e:
-            log_message(f"Failed to load module backup index: {e}", "WARNING")
-            return {}
-    
-    def _save_module_index(self, module_backups: Dict[str, ModuleBackupInfo]) -> None:
-        """Save the module backup index."""
+    def _load_backup_info(self, module_name: str) -> Optional[ModuleBackupInfo]:
+        """Load one module's backup record from its index shard."""
+        record = self.index.load(module_name)
+        if record is None:
+            return None
         try:
-            data = {
-                module_name: backup.to_dict() 
-                for module_name, backup in module_backups.items()
-            }
-            with open(self.index_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            return ModuleBackupInfo.from_dict(record)
         except Exception as e:
-            log_message(f"Failed to save module backup index: {e}", "ERROR")
+            log_message(f"Failed to load backup record for {module_name}: {e}", "WARNING")
+            return None
     
-    def _backup_files(self, module_backup_dir: Path, files: List[str]) -> bool:
-        """Backup specified files to the module backup directory."""
-        files_dir = module_backup_dir / "files"
-        files_dir.mkdir(parents=True, exist_ok=True)
+    def _backup_files(self, module_backup_dir: Path, files: List[str],
+                      previous_manifest: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Backup specified files into the object store and write the module's manifest.
         
+        Files unchanged since previous_manifest (same size, mtime, ctime and inode)
+        are not read again; changed files are stored only if their content is new.
+        """
+        builder = ManifestBuilder(self.store, previous_manifest, reuse_unchanged=self.snapshot_mode != "copy")
         success_count = 0
         
-        for file_path in files:
-            source = Path(file_path)
-            if not source.exists():
-                log_message(f"Source file not found, skipping: {file_path}", "WARNING")
-                continue
-            
-            try:
-                # Create relative path structure in backup
-                if source.is_absolute():
-                    # Convert absolute path to relative backup path
-                    rel_path = str(source).lstrip('/')
-                else:
-                    rel_path = str(source)
-                
-                backup_target = files_dir / rel_path
-                backup_target.parent.mkdir(parents=True, exist_ok=True)
-                
-                if source.is_dir():
-                    if backup_target.exists():
-                        shutil.rmtree(backup_target)
-                    shutil.copytree(source, backup_target)
-                else:
-                    shutil.copy2(source, backup_target)
-                
-                success_count += 1
-                log_message(f"Backed up: {file_path}")
+        with self.store.lock():
+            for file_path in files:
+                if not os.path.lexists(file_path):
+                    log_message(f"Source file not found, skipping: {file_path}", "WARNING")
+                    continue
                 
-            except Exception as e:
-                log_message(f"Failed to backup {file_path}: {e}", "WARNING")
+                try:
+                    builder.add(file_path)
+                    success_count += 1
+                    log_message(f"Backed up: {file_path}")
+                    
+                except Exception as e:
+                    log_message(f"Failed to backup {file_path}: {e}", "WARNING")
+            
+            # Nanoseconds, and always after the previous manifest, so two backups within the
+            # same second never share a generations/<created>.json name
+            created = time.time_ns()
+            if previous_manifest is not None:
+                created = max(created, int(previous_manifest["created"]) + 1)
+            write_manifest(module_backup_dir / "manifest.json", builder.manifest(created))
         
+        stats = builder.stats
+        log_message(f"Backed up {stats['files']} files: {stats['reused']} unchanged, {stats['stored']} new objects "
+                    f"({stats['cloned']} cloned, {stats['bytes_written']} bytes written)")
         return success_count > 0
     
+    def _backup_files_to_archive(self, module_backup_dir: Path, files: List[str]) -> bool:
+        """Stream the specified files into the module's compressed archive (snapshot_mode="archive")."""
+        present = []
+        for file_path in files:
+            if os.path.lexists(file_path):
+                present.append(file_path)
+            else:
+                log_message(f"Source file not found, skipping: {file_path}", "WARNING")
+        if not present:
+            return False
+        
+        archive, digest, size, archived = write_archive(module_backup_dir, present)
+        for file_path in archived:
+            log_message(f"Backed up: {file_path}")
+        log_message(f"Archived {len(archived)} paths into {archive.name} ({size} bytes, sha256 {digest[:12]})")
+        return len(archived) > 0
+    
     def _backup_services(self, module_backup_dir: Path, services: List[str]) -> bool:
         """Backup service states to the module backup directory."""
         if not services:
@@ -330,24 +332,13 @@ class StateManager:
         try:
             service_states = {}
             
+            # Active and enabled state of every service in one systemctl call
+            prefetch_service_states(services)
             for service in services:
-                # Get service status
-                result = subprocess.run(
-                    ["systemctl", "is-active", service],
-                    capture_output=True, text=True
-                )
-                is_active = result.stdout.strip() == "active"
-                
-                # Get service enabled status
-                result = subprocess.run(
-                    ["systemctl", "is-enabled", service],
-                    capture_output=True, text=True
-                )
-                is_enabled = result.stdout.strip() == "enabled"
-                
+                state = get_service_state(service)
                 service_states[service] = {
-                    "active": is_active,
-                    "enabled": is_enabled
+                    "active": state.active_state == "active",
+                    "enabled": state.enabled
                 }
             
             # Save service states
@@ -361,8 +352,36 @@ class StateManager:
             log_message(f"Failed to backup services: {e}", "ERROR")
             return False
     
-    def _backup_databases(self, module_backup_dir: Path, databases: List[Dict[str, str]]) -> bool:
-        """Backup databases to the module backup directory."""
+    def _pg_connection_args(self, db_config: Dict[str, str]) -> List[str]:
+        return [
+            "-h", db_config.get("host", "localhost"),
+            "-p", str(db_config.get("port", "5432")),
+            "-U", db_config.get("user", "postgres"),
+        ]
+    
+    def _pg_env(self, db_config: Dict[str, str]) -> Dict[str, str]:
+        """Environment for PostgreSQL client tools, with the configured password if any."""
+        env = os.environ.copy()
+        if "password" in db_config:
+            env["PGPASSWORD"] = db_config["password"]
+        return env
+    
+    def _db_jobs(self, db_config: Dict[str, str]) -> int:
+        return max(1, int(db_config.get("jobs", DEFAULT_DB_JOBS)))
+    
+    def _backup_databases(self, module_backup_dir: Path, databases: List[Dict[str, str]],
+                          stats: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """
+        Backup databases to the module backup directory.
+        
+        PostgreSQL databases are dumped in directory format (pg_dump -Fd), compressed
+        and with one job per CPU unless the config sets "jobs".
+        
+        Args:
+            module_backup_dir: Module backup directory
+            databases: Database configurations
+            stats: If given, receives one {"index", "type", "format", "jobs", "seconds", "bytes"} per backed-up database
+        """
         if not databases:
             return True
         
@@ -373,39 +392,53 @@ class StateManager:
         
         for i, db_config in enumerate(databases):
             db_type = db_config.get("type", "postgresql")
+            started = time.monotonic()
+            jobs = 1
             
             try:
                 if db_type == "postgresql":
-                    backup_file = db_dir / f"db_{i}.sql"
+                    backup_file = db_dir / f"db_{i}.dir"
+                    jobs = self._db_jobs(db_config)
                     cmd = [
                         "pg_dump",
-                        "-h", db_config.get("host", "localhost"),
-                        "-p", db_config.get("port", "5432"),
-                        "-U", db_config.get("user", "postgres"),
+                        *self._pg_connection_args(db_config),
                         "-d", db_config["database"],
+                        "-Fd",
+                        "-j", str(jobs),
+                        "-Z", PG_DUMP_COMPRESSION,
                         "-f", str(backup_file)
                     ]
                     
-                    # Set password via environment if provided
-                    env = os.environ.copy()
-                    if "password" in db_config:
-                        env["PGPASSWORD"] = db_config["password"]
-                    
-                    result = subprocess.run(cmd, env=env, capture_output=True, text=True)
+                    result = subprocess.run(cmd, env=self._pg_env(db_config), capture_output=True, text=True)
                     if result.returncode != 0:
                         raise Exception(f"Database dump failed: {result.stderr}")
+                    size = sum(f.stat().st_size for f in backup_file.iterdir())
+                    db_format = "directory"
                 
                 elif db_type == "sqlite":
-                    backup_file = db_dir / f"db_{i}.sqlite"
-                    db_file = Path(db_config["database"])
-                    shutil.copy2(db_file, backup_file)
+                    # Online backup API: consistent with WAL and does not block writers
+                    if db_config.get("incremental"):
+                        backup_file = db_dir / f"db_{i}.chunks.json"
+                        with self.store.lock():
+                            size, stored = store_database(self.store, db_config["database"], backup_file)
+                        log_message(f"Stored {stored} new bytes of {size} for database {i}")
+                        db_format = "sqlite-chunks"
+                    else:
+                        backup_file = db_dir / f"db_{i}.sqlite"
+                        online_backup(db_config["database"], str(backup_file))
+                        size = backup_file.stat().st_size
+                        db_format = "sqlite"
                 
                 else:
                     log_message(f"Unsupported database type: {db_type}", "WARNING")
                     continue
                 
+                seconds = round(time.monotonic() - started, 2)
+                if stats is not None:
+                    stats.append({"index": i, "type": db_type, "format": db_format,
+                                  "jobs": jobs, "seconds": seconds, "bytes": size})
                 success_count += 1
-                log_message(f"Backed up database {i} ({db_type})")
+                log_message(f"Backed up database {i} ({db_type}, {jobs} job(s), {size} bytes) in {seconds}s")
                 
             except Exception as e:
                 log_message(f"Failed to backup database {i}: {e}", "WARNING")
@@ -441,25 +474,32 @@ class StateManager:
         module_backup_dir = self._get_module_backup_dir(module_name)
         
         try:
-            # Remove existing backup directory (clobber previous backup)
+            # Clobber the previous backup; its manifest stays usable for unchanged files
+            previous_manifest = load_manifest(module_backup_dir / "manifest.json")
             if module_backup_dir.exists():
-                shutil.rmtree(module_backup_dir)
+                self._rotate_module_backup_dir(module_backup_dir)
                 log_message(f"Clobbered previous backup for module {module_name}")
             
             # Create fresh backup directory
             module_backup_dir.mkdir(parents=True, exist_ok=True)
             
             # Backup each component
-            files_success = self._backup_files(module_backup_dir, files) if files else True
+            if not files:
+                files_success = True
+            elif self.snapshot_mode == "archive":
+                files_success = self._backup_files_to_archive(module_backup_dir, files)
+            else:
+                files_success = self._backup_files(module_backup_dir, files, previous_manifest)
             services_success = self._backup_services(module_backup_dir, services) if services else True
-            databases_success = self._backup_databases(module_backup_dir, databases) if databases else True
+            database_stats = []
+            databases_success = self._backup_databases(module_backup_dir, databases, database_stats) if databases else True
             
             if not (files_success and services_success and databases_success):
                 log_message(f"Some backup operations failed for module {module_name}", "WARNING")
             
             # Capture file permissions
             log_message("Capturing file permissions...")
-            file_permissions = self._capture_permissions(files)
+            self._capture_permissions(module_backup_dir, files)
             
             # Calculate checksum of entire backup directory
             checksum = self._calculate_checksum(str(module_backup_dir))
@@ -474,17 +514,17 @@ class StateManager:
                 services=services,
                 databases=databases,
                 checksum=checksum,
-                file_permissions=file_permissions
+                file_permissions=[],
+                database_stats=database_stats
             )
             
             # Update index
-            module_backups = self._load_module_index()
-            module_backups[module_name] = backup_info
-            self._save_module_index(module_backups)
+            self.index.save(module_name, backup_info.to_dict())
             
             log_message(f"Successfully created backup for module {module_name}")
             log_message(f"  Files: {len(files)}, Services: {len(services)}, Databases: {len(databases)}")
             
+            self._collect_garbage()
             return True
             
         except Exception as e:
@@ -499,8 +539,34 @@ class StateManager:
             
             return False
     
-    def _restore_files(self, module_backup_dir: Path, files: List[str]) -> bool:
-        """Restore files from the module backup directory."""
+    def _restore_files(self, module_backup_dir: Path, files: List[str], generation: Optional[int] = None) -> bool:
+        """Restore files from the module's manifest (or an older generation's) or its archive."""
+        if generation is not None:
+            manifest_file = module_backup_dir / "generations" / f"{generation}.json"
+        else:
+            manifest_file = module_backup_dir / "manifest.json"
+        manifest = load_manifest(manifest_file)
+        if manifest is not None:
+            return self._restore_files_from_manifest(manifest, files)
+        if generation is not None:
+            log_message(f"Backup generation {generation} not found", "ERROR")
+            return False
+        
+        archive = find_archive(module_backup_dir)
+        if archive is not None:
+            try:
+                restored = extract_archive(archive, files)
+            except Exception as e:
+                log_message(f"Failed to restore files from {archive}: {e}", "ERROR")
+                return False
+            for file_path in files:
+                if file_path in restored:
+                    log_message(f"Restored: {file_path}")
+                else:
+                    log_message(f"Backup file not found, skipping: {file_path}", "WARNING")
+            return len(restored) > 0 or len(files) == 0
+        
+        # Backups made before the object store keep plain copies under files/
         files_dir = module_backup_dir / "files"
         
         if not files_dir.exists():
@@ -546,6 +612,42 @@ class StateManager:
         
         return success_count > 0 or len(files) == 0
     
+    def _restore_files_from_manifest(self, manifest: Dict[str, Any], files: List[str]) -> bool:
+        """
+        Bring each backed-up path back from the object store.
+        
+        Only entries that differ from the manifest are rewritten, created or deleted;
+        a path is recreated in full if that fails or the result does not verify.
+        """
+        success_count = 0
+        
+        for file_path in files:
+            record = manifest["paths"].get(file_path)
+            if record is None:
+                log_message(f"Backup file not found, skipping: {file_path}", "WARNING")
+                continue
+            
+            try:
+                counts = delta_restore_path(self.store, file_path, record)
+                if verify_path(file_path, record):
+                    success_count += 1
+                    log_message(f"Restored: {file_path} ({counts['written']} written, {counts['deleted']} deleted, "
+                                f"{counts['metadata']} metadata only, {counts['unchanged']} unchanged)")
+                    continue
+                log_message(f"Delta restore of {file_path} did not verify, restoring in full", "WARNING")
+            except Exception as e:
+                log_message(f"Delta restore of {file_path} failed ({e}), restoring in full", "WARNING")
+            
+            try:
+                restore_path(self.store, file_path, record)
+                success_count += 1
+                log_message(f"Restored: {file_path}")
+                
+            except Exception as e:
+                log_message(f"Failed to restore {file_path}: {e}", "WARNING")
+        
+        return success_count > 0 or len(files) == 0
+    
     def _restore_services(self, module_backup_dir: Path, services: List[str]) -> bool:
         """Restore service states from the module backup directory."""
         if not services:
@@ -561,60 +663,55 @@ class StateManager:
             with open(services_file, 'r') as f:
                 service_states = json.load(f)
             
-            success_count = 0
-            
-            # Stop all services first
-            for service in services:
-                try:
-                    subprocess.run(["systemctl", "stop", service], check=True, capture_output=True)
+            # Stop all services first; systemd stops them concurrently
+            for service, stopped in run_systemctl_each("stop", services).items():
+                if stopped:
                     log_message(f"Stopped service: {service}")
-                except subprocess.CalledProcessError:
-                    pass  # Continue even if stop fails
             
-            # Restore states
-            for service in services:
-                if service not in service_states:
-                    log_message(f"No backup state found for service {service}, attempting to start anyway", "WARNING")
-                    # If no backup state, try to start the service anyway (for rollback scenarios)
-                    try:
-                        subprocess.run(["systemctl", "start", service], check=True, capture_output=True)
-                        success_count += 1
-                        log_message(f"Started service (no backup state): {service}")
-                    except subprocess.CalledProcessError as e:
-                        log_message(f"Failed to start service {service} (no backup state): {e}", "WARNING")
-                    continue
-                
-                state = service_states[service]
-                
-                try:
-                    # Restore enabled/disabled state
-                    if state.get("enabled", False):
-                        subprocess.run(["systemctl", "enable", service], check=True, capture_output=True)
-                        log_message(f"Enabled service: {service}")
-                    else:
-                        subprocess.run(["systemctl", "disable", service], check=True, capture_output=True)
-                        log_message(f"Disabled service: {service}")
-                    
-                    # Restore active/inactive state - ALWAYS try to start if it was active
-                    if state.get("active", False):
-                        subprocess.run(["systemctl", "start", service], check=True, capture_output=True)
-                        log_message(f"Started service: {service}")
+            missing = [service for service in services if service not in service_states]
+            for service in missing:
+                log_message(f"No backup state found for service {service}, attempting to start anyway", "WARNING")
+            
+            # Restore enabled/disabled state, one grouped call per target state
+            restored = {service: True for service in services if service in service_states}
+            to_enable = [service for service in restored if service_states[service].get("enabled", False)]
+            to_disable = [service for service in restored if not service_states[service].get("enabled", False)]
+            for action, group in (("enable", to_enable), ("disable", to_disable)):
+                for service, ok in run_systemctl_each(action, group).items():
+                    log_message(f"{action.capitalize()}d service: {service}" if ok else f"Failed to {action} service: {service}",
+                                "INFO" if ok else "WARNING")
+                    restored[service] = restored[service] and ok
+            
+            # Restore active/inactive state - ALWAYS try to start if it was active, or if there is no backup state
+            to_start = [service for service in restored if service_states[service].get("active", False)]
+            to_stop = [service for service in restored if not service_states[service].get("active", False)]
+            started = run_systemctl_each("start", to_start + missing)
+            stopped = run_systemctl_each("stop", to_stop)
+            for service, ok in {**started, **stopped}.items():
+                if service in missing:
+                    log_message(f"Started service (no backup state): {service}" if ok
+                                else f"Failed to start service {service} (no backup state)", "INFO" if ok else "WARNING")
+                else:
+                    log_message(f"{'Started' if service in started else 'Stopped'} service: {service}" if ok
+                                else f"Failed to {'start' if service in started else 'stop'} service: {service}",
+                                "INFO" if ok else "WARNING")
+                    restored[service] = restored[service] and ok
+            
+            # For rollback scenarios, try to start services whose restore failed
+            failed = [service for service, ok in restored.items() if not ok]
+            if failed:
+                log_message(f"Failed to restore services: {', '.join(failed)}", "WARNING")
+                for service, ok in run_systemctl_each("start", failed).items():
+                    if ok:
+                        log_message(f"Successfully started service after restore failure: {service}")
+                        restored[service] = True
                     else:
-                        subprocess.run(["systemctl", "stop", service], check=True, capture_output=True)
-                        log_message(f"Stopped service: {service}")
-                    
-                    success_count += 1
+                        log_message(f"Failed to start service after restore failure {service}", "ERROR")
+            
+            for service, ok in restored.items():
+                if ok:
                     log_message(f"Restored service: {service}")
-                    
-                except subprocess.CalledProcessError as e:
-                    log_message(f"Failed to restore service {service}: {e}", "WARNING")
-                    # For rollback scenarios, try to start the service even if restore failed
-                    try:
-                        subprocess.run(["systemctl", "start", service], check=True, capture_output=True)
-                        log_message(f"Successfully started service after restore failure: {service}")
-                        success_count += 1
-                    except subprocess.CalledProcessError as start_error:
-                        log_message(f"Failed to start service after restore failure {service}: {start_error}", "ERROR")
+            success_count = sum(restored.values()) + sum(started.get(service, False) for service in missing)
             
             log_message(f"Restored {success_count}/{len(services)} services")
             return success_count > 0
@@ -639,67 +736,80 @@ class StateManager:
         for i, db_config in enumerate(databases):
             db_type = db_config.get("type", "postgresql")
             
+            started = time.monotonic()
+            
             try:
                 if db_type == "postgresql":
+                    # Directory-format dumps; plain SQL from backups made before pg_dump -Fd
+                    dump_dir = db_dir / f"db_{i}.dir"
                     backup_file = db_dir / f"db_{i}.sql"
                     
-                    if not backup_file.exists():
-                        log_message(f"Database backup file not found: {backup_file}", "WARNING")
+                    if not dump_dir.exists() and not backup_file.exists():
+                        log_message(f"Database backup file not found: {dump_dir}", "WARNING")
                         continue
                     
                     # Drop and recreate database
                     cmd_drop = [
                         "dropdb",
-                        "-h", db_config.get("host", "localhost"),
-                        "-p", db_config.get("port", "5432"),
-                        "-U", db_config.get("user", "postgres"),
+                        *self._pg_connection_args(db_config),
                         "--if-exists",
                         db_config["database"]
                     ]
                     
                     cmd_create = [
                         "createdb",
-                        "-h", db_config.get("host", "localhost"),
-                        "-p", db_config.get("port", "5432"),
-                        "-U", db_config.get("user", "postgres"),
+                        *self._pg_connection_args(db_config),
                         db_config["database"]
                     ]
                     
-                    cmd_restore = [
-                        "psql",
-                        "-h", db_config.get("host", "localhost"),
-                        "-p", db_config.get("port", "5432"),
-                        "-U", db_config.get("user", "postgres"),
-                        "-d", db_config["database"],
-                        "-f", str(backup_file)
-                    ]
+                    if dump_dir.exists():
+                        cmd_restore = [
+                            "pg_restore",
+                            *self._pg_connection_args(db_config),
+                            "-d", db_config["database"],
+                            "-j", str(self._db_jobs(db_config)),
+                            str(dump_dir)
+                        ]
+                    else:
+                        cmd_restore = [
+                            "psql",
+                            *self._pg_connection_args(db_config),
+                            "-d", db_config["database"],
+                            "-f", str(backup_file)
+                        ]
                     
-                    env = os.environ.copy()
-                    # Note: password would need to be provided separately for security
+                    # The stored config carries the password the backup was made with
+                    env = self._pg_env(db_config)
                     
                     # Execute restoration
                     subprocess.run(cmd_drop, env=env, check=False)  # Don't fail if DB doesn't exist
                     subprocess.run(cmd_create, env=env, check=True)
-                    subprocess.run(cmd_restore, env=env, check=True)
+                    result = subprocess.run(cmd_restore, env=env, capture_output=True, text=True)
+                    if result.returncode != 0:
+                        # pg_restore keeps going past individual errors (e.g. missing roles) and reports them at the end
+                        if "errors ignored on restore" not in result.stderr:
+                            raise Exception(f"Database restore failed: {result.stderr}")
+                        log_message(f"Database {i} restored with errors: {result.stderr.strip()}", "WARNING")
                 
                 elif db_type == "sqlite":
                     backup_file = db_dir / f"db_{i}.sqlite"
+                    chunks_file = db_dir / f"db_{i}.chunks.json"
                     
-                    if not backup_file.exists():
+                    if chunks_file.exists():
+                        restore_database(self.store, chunks_file, db_config["database"])
+                    elif backup_file.exists():
+                        Path(db_config["database"]).parent.mkdir(parents=True, exist_ok=True)
+                        replace_database(str(backup_file), db_config["database"])
+                    else:
                         log_message(f"Database backup file not found: {backup_file}", "WARNING")
                         continue
-                    
-                    # For SQLite, replace the database file
-                    target_path = Path(db_config["database"])
-                    target_path.parent.mkdir(parents=True, exist_ok=True)
-                    shutil.copy2(backup_file, target_path)
                 
                 else:
                     log_message(f"Unsupported database type: {db_type}", "WARNING")
                     continue
                 
                 success_count += 1
-                log_message(f"Restored database {i} ({db_type})")
+                log_message(f"Restored database {i} ({db_type}) in {round(time.monotonic() - started, 2)}s")
                 
             except Exception as e:
                 log_message(f"Failed to restore database {i}: {e}", "WARNING")
@@ -707,23 +817,25 @@ class StateManager:
         log_message(f"Restored {success_count}/{len(databases)} databases")
         return success_count > 0
     
-    def restore_module_state(self, module_name: str) -> bool:
+    def restore_module_state(self, module_name: str, generation: Optional[int] = None) -> bool:
         """
         Restore a module's complete state from its backup.
         
         Args:
             module_name: Name of the module to restore
+            generation: Restore files and their permissions from an older backup (see
+                        list_backup_generations()); services and databases always come
+                        from the latest backup
             
         Returns:
             bool: True if restore successful, False otherwise
         """
-        module_backups = self._load_module_index()
+        backup_info = self._load_backup_info(module_name)
         
-        if module_name not in module_backups:
+        if backup_info is None:
             log_message(f"No backup found for module: {module_name}", "ERROR")
             return False
         
-        backup_info = module_backups[module_name]
         module_backup_dir = Path(backup_info.backup_dir)
         
         if not module_backup_dir.exists():
@@ -737,23 +849,14 @@ class StateManager:
             services_success = True
             if backup_info.services:
                 # Stop services first
-                for service in backup_info.services:
-                    try:
-                        subprocess.run(["systemctl", "stop", service], check=True, capture_output=True)
-                    except subprocess.CalledProcessError:
-                        pass
+                run_systemctl_each("stop", backup_info.services)
             
             # Restore files and databases
-            files_success = self._restore_files(module_backup_dir, backup_info.files)
+            files_success = self._restore_files(module_backup_dir, backup_info.files, generation)
             databases_success = self._restore_databases(module_backup_dir, backup_info.databases)
             
             # Restore file permissions after files are restored
-            permissions_success = True
-            if hasattr(backup_info, 'file_permissions') and backup_info.file_permissions:
-                log_message("Restoring file permissions...")
-                permissions_success = self._restore_permissions(backup_info.file_permissions)
-            else:
-                log_message("No file permissions to restore (legacy backup or no permissions captured)")
+            permissions_success = self._restore_permissions(module_backup_dir, backup_info, generation)
             
             # Restore services last
             if backup_info.services:
@@ -785,13 +888,12 @@ class StateManager:
         Returns:
             bool: True if restore successful, False otherwise
         """
-        module_backups = self._load_module_index()
+        backup_info = self._load_backup_info(module_name)
         
-        if module_name not in module_backups:
+        if backup_info is None:
             log_message(f"No backup found for module: {module_name}", "ERROR")
             return False
         
-        backup_info = module_backups[module_name]
         module_backup_dir = Path(backup_info.backup_dir)
         
         if not module_backup_dir.exists():
@@ -805,34 +907,25 @@ class StateManager:
             services_success = True
             if backup_info.services:
                 # Stop services first
-                for service in backup_info.services:
-                    try:
-                        subprocess.run(["systemctl", "stop", service], check=True, capture_output=True)
+                for service, stopped in run_systemctl_each("stop", backup_info.services).items():
+                    if stopped:
                         log_message(f"Stopped service for rollback: {service}")
-                    except subprocess.CalledProcessError:
-                        pass
             
             # Restore files and databases
             files_success = self._restore_files(module_backup_dir, backup_info.files)
             databases_success = self._restore_databases(module_backup_dir, backup_info.databases)
             
             # Restore file permissions after files are restored
-            permissions_success = True
-            if hasattr(backup_info, 'file_permissions') and backup_info.file_permissions:
-                log_message("Restoring file permissions...")
-                permissions_success = self._restore_permissions(backup_info.file_permissions)
-            else:
-                log_message("No file permissions to restore (legacy backup or no permissions captured)")
+            permissions_success = self._restore_permissions(module_backup_dir, backup_info)
             
             # Force start all services for rollback
             if backup_info.services:
                 log_message("Forcing service startup for rollback...")
-                for service in backup_info.services:
-                    try:
-                        subprocess.run(["systemctl", "start", service], check=True, capture_output=True)
+                for service, started in run_systemctl_each("start", backup_info.services).items():
+                    if started:
                         log_message(f"Successfully started service for rollback: {service}")
-                    except subprocess.CalledProcessError as e:
-                        log_message(f"Failed to start service for rollback {service}: {e}", "WARNING")
+                    else:
+                        log_message(f"Failed to start service for rollback {service}", "WARNING")
                         services_success = False
             
             overall_success = files_success and services_success and databases_success and permissions_success
@@ -858,12 +951,11 @@ class StateManager:
         Returns:
             bool: True if backup exists, False otherwise
         """
-        module_backups = self._load_module_index()
+        backup_info = self._load_backup_info(module_name)
         
-        if module_name not in module_backups:
+        if backup_info is None:
             return False
         
-        backup_info = module_backups[module_name]
         module_backup_dir = Path(backup_info.backup_dir)
         
         return module_backup_dir.exists()
@@ -878,17 +970,29 @@ class StateManager:
         Returns:
             ModuleBackupInfo: Backup information or None if no backup exists
         """
-        module_backups = self._load_module_index()
-        return module_backups.get(module_name)
+        return self._load_backup_info(module_name)
     
-    def list_module_backups(self) -> Dict[str, ModuleBackupInfo]:
+    def list_module_backups(self) -> Mapping[str, Optional[ModuleBackupInfo]]:
         """
         List all module backups.
         
+        Records are read from their index shards on first access, so counting or
+        iterating module names does not open any record.
+        
+        Returns:
+            Mapping[str, Optional[ModuleBackupInfo]]: Read-only mapping of module names to
+            backup info; None for a module whose record is unreadable
+        """
+        return LazyRecords(self.index.names(), self._load_backup_info)
+    
+    def backup_summary(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Timestamp and description of every module backup, read from the index summary.
+        
         Returns:
-            Dict[str, ModuleBackupInfo]: Mapping of module names to backup info
+            Dict[str, Dict[str, Any]]: Mapping of module names to {"timestamp", "description"}
         """
-        return self._load_module_index()
+        return self.index.summary()
     
     def remove_module_backup(self, module_name: str) -> bool:
         """
@@ -900,13 +1004,12 @@ class StateManager:
         Returns:
             bool: True if removal successful, False otherwise
         """
-        module_backups = self._load_module_index()
+        backup_info = self._load_backup_info(module_name)
         
-        if module_name not in module_backups:
+        if backup_info is None:
             log_message(f"No backup found for module: {module_name}", "WARNING")
             return False
         
-        backup_info = module_backups[module_name]
         module_backup_dir = Path(backup_info.backup_dir)
         
         try:
@@ -915,8 +1018,8 @@ class StateManager:
                 shutil.rmtree(module_backup_dir)
             
             # Remove from index
-            del module_backups[module_name]
-            self._save_module_index(module_backups)
+            self.index.remove(module_name)
+            self._collect_garbage()
             
             log_message(f"Removed backup for module: {module_name}")
             return True
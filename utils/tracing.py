@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+HOMESERVER Update Management System
+Copyright (C) 2024 HOMESERVER LLC
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+"""
+Run Tracing
+
+Lightweight span tracer for update runs. Tracing is off unless enable_tracing()
+was called (index.py --trace PATH); span() is then a no-op context manager, so
+instrumented code costs nothing in normal runs.
+
+Spans are written as a Chrome trace-event JSON file (open in chrome://tracing or
+https://ui.perfetto.dev) and summarised as a table in the log.
+
+Usage:
+    from updates.utils.tracing import span
+
+    with span("sync", "orchestrator"):
+        sync_from_repo(...)
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+from typing import Any, Dict, List, Optional
+from .index import log_message
+
+
+class Tracer:
+    """Collects completed spans from any thread."""
+
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self._events: List[Dict[str, Any]] = []
+        self._thread_ids: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._origin) * 1_000_000
+
+    def _tid(self) -> int:
+        """Small stable id per thread, with a thread_name metadata event the first time it is seen."""
+        ident = threading.get_ident()
+        tid = self._thread_ids.get(ident)
+        if tid is None:
+            tid = self._thread_ids[ident] = len(self._thread_ids) + 1
+            self._events.append({
+                "name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                "args": {"name": threading.current_thread().name},
+            })
+        return tid
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "update", **args):
+        """Record the duration of the with-block as one complete ("X") event."""
+        start = self._now_us()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            end = self._now_us()
+            event = {
+                "name": name, "cat": category, "ph": "X",
+                "ts": round(start, 1), "dur": round(end - start, 1),
+                "pid": os.getpid(),
+            }
+            if error:
+                args = dict(args, error=error)
+            if args:
+                event["args"] = {k: str(v) for k, v in args.items()}
+            with self._lock:
+                event["tid"] = self._tid()
+                self._events.append(event)
+
+    def events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._events)
+
+    def write_chrome_trace(self, path: str) -> bool:
+        """
+        Write all spans as a Chrome trace-event JSON file.
+
+        Args:
+            path: Output file path
+
+        Returns:
+            bool: True if the file was written
+        """
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
+            os.replace(tmp_path, path)
+            log_message(f"Wrote trace to {path}")
+            return True
+        except Exception as e:
+            log_message(f"Failed to write trace {path}: {e}", "WARNING")
+            return False
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Spans aggregated by (category, name) in order of first start: count, total and max seconds."""
+        rows: Dict[tuple, Dict[str, Any]] = {}
+        for event in sorted((e for e in self.events() if e["ph"] == "X"), key=lambda e: e["ts"]):
+            key = (event["cat"], event["name"])
+            row = rows.setdefault(key, {"category": key[0], "name": key[1], "count": 0, "total": 0.0, "max": 0.0})
+            seconds = event["dur"] / 1_000_000
+            row["count"] += 1
+            row["total"] += seconds
+            row["max"] = max(row["max"], seconds)
+        return list(rows.values())
+
+    def log_summary(self) -> None:
+        """Log the summary() table."""
+        rows = self.summary()
+        if not rows:
+            return
+        width = max(len(f"{r['category']}:{r['name']}") for r in rows)
+        log_message("Run timing summary:")
+        log_message(f"  {'span'.ljust(width)}  {'count':>5}  {'total s':>9}  {'max s':>9}")
+        for r in rows:
+            label = f"{r['category']}:{r['name']}".ljust(width)
+            log_message(f"  {label}  {r['count']:>5}  {r['total']:>9.2f}  {r['max']:>9.2f}")
+
+
+_tracer: Optional[Tracer] = None
+
+
+def enable_tracing() -> Tracer:
+    """Start collecting spans for this process and return the tracer."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    """The active tracer, or None when tracing is off."""
+    return _tracer
+
+
+def span(name: str, category: str = "update", **args):
+    """Context manager timing a block when tracing is enabled; a no-op otherwise."""
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.span(name, category, **args)